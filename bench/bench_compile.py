@@ -0,0 +1,98 @@
+# bench/bench_compile.py
+"""
+Вычислений в секунду: скомпилированное выражение (server.compiled) против разбора заново
+при каждом вычислении – libcalc.so (разбор в C) и compile() без кэша (разбор и генерация в Python).
+Печатает JSON.
+
+    PYTHONPATH=. python bench/bench_compile.py [--quick]
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from server import libcalc
+from server.compiled import compile, CompileCache
+
+MIN_SECONDS = 0.5
+QUICK_MIN_SECONDS = 0.05
+
+# Шаблон с переменными и значения, которые меняются от вычисления к вычислению
+TEMPLATE = "(a + b) * 2 - c / d"
+FLAT = "9 / 3 - 2 + " * 100 + "0"
+
+
+def rate(function, min_seconds: float) -> float:
+    """Вызывает function() (которая делает 100 вычислений), пока не наберётся min_seconds; вычислений в секунду."""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return iterations * 100 / elapsed
+        iterations *= 2
+
+
+def template_cases():
+    rows = [{"a": i, "b": i + 1, "c": 3 * i, "d": i % 7 + 1} for i in range(100)]
+    texts = [f"({row['a']} + {row['b']}) * 2 - {row['c']} / {row['d']}" for row in rows]
+    compiled = compile(TEMPLATE)
+    cache = CompileCache()
+
+    def compiled_evaluate():
+        for row in rows:
+            compiled.evaluate(row)
+
+    def cached_compile():
+        for row in rows:
+            compile(TEMPLATE, cache=cache).evaluate(row)
+
+    def reparse_libcalc():
+        for text in texts:
+            libcalc.evaluate(text)
+
+    def reparse_python():
+        for row in rows:
+            compile(TEMPLATE, cache=None).evaluate(row)
+
+    return {
+        "template_compiled": compiled_evaluate,
+        "template_cached_compile": cached_compile,
+        "template_reparse_libcalc": reparse_libcalc,
+        "template_reparse_python": reparse_python,
+    }
+
+
+def flat_cases():
+    compiled = compile(FLAT)
+
+    def compiled_evaluate():
+        for _ in range(100):
+            compiled.evaluate()
+
+    def reparse_libcalc():
+        for _ in range(100):
+            libcalc.evaluate(FLAT)
+
+    return {"flat_100_compiled": compiled_evaluate, "flat_100_reparse_libcalc": reparse_libcalc}
+
+
+def run(quick: bool = False) -> list:
+    min_seconds = QUICK_MIN_SECONDS if quick else MIN_SECONDS
+    cases = dict(template_cases(), **flat_cases())
+    return [{"case": name, "evals_per_s": rate(function, min_seconds)} for name, function in cases.items()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true")
+    args = parser.parse_args(argv)
+    json.dump({"benchmark": "compile", "results": run(args.quick)}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
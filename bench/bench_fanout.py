@@ -0,0 +1,115 @@
+# bench/bench_fanout.py
+"""
+Бенчмарк рассылки Broadcaster: N подписчиков (по умолчанию 10000), часть из них зависла.
+Измеряет время publish() (кодирование + раскладка по очередям) и время, за которое
+все «быстрые» подписчики получили все сообщения. Результат печатается как JSON.
+С --binary подписчики получают двоичные кадры wire со склейкой записей.
+
+    PYTHONPATH=. python bench/bench_fanout.py --clients 10000 --messages 100 --slow 0.01 [--binary]
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+from server import wire
+from server.fanout import Broadcaster
+
+
+class BenchWebSocket:
+    """Подписчик без сети: считает полученные записи и кадры; slow=True – никогда не дочитывает."""
+
+    def __init__(self, slow: bool, done: asyncio.Event, expected: int, counter: dict):
+        self.slow = slow
+        self.received = 0
+        self.frames = 0
+        self.done = done
+        self.expected = expected
+        self.counter = counter
+
+    async def send_text(self, text):
+        await self._receive(1)
+
+    async def send_bytes(self, data):
+        await self._receive(wire.FRAME.unpack_from(data)[2])
+
+    async def _receive(self, records: int):
+        if self.slow:
+            await asyncio.Event().wait()
+        self.frames += 1
+        self.received += records
+        if self.received == self.expected:
+            self.counter["finished"] += 1
+            if self.counter["finished"] == self.counter["fast"]:
+                self.done.set()
+
+    async def close(self, code=1000):
+        pass
+
+
+async def run(clients: int, messages: int, slow_ratio: float, queue_size: int, policy: str,
+              binary: bool = False) -> dict:
+    broadcaster = Broadcaster(max_queue=queue_size, policy=policy)
+    done = asyncio.Event()
+    slow_count = int(clients * slow_ratio)
+    counter = {"finished": 0, "fast": clients - slow_count}
+    sockets = []
+    for i in range(clients):
+        ws = BenchWebSocket(i < slow_count, done, messages, counter)
+        broadcaster.register(ws, binary).start()
+        sockets.append(ws)
+    await asyncio.sleep(0)
+
+    record = {"id": 0, "expression": "2 + 3 * (7 - 1)", "result": "20", "float_mode": False}
+    publish_times = []
+    started = time.perf_counter()
+    for i in range(messages):
+        t0 = time.perf_counter()
+        broadcaster.publish(dict(record, id=i + 1))
+        publish_times.append(time.perf_counter() - t0)
+        await asyncio.sleep(0)
+    await done.wait()
+    delivered = time.perf_counter() - started
+
+    stats = broadcaster.stats()
+    for client in list(broadcaster.clients):
+        await client.close()
+
+    return {
+        "benchmark": "ws_fanout_inprocess",
+        "case": f"clients_{clients}_{policy}" + ("_binary" if binary else ""),
+        "clients": clients,
+        "slow_clients": slow_count,
+        "messages": messages,
+        "policy": policy,
+        "queue_size": queue_size,
+        "publish_p50_ms": statistics.median(publish_times) * 1000,
+        "publish_max_ms": max(publish_times) * 1000,
+        "delivery_total_s": delivered,
+        "deliveries_per_s": counter["fast"] * messages / delivered,
+        "frames_per_client": statistics.mean(ws.frames for ws in sockets if not ws.slow),
+        "dropped": stats["dropped"],
+        "slow_disconnects": stats["slow_disconnects"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--slow", type=float, default=0.01, help="доля зависших подписчиков")
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--policy", default="drop_oldest")
+    parser.add_argument("--binary", action="store_true", help="двоичные кадры wire со склейкой записей")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.clients, args.messages, args.slow, args.queue_size, args.policy, args.binary))
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
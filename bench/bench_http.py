@@ -0,0 +1,114 @@
+# bench/bench_http.py
+"""
+Нагрузочный генератор для POST /calc: при каждом уровне параллельности N потоков
+непрерывно шлют запросы по своему keep-alive соединению в течение заданного времени.
+Печатает JSON: пропускная способность и задержки p50/p95/p99 на каждый уровень.
+Сервер должен быть запущен (make run-server) или используйте bench/run.py.
+
+    python bench/bench_http.py --url http://localhost:8000 --concurrency 1 8 32 --duration 3
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+# Выражения, по кругу отправляемые каждым потоком
+EXPRESSIONS = [
+    "2 + 3 * (7 - 1)",
+    "(100 - 1) / 3 + 42 * 2",
+    "((1 + 2) * (3 + 4) - 5) / 2",
+    "9 / 3 - 2 + 9 / 3 - 2 + 9 / 3 - 2 + 9 / 3 - 2 + 0",
+]
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Перцентиль по уже отсортированному списку (ближайший ранг)."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def worker(url, path: str, deadline: float, latencies: list, errors: list, offset: int):
+    """Один поток нагрузки: своё соединение, запросы подряд до deadline."""
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    headers = {"Content-Type": "application/json"}
+    i = offset
+    while time.perf_counter() < deadline:
+        body = json.dumps(EXPRESSIONS[i % len(EXPRESSIONS)])
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request("POST", path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def run_level(url, path: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(url, path, deadline, latencies, errors, i))
+        for i in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "case": f"calc_c{concurrency}",
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run(base_url: str, levels, duration: float, cache: bool = False, warmup: float = 0.5) -> dict:
+    url = urlsplit(base_url)
+    path = "/calc" if cache else "/calc?cache=false"
+    run_level(url, path, max(levels), warmup)
+    return {
+        "benchmark": "http_calc",
+        "cache": cache,
+        "duration_s": duration,
+        "results": [run_level(url, path, concurrency, duration) for concurrency in levels],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=3.0, help="секунд на уровень параллельности")
+    parser.add_argument("--cache", action="store_true", help="не отключать кэш результатов (?cache=false)")
+    args = parser.parse_args(argv)
+
+    result = run(args.url, args.concurrency, args.duration, args.cache)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#define _POSIX_C_SOURCE 199309L
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include "calculator.h"
+
+/*
+Микробенчмарк разбора: рекурсивный спуск calcParseExpression / calcParseExpressionF (на них построены
+parseExpression / parseExpressionF из main.c) и итеративный calcParseExpressionIter(F) на сгенерированных
+выражениях разной длины и глубины вложенности. Результат печатается в stdout как JSON.
+
+    build/bench-parser.exe [--quick]
+*/
+
+// Минимальное время замера одного случая, секунд
+#define MIN_SECONDS 0.2
+#define QUICK_MIN_SECONDS 0.02
+
+typedef struct
+{
+    char *data;
+    size_t length;
+    size_t capacity;
+} Buffer;
+
+/*
+Вход: буфер, строка
+Выход: ничего
+Задача: Дописывает строку в конец буфера, при необходимости увеличивая его вдвое
+*/
+static void append(Buffer *buffer, const char *text)
+{
+    size_t n = strlen(text);
+    if (buffer->length + n + 1 > buffer->capacity)
+    {
+        while (buffer->length + n + 1 > buffer->capacity)
+            buffer->capacity = buffer->capacity ? buffer->capacity * 2 : 64;
+        buffer->data = realloc(buffer->data, buffer->capacity);
+        if (!buffer->data)
+        {
+            perror("realloc");
+            exit(1);
+        }
+    }
+    memcpy(buffer->data + buffer->length, text, n + 1);
+    buffer->length += n;
+}
+
+/*
+Вход: число слагаемых
+Выход: выражение "9 / 3 - 2 + 9 / 3 - 2 + ... + 0" (значение равно terms) в куче
+Задача: Длинное плоское выражение со всеми операциями, одинаковое для int и float
+*/
+static char *flatExpression(int terms)
+{
+    Buffer buffer = {0};
+    for (int i = 0; i < terms; i++)
+        append(&buffer, "9 / 3 - 2 + ");
+    append(&buffer, "0");
+    return buffer.data;
+}
+
+/*
+Вход: глубина вложенности
+Выход: выражение "((...(1 + 1) * 1 + 1)...)" (значение равно depth + 1) в куче
+Задача: Глубоко вложенные скобки – по уровню рекурсии разбора на каждую пару
+*/
+static char *nestedExpression(int depth)
+{
+    Buffer buffer = {0};
+    for (int i = 0; i < depth; i++)
+        append(&buffer, "(");
+    append(&buffer, "1");
+    for (int i = 0; i < depth; i++)
+        append(&buffer, " * 1 + 1)");
+    return buffer.data;
+}
+
+static double now(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (double)ts.tv_sec + (double)ts.tv_nsec / 1e9;
+}
+
+/*
+Вход: выражение, режим float, признак итеративного разбора
+Выход: значение выражения (для проверки результата)
+Задача: Один разбор выражения реентерабельным ядром
+*/
+static double parseOnce(const char *expression, int float_mode, int iterative)
+{
+    CalcParser parser;
+    calcParserInit(&parser, expression);
+    double value;
+    if (iterative)
+        value = float_mode ? calcParseExpressionIterF(&parser) : (double)calcParseExpressionIter(&parser);
+    else
+        value = float_mode ? calcParseExpressionF(&parser) : (double)calcParseExpression(&parser);
+    if (parser.error != CALC_OK)
+    {
+        fprintf(stderr, "bench: %s at position %zu\n", calcErrorMessage(parser.error), parser.error_offset);
+        exit(1);
+    }
+    return value;
+}
+
+/*
+Вход: имя случая, выражение, ожидаемое значение, режим float, признак итеративного разбора,
+минимальное время, признак первого случая
+Выход: ничего
+Задача: Повторяет разбор, пока не наберётся min_seconds, и печатает JSON-объект с результатом
+*/
+static void runCase(const char *name, const char *expression, double expected, int float_mode, int iterative,
+                    double min_seconds, int first)
+{
+    if (parseOnce(expression, float_mode, iterative) != expected)
+    {
+        fprintf(stderr, "bench: %s: unexpected result\n", name);
+        exit(1);
+    }
+
+    long iterations = 1;
+    double elapsed = 0;
+    volatile double sink = 0;
+    for (;;)
+    {
+        double started = now();
+        for (long i = 0; i < iterations; i++)
+            sink += parseOnce(expression, float_mode, iterative);
+        elapsed = now() - started;
+        if (elapsed >= min_seconds)
+            break;
+        iterations *= 2;
+    }
+    (void)sink;
+
+    size_t bytes = strlen(expression);
+    const char *mode = float_mode ? "float" : "int";
+    const char *engine = iterative ? "iterative" : "recursive";
+    printf("%s    {\"case\": \"%s_%s_%s\", \"mode\": \"%s\", \"engine\": \"%s\", \"bytes\": %zu, "
+           "\"iterations\": %ld, \"ns_per_eval\": %.1f, \"mb_per_s\": %.2f}",
+           first ? "" : ",\n", name, mode, engine, mode, engine, bytes, iterations, elapsed / (double)iterations * 1e9,
+           (double)bytes * (double)iterations / elapsed / 1e6);
+}
+
+int main(int argc, char *argv[])
+{
+    double min_seconds = MIN_SECONDS;
+    for (int i = 1; i < argc; i++)
+    {
+        if (strcmp(argv[i], "--quick") == 0)
+            min_seconds = QUICK_MIN_SECONDS;
+    }
+
+    static const int flat_terms[] = {1, 100, 10000};
+    // Глубина 100000 – только для итеративного разбора: рекурсивному не хватит стека
+    static const int nested_depths[] = {10, 100, 1000, 100000};
+    int first = 1;
+
+    printf("{\"benchmark\": \"parser\", \"results\": [\n");
+    for (int iterative = 0; iterative <= 1; iterative++)
+    {
+        for (int float_mode = 0; float_mode <= 1; float_mode++)
+        {
+            for (size_t i = 0; i < sizeof(flat_terms) / sizeof(flat_terms[0]); i++)
+            {
+                char name[32];
+                char *expression = flatExpression(flat_terms[i]);
+                snprintf(name, sizeof(name), "flat_%d", flat_terms[i]);
+                runCase(name, expression, flat_terms[i], float_mode, iterative, min_seconds, first);
+                first = 0;
+                free(expression);
+            }
+            for (size_t i = 0; i < sizeof(nested_depths) / sizeof(nested_depths[0]); i++)
+            {
+                if (!iterative && nested_depths[i] > 1000)
+                    continue;
+                char name[32];
+                char *expression = nestedExpression(nested_depths[i]);
+                snprintf(name, sizeof(name), "nested_%d", nested_depths[i]);
+                runCase(name, expression, nested_depths[i] + 1, float_mode, iterative, min_seconds, first);
+                free(expression);
+            }
+        }
+    }
+    printf("\n]}\n");
+    return 0;
+}
@@ -0,0 +1,275 @@
+# bench/run.py
+"""
+Набор бенчмарков: разбор выражений (C), чтение больших выражений app.exe,
+POST /calc под нагрузкой, рассылка WebSocket, скомпилированные выражения против повторного разбора,
+выгрузка и загрузка истории.
+Пишет все результаты одним JSON-файлом; с --baseline сравнивает их с сохранённым прогоном
+и завершается с кодом 2, если какая-либо метрика ухудшилась больше чем на --threshold.
+
+    PYTHONPATH=. python bench/run.py                       # полный прогон -> build/bench/results.json
+    PYTHONPATH=. python bench/run.py --quick --only parser
+    PYTHONPATH=. python bench/run.py --save-baseline       # сохранить как bench/baseline.json
+    PYTHONPATH=. python bench/run.py --baseline bench/baseline.json --threshold 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BUILD_DIR = ROOT / "build"
+PARSER_BENCH = BUILD_DIR / "bench-parser.exe"
+APP_PATH = BUILD_DIR / "app.exe"
+RESULTS_PATH = BUILD_DIR / "bench" / "results.json"
+# Базовый прогон хранится в репозитории и обновляется вместе с изменениями, которые его меняют
+BASELINE_PATH = ROOT / "bench" / "baseline.json"
+
+SUITES = ("parser", "input", "http", "fanout", "compile", "transfer")
+
+# Размеры входа app.exe для набора input (в --quick без 64 МБ)
+INPUT_SIZES = {"1kb": 1024, "1mb": 1024 * 1024, "64mb": 64 * 1024 * 1024}
+
+# Направление метрик при сравнении: больше – лучше / меньше – лучше; остальные поля не сравниваются
+HIGHER_IS_BETTER = ("_per_s",)
+LOWER_IS_BETTER = ("_ms", "ns_per_eval", "delivery_total_s")
+
+# Слагаемое выражения для набора input: значение выражения равно числу слагаемых
+INPUT_TERM = "9 / 3 - 2 + "
+
+
+def run_parser(quick: bool) -> list:
+    cmd = [str(PARSER_BENCH)] + (["--quick"] if quick else [])
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)["results"]
+
+
+def run_input(quick: bool) -> list:
+    """app.exe целиком читает выражение из stdin и вычисляет его; лучшее из трёх запусков."""
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, size in INPUT_SIZES.items():
+            if quick and size > 1024 * 1024:
+                continue
+            terms = max(1, (size - 1) // len(INPUT_TERM))
+            path = Path(workdir) / f"{name}.txt"
+            path.write_text(INPUT_TERM * terms + "0")
+            timings = []
+            for _ in range(3):
+                with open(path, "rb") as stdin:
+                    started = time.perf_counter()
+                    output = subprocess.run([str(APP_PATH)], stdin=stdin, check=True, capture_output=True).stdout
+                    timings.append(time.perf_counter() - started)
+            if int(output) != terms:
+                raise RuntimeError(f"app.exe returned {output!r} for {name}")
+            best = min(timings)
+            results.append({
+                "case": f"app_{name}",
+                "bytes": path.stat().st_size,
+                "elapsed_ms": best * 1000,
+                "mb_per_s": path.stat().st_size / best / 1e6,
+            })
+            path.unlink()
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir: str, port: int) -> subprocess.Popen:
+    """
+    Запускает сервер в отдельном каталоге (там же создаётся history.db),
+    чтобы бенчмарк не трогал рабочую историю. build/ подключается ссылкой.
+    """
+    os.symlink(BUILD_DIR, os.path.join(workdir, "build"))
+    env = dict(os.environ, PYTHONPATH=f"{ROOT}{os.pathsep}{ROOT / 'server'}", CALC_LOG_CONSOLE="0")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server did not start")
+
+
+def run_http(quick: bool) -> list:
+    from bench import bench_http
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_server(workdir, port)
+        try:
+            levels = [1, 8] if quick else [1, 8, 32]
+            result = bench_http.run(f"http://127.0.0.1:{port}", levels, 1.0 if quick else 3.0)
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    return result["results"]
+
+
+def run_fanout(quick: bool) -> list:
+    from bench import bench_fanout
+
+    clients_levels = [1000] if quick else [1000, 10000]
+    return [
+        asyncio.run(bench_fanout.run(clients, 100, 0.01, 64, "drop_oldest", binary))
+        for clients in clients_levels
+        for binary in (False, True)
+    ]
+
+
+def run_compile(quick: bool) -> list:
+    from bench import bench_compile
+
+    return bench_compile.run(quick)
+
+
+def run_transfer(quick: bool) -> list:
+    """Выгрузка и загрузка истории (server/transfer.py) во всех форматах на временной БД."""
+    from server import database, transfer
+
+    rows = 100_000 if quick else 1_000_000
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "source.db")
+        database.DB_PATH = source
+        database.init_db()
+        with sqlite3.connect(source) as conn:
+            database.insert_records(conn, (
+                (f"{i} + {i % 97} * (3 - 1)", str(i + 2 * (i % 97)), i % 3 == 0, f"2024-01-01T00:00:{i % 60:02}")
+                for i in range(rows)
+            ))
+        for fmt in transfer.FORMATS:
+            path = os.path.join(workdir, f"history.{fmt}")
+            started = time.perf_counter()
+            with open(path, "wb") as out:
+                transfer.export_history(out, fmt, db_path=source)
+            exported = time.perf_counter() - started
+
+            target = os.path.join(workdir, f"{fmt}.db")
+            database.DB_PATH = target
+            database.init_db()
+            started = time.perf_counter()
+            with open(path, "rb") as source_file:
+                transfer.import_history(source_file, fmt, db_path=target)
+            imported = time.perf_counter() - started
+            results.append({
+                "case": f"{fmt}_{rows}",
+                "bytes": os.path.getsize(path),
+                "export_rows_per_s": rows / exported,
+                "import_rows_per_s": rows / imported,
+            })
+    return results
+
+
+RUNNERS = {"parser": run_parser, "input": run_input, "http": run_http, "fanout": run_fanout, "compile": run_compile,
+           "transfer": run_transfer}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metric_direction(name: str) -> int:
+    """+1 – больше лучше, -1 – меньше лучше, 0 – не сравнивается."""
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Сравнивает метрики одноимённых случаев. Возвращает список строк-отчётов
+    (suite, case, metric, baseline, current, change, regression).
+    """
+    rows = []
+    for suite, cases in results["benchmarks"].items():
+        base_cases = {case["case"]: case for case in baseline.get("benchmarks", {}).get(suite, [])}
+        for case in cases:
+            base = base_cases.get(case["case"])
+            if base is None:
+                continue
+            for metric, value in case.items():
+                direction = metric_direction(metric)
+                if not direction or not base.get(metric):
+                    continue
+                change = (value - base[metric]) / base[metric]
+                regression = direction * change < -threshold
+                rows.append((suite, case["case"], metric, base[metric], value, change, regression))
+    return rows
+
+
+def print_comparison(rows, out=sys.stderr):
+    for suite, case, metric, base, value, change, regression in rows:
+        mark = "REGRESSION" if regression else ""
+        print(f"{suite:8} {case:28} {metric:18} {base:14.2f} -> {value:14.2f} {change:+8.1%} {mark}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--quick", action="store_true", help="короткие замеры (для проверки, не для сравнения)")
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH)
+    parser.add_argument("--baseline", type=Path, help="сравнить с сохранённым прогоном")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимое ухудшение, доля")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, type=Path,
+                        help="сохранить результаты как базовые")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick,
+        },
+        "benchmarks": {},
+    }
+    for suite in args.only:
+        print(f"running {suite}...", file=sys.stderr)
+        results["benchmarks"][suite] = RUNNERS[suite](args.quick)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"results: {args.output}", file=sys.stderr)
+
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"baseline: {args.save_baseline}", file=sys.stderr)
+
+    if args.baseline:
+        rows = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,468 @@
 import sys
 import json
+import uuid
+import struct
 import requests
+from datetime import datetime
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QPushButton, QTextEdit, QCheckBox
+    QLabel, QLineEdit, QPushButton, QCheckBox, QListView, QAbstractItemView
 )
 
-from PySide6.QtCore import Qt, QThread, Signal, Slot, QTimer
+from PySide6.QtCore import (
+    Qt, QObject, QThread, Signal, Slot, QTimer, QAbstractListModel, QModelIndex, QPoint, QByteArray
+)
 from PySide6.QtWebSockets import QWebSocket
 from PySide6.QtNetwork import QAbstractSocket
 
+from server import libcalc, wire
+
 SERVER_URL = "http://localhost:8000/calc"
 WS_URL = "ws://localhost:8000/ws"
+HISTORY_URL = "http://localhost:8000/history"
+
+# Кодировка рассылки WebSocket: "binary" – компактные кадры со склейкой записей (server/wire.py), "json" – текст
+WS_ENCODING = "binary"
+
+# Сколько ждать ответа на вычисление (мс) и сколько потоков отправляют POST /calc, если WebSocket недоступен
+CALC_TIMEOUT_MS = 5000
+HTTP_WORKERS = 2
+
+# Сколько потоков вычисляют выражения локально (libcalc.so): длинное выражение не задерживает короткие
+LOCAL_EVAL_WORKERS = 2
+
+# Сколько результатов помнит локальный кэш (заполняется из истории и собственных вычислений)
+LOCAL_CACHE_SIZE = 10000
+# Сколько вычислений, сделанных без связи с сервером, ждут отправки в историю
+OFFLINE_QUEUE_SIZE = 10000
 
+# Сколько записей истории держится в памяти: остальные подгружаются страницами при прокрутке
+HISTORY_WINDOW = 5000
+# Размер страницы GET /history при прокрутке к краю окна
+HISTORY_PAGE = 200
+# Сколько записей вставлять в модель за один проход цикла событий
+HISTORY_INSERT_CHUNK = 500
 
-class CalcWorker(QThread):
+
+class LocalEvalError(Exception):
+    """Ошибка локального вычисления: текст в том же виде, что у сервера ("... at position N")."""
+
+
+class LocalEvaluator(QObject):
     """
-    Работник, который делает POST запрос на /calc в отдельном потоке,
-    чтобы не блокировать UI.
+    Вычисление в процессе GUI через server.libcalc – те же привязки к libcalc.so и тот же предел
+    вложенности (CALC_MAX_DEPTH), что у сервера, поэтому результат и текст ошибки совпадают с ответом
+    сервера. Если библиотека не собрана, available == False, и выражения вычисляет только сервер.
+    Вычисление идёт в небольшом пуле потоков (ctypes отпускает GIL на время вызова), поэтому
+    многомегабайтное или глубоко вложенное выражение не останавливает интерфейс; результат приходит сигналом.
     """
-    result_ready = Signal(str)
-    error_occurred = Signal(str)
+    result_ready = Signal(int, str, bool, str)  # id, выражение, режим float, результат
+    error_occurred = Signal(int, str)           # id, сообщение об ошибке
+
+    def __init__(self, path: str = libcalc.LIB_PATH, parent=None):
+        super().__init__(parent)
+        self.available = False
+        self.next_id = 0
+        self.executor = ThreadPoolExecutor(max_workers=LOCAL_EVAL_WORKERS, thread_name_prefix="calc-local")
+        try:
+            libcalc.load_library(path)
+        except OSError as e:
+            print("[LocalEvaluator] libcalc.so not loaded:", e)
+            return
+        self.available = True
 
-    def __init__(self, expression: str, use_float: bool):
-        super().__init__()
-        self.expression = expression
-        self.use_float = use_float
+    def submit(self, expression: str, use_float: bool) -> int:
+        """Ставит выражение в очередь вычисления; результат придёт сигналом с возвращённым id."""
+        self.next_id += 1
+        self.executor.submit(self._evaluate, self.next_id, expression, use_float)
+        return self.next_id
 
-    def run(self):
+    def _evaluate(self, request_id: int, expression: str, use_float: bool):
+        # Выполняется в потоке пула: сигналы доставляются в поток интерфейса через очередь событий Qt
+        try:
+            result = self.evaluate(expression, use_float)
+        except LocalEvalError as e:
+            self.error_occurred.emit(request_id, f"Ошибка вычисления {e}")
+        else:
+            self.result_ready.emit(request_id, expression, use_float, result)
+
+    def evaluate(self, expression: str, use_float: bool) -> str:
+        """Результат в том же текстовом виде, что отдаёт сервер ("%d" / "%f"); ошибка – LocalEvalError."""
         try:
-            url = SERVER_URL
-            if self.use_float:
-                url += "?float=true"
+            return libcalc.evaluate(expression, use_float, libcalc.CONFIGURED_MAX_DEPTH)
+        except libcalc.LibCalcError as e:
+            raise LocalEvalError(f"{e.message} at position {e.offset}") from e
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LocalResultCache:
+    """
+    LRU-кэш результатов по ключу (выражение, режим). Заполняется записями истории от сервера
+    и собственными вычислениями; в истории только успешные результаты, поэтому ошибки не кэшируются.
+    """
 
-            response = requests.post(
-                url,
-                json=self.expression,
+    def __init__(self, max_entries: int = LOCAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, expression: str, use_float: bool):
+        key = (expression, use_float)
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, expression: str, use_float: bool, result: str):
+        key = (expression, use_float)
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def add_records(self, records):
+        for record in records:
+            self.put(record["expression"], bool(record["float_mode"]), str(record["result"]))
+
+
+class CalcClient(QObject):
+    """
+    Отправка вычислений. Основной путь – открытый WebSocket: сообщение {"type": "calc", "id": ...}
+    без отдельного потока и соединения на каждый запрос; можно отправлять следующие, не дожидаясь ответа,
+    ответы сопоставляются по id. Если WebSocket не подключён, запрос уходит POST /calc через общую
+    keep-alive сессию requests в небольшом пуле потоков.
+
+    Вычисления, уже посчитанные локально (record), отправляются только ради истории, со временем
+    их выполнения: без связи они копятся в очереди offline и уходят по WebSocket после переподключения.
+    Запросы, оставшиеся без ответа при обрыве, после переподключения отправляются повторно с тем же id:
+    клиент подключается с ?session=, и сервер не создаёт по повтору второй записи истории.
+    """
+    result_ready = Signal(int, str)     # id запроса, результат
+    error_occurred = Signal(int, str)   # id запроса, сообщение об ошибке
+
+    def __init__(self, ws_client, parent=None):
+        super().__init__(parent)
+        self.ws_client = ws_client
+        self.ws_client.on_calc_reply = self.handle_reply
+        self.ws_client.on_connection_lost = self.fail_over
+        self.ws_client.on_connection_restored = self.resume
+        self.next_id = 0
+        self.pending = {}  # id -> (сообщение calc, таймер ожидания ответа)
+        self.syncing = {}  # id -> сообщение calc: локальные вычисления, отправленные в историю
+        self.offline = deque(maxlen=OFFLINE_QUEUE_SIZE)  # Сообщения calc, ждут подключения
+        self.unsent = []  # id запросов из pending, которые нужно отправить повторно после переподключения
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=HTTP_WORKERS))
+        self.executor = ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix="calc-http")
+
+    def _message(self, expression: str, use_float: bool, timestamp: str = None) -> dict:
+        self.next_id += 1
+        message = {"type": "calc", "id": self.next_id, "expression": expression, "float": use_float}
+        if timestamp is not None:
+            message["timestamp"] = timestamp
+        return message
+
+    def submit(self, expression: str, use_float: bool) -> int:
+        """Отправляет выражение; результат придёт сигналом с возвращённым id."""
+        message = self._message(expression, use_float)
+        request_id = message["id"]
+        if self.ws_client.send_message(message):
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda: self.handle_timeout(request_id))
+            timer.start(CALC_TIMEOUT_MS)
+            self.pending[request_id] = (message, timer)
+        else:
+            self.post(request_id, expression, use_float)
+        return request_id
+
+    def record(self, expression: str, use_float: bool):
+        """Сохраняет в истории сервера вычисление, результат которого уже показан локально."""
+        message = self._message(expression, use_float, datetime.now().isoformat())
+        if not self._send_record(message):
+            self.offline.append(message)
+
+    def resume(self):
+        """
+        WebSocket подключился: повторяет запросы, оставшиеся без ответа при обрыве, и отправляет
+        вычисления, накопленные без связи, в порядке их выполнения.
+        """
+        unsent, self.unsent = self.unsent, []
+        for request_id in unsent:
+            if request_id in self.pending:
+                self.ws_client.send_message(self.pending[request_id][0])
+        if self.offline:
+            print(f"[Calc] Syncing {len(self.offline)} offline calculations")
+        while self.offline:
+            if not self._send_record(self.offline[0]):
+                break
+            self.offline.popleft()
+
+    def _send_record(self, message: dict) -> bool:
+        if not self.ws_client.send_message(message):
+            return False
+        self.syncing[message["id"]] = message
+        return True
+
+    def handle_reply(self, message: dict):
+        synced = self.syncing.pop(message.get("id"), None)
+        if synced is not None:
+            if message["type"] == "calc_error":
+                print("[Calc] Server rejected local calculation:", synced["expression"], message.get("error"))
+            return
+        entry = self.pending.pop(message.get("id"), None)
+        if entry is None:
+            return  # Ответ на запрос, который уже завершён по таймауту
+        entry[1].stop()
+        if message["type"] == "calc_result":
+            self.result_ready.emit(message["id"], str(message["result"]))
+        else:
+            self.error_occurred.emit(message["id"], f"Ошибка вычисления {message.get('error', 'Неизвестная ошибка')}")
+
+    def handle_timeout(self, request_id: int):
+        if self.pending.pop(request_id, None) is not None:
+            self.error_occurred.emit(request_id, "Сервер не отвечает. Превышено время ожидания.")
+
+    def fail_over(self):
+        """
+        WebSocket оборвался. Запросы без ответа ждут переподключения (или своего таймаута) и уходят
+        повторно с тем же id: по HTTP их не повторяем, иначе сервер мог бы записать вычисление дважды.
+        Неподтверждённые записи локальных вычислений возвращаются в начало очереди offline.
+        """
+        syncing, self.syncing = self.syncing, {}
+        self.offline.extendleft(reversed(list(syncing.values())))
+        self.unsent = list(self.pending)
+
+    def post(self, request_id: int, expression: str, use_float: bool):
+        self.executor.submit(self._post, request_id, expression, use_float)
+
+    def _post(self, request_id: int, expression: str, use_float: bool):
+        # Выполняется в потоке пула: сигналы доставляются в поток интерфейса через очередь событий Qt
+        try:
+            response = self.session.post(
+                SERVER_URL,
+                params={"float": "true"} if use_float else None,
+                json=expression,
                 headers={"Content-Type": "application/json"},
-                timeout=5
+                timeout=CALC_TIMEOUT_MS / 1000
             )
 
             if response.status_code == 200:
                 result = response.json()  # ожидаем строку
-                self.result_ready.emit(str(result))
+                self.result_ready.emit(request_id, str(result))
             else:
                 try:
                     error_msg = response.json().get("error", "Неизвестная ошибка")
                 except Exception:
                     error_msg = "Не удалось обработать ответ от сервера"
-                self.error_occurred.emit(f"Ошибка вычисления {error_msg}")
+                self.error_occurred.emit(request_id, f"Ошибка вычисления {error_msg}")
 
         except requests.exceptions.ConnectionError:
-            self.error_occurred.emit("Сервер недоступен. Попробуйте позже.")
+            self.error_occurred.emit(request_id, "Сервер недоступен. Попробуйте позже.")
         except requests.exceptions.Timeout:
-            self.error_occurred.emit("Сервер не отвечает. Превышено время ожидания.")
+            self.error_occurred.emit(request_id, "Сервер не отвечает. Превышено время ожидания.")
         except Exception as e:
-            self.error_occurred.emit(f"Неизвестная ошибка: {e}")
+            self.error_occurred.emit(request_id, f"Неизвестная ошибка: {e}")
+
+    def close(self):
+        for _, timer in self.pending.values():
+            timer.stop()
+        self.pending.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+class HistoryPageWorker(QThread):
+    """
+    Загружает страницу истории (GET /history) в отдельном потоке.
+    backward=True – записи до cursor (новые первыми), иначе – после cursor.
+    """
+    page_ready = Signal(list, bool, bool, int)  # записи, последняя ли страница, backward, поколение модели
+    failed = Signal(bool, int)
+
+    def __init__(self, cursor: int, backward: bool, generation: int):
+        super().__init__()
+        self.cursor = cursor
+        self.backward = backward
+        self.generation = generation
+
+    def run(self):
+        try:
+            response = requests.get(
+                HISTORY_URL,
+                params={
+                    "cursor": self.cursor,
+                    "limit": HISTORY_PAGE,
+                    "direction": "backward" if self.backward else "forward",
+                },
+                timeout=5
+            )
+            response.raise_for_status()
+            page = response.json()
+            self.page_ready.emit(page["records"], page["next_cursor"] is None, self.backward, self.generation)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print("[History] Page load failed:", e)
+            self.failed.emit(self.backward, self.generation)
+
+
+class HistoryModel(QAbstractListModel):
+    """
+    История для QListView: представление отрисовывает только видимые строки.
+    В памяти – окно не больше window записей по возрастанию id. Записи, вышедшие за окно
+    (или не присланные при подключении), подгружаются страницами GET /history при прокрутке:
+    старые – по request_older(), новые – через fetchMore() (его вызывает сам QListView внизу списка).
+    """
+    RecordRole = Qt.UserRole + 1
+
+    older_requested = Signal(int)  # id первой записи окна
+    newer_requested = Signal(int)  # id последней записи окна
+
+    def __init__(self, window: int = HISTORY_WINDOW, chunk: int = HISTORY_INSERT_CHUNK, parent=None):
+        super().__init__(parent)
+        self.window = window
+        self.chunk = chunk
+        self.records = []
+        self.pending = deque()                # Новые записи, ожидающие вставки порциями
+        self.skipped = deque(maxlen=window)   # Новые записи, пришедшие, пока окно не доходит до конца истории
+        self.has_older = False
+        self.has_newer = False
+        self.loading_older = False
+        self.loading_newer = False
+        self.older_cursor = None              # id, от которых запрошены страницы: ответ годится, только если
+        self.newer_cursor = None              # окно с тех пор не сдвинулось с этого края
+        self.generation = 0                   # Меняется при reset(): ответы на старые запросы страниц отбрасываются
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{record['expression']} = {record['result']}"
+        if role == Qt.ToolTipRole:
+            return record.get("timestamp")
+        if role == self.RecordRole:
+            return record
+        return None
+
+    def reset(self, records):
+        """Заменяет историю: более старые записи подгрузятся при прокрутке вверх."""
+        self.beginResetModel()
+        self.records = []
+        self.endResetModel()
+        self.pending.clear()
+        self.skipped.clear()
+        self.generation += 1
+        self.has_older = bool(records) and records[0]["id"] > 1
+        self.has_newer = self.loading_older = self.loading_newer = False
+        self.append(records)
+
+    def append(self, records):
+        """Дописывает новые записи в конец – порциями по chunk, не блокируя цикл событий."""
+        if self.has_newer:
+            # Окно не доходит до конца истории: эти записи придут страницей при прокрутке вниз
+            self.skipped.extend(records)
+            return
+        idle = not self.pending
+        self.pending.extend(records)
+        # Всё, что не поместится в окно, всё равно было бы сразу удалено
+        while len(self.pending) > self.window:
+            self.pending.popleft()
+            self.has_older = True
+        if idle and self.pending:
+            QTimer.singleShot(0, self._insert_pending)
+
+    def _insert_pending(self):
+        if not self.pending:
+            return
+        batch = [self.pending.popleft() for _ in range(min(self.chunk, len(self.pending)))]
+        self._insert_at_end(batch)
+        if self.pending:
+            QTimer.singleShot(0, self._insert_pending)
+
+    def _insert_at_end(self, records):
+        first = len(self.records)
+        self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+        self.records.extend(records)
+        self.endInsertRows()
+        excess = len(self.records) - self.window
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+            del self.records[:excess]
+            self.endRemoveRows()
+            self.has_older = True
+
+    def request_older(self):
+        """Запрашивает страницу записей перед первой записью окна (прокрутка к началу списка)."""
+        if self.has_older and not self.loading_older and self.records:
+            self.loading_older = True
+            self.older_cursor = self.records[0]["id"]
+            self.older_requested.emit(self.older_cursor)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_newer and not self.loading_newer
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent) and self.records:
+            self.loading_newer = True
+            self.newer_cursor = self.records[-1]["id"]
+            self.newer_requested.emit(self.newer_cursor)
+
+    @Slot(list, bool, bool, int)
+    def add_page(self, records, last_page: bool, backward: bool, generation: int):
+        """Страница GET /history: backward – в начало окна (записи в ней новые первыми), иначе – в конец."""
+        if generation != self.generation:
+            return
+        if backward:
+            self.loading_older = False
+            if not self.records or self.records[0]["id"] != self.older_cursor:
+                return
+            self.has_older = not last_page
+            if records:
+                self._insert_at_start(records[::-1])
+        else:
+            self.loading_newer = False
+            if not self.records or self.records[-1]["id"] != self.newer_cursor:
+                return
+            newer = list(records)
+            last_id = self.newer_cursor
+            if last_page:
+                # Дошли до конца истории: добавить то, что пришло по WebSocket, пока окно было не в конце
+                self.has_newer = False
+                last_id = newer[-1]["id"] if newer else last_id
+                newer.extend(record for record in self.skipped if record["id"] > last_id)
+                self.skipped.clear()
+            if newer:
+                self._insert_at_end(newer)
+
+    @Slot(bool, int)
+    def page_failed(self, backward: bool, generation: int):
+        """Страницу не удалось загрузить: её можно будет запросить снова при следующей прокрутке."""
+        if generation != self.generation:
+            return
+        if backward:
+            self.loading_older = False
+        else:
+            self.loading_newer = False
+
+    def _insert_at_start(self, records):
+        self.beginInsertRows(QModelIndex(), 0, len(records) - 1)
+        self.records[0:0] = records
+        self.endInsertRows()
+        excess = len(self.records) - self.window
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), len(self.records) - excess, len(self.records) - 1)
+            del self.records[-excess:]
+            self.endRemoveRows()
+            self.has_newer = True
 
 
 class WebSocketClient:
@@ -70,11 +476,20 @@ class WebSocketClient:
         self.ws.disconnected.connect(self.on_disconnected)
         self.ws.errorOccurred.connect(self.on_error)
         self.ws.textMessageReceived.connect(self.on_text_message)
+        self.ws.binaryMessageReceived.connect(self.on_binary_message)
 
         self.on_history = None
         self.on_new_record = None
+        self.on_calc_reply = None       # Ответ на запрос calc (см. CalcClient)
+        self.on_connection_lost = None  # Соединение оборвалось
+        self.on_connection_restored = None  # Соединение установлено (в том числе после обрыва)
+
+        # id последней полученной записи истории: при переподключении просим только то, что пропустили
+        self.last_id = None
+        # Идентификатор клиента: с ним сервер узнаёт повторы calc после переподключения
+        self.session_id = uuid.uuid4().hex
 
-        self.ws.open(self.url)  # Первая попытка
+        self.ws.open(self.resume_url())  # Первая попытка
 
     def close(self):
         self.keep_reconnecting = False
@@ -83,10 +498,21 @@ class WebSocketClient:
     @Slot()
     def on_connected(self):
         print("[WebSocket] Connected")
+        if self.on_connection_restored:
+            self.on_connection_restored()
+
+    def send_message(self, message: dict) -> bool:
+        """Отправляет сообщение, если соединение открыто. False – не подключены."""
+        if self.ws.state() != QAbstractSocket.ConnectedState:
+            return False
+        self.ws.sendTextMessage(json.dumps(message, ensure_ascii=False))
+        return True
 
     @Slot()
     def on_disconnected(self):
         print("[WebSocket] Disconnected")
+        if self.on_connection_lost:
+            self.on_connection_lost()
         if self.keep_reconnecting:
             # Запланировать переподключение через 2 сек
             QTimer.singleShot(self.reconnect_interval, self.try_reconnect)
@@ -104,7 +530,23 @@ class WebSocketClient:
             # Может, уже подключились
             return
         print("[WebSocket] Trying to reconnect...")
-        self.ws.open(self.url)
+        self.ws.open(self.resume_url())
+
+    def resume_url(self) -> str:
+        params = [f"encoding={WS_ENCODING}", f"session={self.session_id}"]
+        if self.last_id is not None:
+            params.append(f"since={self.last_id}")
+        return f"{self.url}?{'&'.join(params)}"
+
+    def accept_record(self, record) -> bool:
+        """Запоминает id записи; False, если запись уже была получена."""
+        record_id = record.get("id")
+        if record_id is None:
+            return True
+        if self.last_id is not None and record_id <= self.last_id:
+            return False
+        self.last_id = record_id
+        return True
 
     @Slot(str)
     def on_text_message(self, message: str):
@@ -113,12 +555,38 @@ class WebSocketClient:
         except json.JSONDecodeError:
             print("[WebSocket] Invalid JSON:", message)
             return
+        self.handle_message(data)
 
-        if "history" in data:
+    @Slot(QByteArray)
+    def on_binary_message(self, message: QByteArray):
+        try:
+            data = wire.decode_frame(message.data())
+        except (struct.error, UnicodeDecodeError) as e:
+            print("[WebSocket] Invalid binary frame:", e)
+            return
+        self.handle_message(data)
+
+    def handle_message(self, data: dict):
+        if data.get("type") in ("calc_result", "calc_error"):
+            if self.on_calc_reply:
+                self.on_calc_reply(data)
+        elif data.get("type") == "error":
+            print("[WebSocket] Server error:", data.get("error"))
+        elif "history" in data:
+            # Дельта после since дописывается к уже показанной истории, иначе история заменяется
+            replace = data.get("since") is None or data.get("truncated", False)
+            if replace:
+                self.last_id = None
+            records = [record for record in data["history"] if self.accept_record(record)]
             if self.on_history:
-                self.on_history(data["history"])
+                self.on_history(records, replace)
+        elif "records" in data:
+            # Пакет вычислений из POST /calc/batch или склеенный двоичный кадр
+            for record in data["records"]:
+                if self.accept_record(record) and self.on_new_record:
+                    self.on_new_record(record)
         else:
-            if self.on_new_record:
+            if self.accept_record(data) and self.on_new_record:
                 self.on_new_record(data)
 
 
@@ -134,6 +602,24 @@ class CalculatorApp(QWidget):
         self.ws_client.on_history = self.handle_history
         self.ws_client.on_new_record = self.handle_new_record
 
+        # Локальные вычисления и кэш результатов: мгновенный ответ и работа без сервера
+        self.local_evaluator = LocalEvaluator(parent=self)
+        self.local_evaluator.result_ready.connect(self.on_local_result)
+        self.local_evaluator.error_occurred.connect(self.on_local_error)
+        self.latest_local = None
+        self.result_cache = LocalResultCache()
+
+        # Вычисления: по WebSocket, пока он подключён, иначе POST /calc
+        self.calc_client = CalcClient(self.ws_client, self)
+        self.calc_client.result_ready.connect(self.on_calc_result)
+        self.calc_client.error_occurred.connect(self.on_calc_error)
+        self.latest_request = None
+
+        # Загрузчики страниц истории (держим ссылки, пока потоки работают)
+        self.page_workers = set()
+        self.history_follow = True
+        self.history_top_row = 0
+
         self.create_ui()
         self.apply_styles()
 
@@ -167,10 +653,18 @@ class CalculatorApp(QWidget):
         self.result_label = QLabel("")
         self.result_label.setAlignment(Qt.AlignCenter)
 
-        # История
-        self.history_box = QTextEdit()
-        self.history_box.setReadOnly(True)
-        self.history_box.setPlaceholderText("История вычислений...")
+        # История: модель с окном записей, представление рисует только видимые строки
+        self.history_model = HistoryModel(parent=self)
+        self.history_model.older_requested.connect(lambda cursor: self.load_history_page(cursor, backward=True))
+        self.history_model.newer_requested.connect(lambda cursor: self.load_history_page(cursor, backward=False))
+        self.history_model.rowsAboutToBeInserted.connect(self.on_history_rows_about_to_be_inserted)
+        self.history_model.rowsInserted.connect(self.on_history_rows_inserted)
+
+        self.history_box = QListView()
+        self.history_box.setModel(self.history_model)
+        self.history_box.setUniformItemSizes(True)
+        self.history_box.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.history_box.verticalScrollBar().valueChanged.connect(self.on_history_scrolled)
 
         # Сборка
         layout.addLayout(input_layout)
@@ -195,7 +689,7 @@ class CalculatorApp(QWidget):
                 font-size: 14px;
                 padding: 6px 12px;
             }
-            QTextEdit {
+            QListView {
                 font-family: monospace;
                 font-size: 13px;
                 background-color: #f7f7f7;
@@ -209,27 +703,53 @@ class CalculatorApp(QWidget):
             self.show_error("Введите выражение")
             return
 
-        self.calc_button.setEnabled(False)
+        use_float = self.float_checkbox.isChecked()
+
+        # Сначала локально: кэш, затем libcalc.so в потоке пула. Сервер получает выражение только для истории
+        # (или позже, если связи нет), а ответы на более ранние запросы уже не меняют надпись
+        self.latest_request = None
+        self.latest_local = None
+        result = self.result_cache.get(expr, use_float)
+        if result is not None:
+            self.show_result(result)
+            self.calc_client.record(expr, use_float)
+            return
+
+        # Кнопка не блокируется: следующие выражения можно отправлять, не дожидаясь ответа на предыдущие
         self.result_label.setStyleSheet("color: gray; font-size: 16px;")
         self.result_label.setText("Считаю...")
+        if self.local_evaluator.available:
+            self.latest_local = self.local_evaluator.submit(expr, use_float)
+        else:
+            self.latest_request = self.calc_client.submit(expr, use_float)
 
-        use_float = self.float_checkbox.isChecked()
-        self.worker = CalcWorker(expression=expr, use_float=use_float)
-        self.worker.result_ready.connect(self.show_result)
-        self.worker.error_occurred.connect(self.show_error)
-        self.worker.start()
+    def on_local_result(self, request_id, expression, use_float, result):
+        # Вычисление записывается в историю, даже если надпись уже показывает более позднее
+        self.result_cache.put(expression, use_float, result)
+        self.calc_client.record(expression, use_float)
+        if request_id == self.latest_local:
+            self.show_result(result)
+
+    def on_local_error(self, request_id, error_message):
+        # Ошибки в историю не попадают – на сервер отправлять нечего
+        if request_id == self.latest_local:
+            self.show_error(error_message)
+
+    def on_calc_result(self, request_id, result):
+        if request_id == self.latest_request:  # Ответы на более ранние запросы уже неактуальны для надписи
+            self.show_result(result)
+
+    def on_calc_error(self, request_id, error_message):
+        if request_id == self.latest_request:
+            self.show_error(error_message)
 
     def show_result(self, result):
-        expr = self.input_edit.text().strip()
         self.result_label.setStyleSheet("color: green; font-size: 16px;")
         self.result_label.setText(f"✅ Результат: {result}")
-        self.calc_button.setEnabled(True)
-
 
     def show_error(self, error_message):
         self.result_label.setStyleSheet("color: red; font-size: 16px;")
         self.result_label.setText(f"❌ {error_message}")
-        self.calc_button.setEnabled(True)
 
     def clear_all(self):
         self.input_edit.clear()
@@ -238,32 +758,65 @@ class CalculatorApp(QWidget):
 
     # ========== WebSocket callbacks ==========
 
-    def handle_history(self, history_list):
+    def handle_history(self, history_list, replace=True):
         """
-        Вызывается один раз при подключении к WebSocket.
-        history_list – это весь список вычислений (от самого первого),
-        каждый элемент: {"expression": "...", "result": "...", "float_mode": bool, "timestamp": "..."}
+        Вызывается при каждом подключении к WebSocket.
+        history_list – последние вычисления (replace=True) или только пропущенные с прошлого
+        подключения (replace=False), каждый элемент:
+        {"id": ..., "expression": "...", "result": "...", "float_mode": bool, "timestamp": "..."}
         """
-        self.history_box.clear()
-        for record in history_list:
-            expr = record["expression"]
-            res = record["result"]
-            # Можем при желании показать timestamp
-            self.history_box.append(f"{expr} = {res}")
+        self.result_cache.add_records(history_list)
+        if replace:
+            self.history_model.reset(history_list)
+        else:
+            self.history_model.append(history_list)
 
     def handle_new_record(self, record):
         """
-        Вызывается при новом выражении. Формат: {"expression": ..., "result": ..., "float_mode": ..., "timestamp": ...}
+        Вызывается при новом выражении. Формат: {"id": ..., "expression": ..., "result": ..., "float_mode": ...}
         """
-        expr = record["expression"]
-        res = record["result"]
-        self.history_box.append(f"{expr} = {res}")
+        self.result_cache.add_records([record])
+        self.history_model.append([record])
+
+    # ========== История: прокрутка и подгрузка страниц ==========
+
+    def load_history_page(self, cursor: int, backward: bool):
+        worker = HistoryPageWorker(cursor, backward, self.history_model.generation)
+        worker.page_ready.connect(self.history_model.add_page)
+        worker.failed.connect(self.history_model.page_failed)
+        worker.finished.connect(lambda: self.page_workers.discard(worker))
+        self.page_workers.add(worker)
+        worker.start()
+
+    def on_history_scrolled(self, value):
+        if value == self.history_box.verticalScrollBar().minimum():
+            self.history_model.request_older()
+
+    def on_history_rows_about_to_be_inserted(self, parent, first, last):
+        # Запоминаем, был ли список прокручен до конца и какая строка видна сверху
+        bar = self.history_box.verticalScrollBar()
+        self.history_follow = bar.value() == bar.maximum()
+        top = self.history_box.indexAt(QPoint(0, 0))
+        self.history_top_row = top.row() if top.isValid() else 0
+
+    def on_history_rows_inserted(self, parent, first, last):
+        inserted = last - first + 1
+        if first == 0 and self.history_model.rowCount() > inserted:
+            # Страница старых записей сверху: та же запись остаётся первой видимой
+            self.history_box.scrollTo(self.history_model.index(self.history_top_row + inserted),
+                                      QAbstractItemView.PositionAtTop)
+        elif self.history_follow:
+            self.history_box.scrollToBottom()
 
     def closeEvent(self, event):
         """
         Когда окно закрывается, рвём WS-подключение, чтобы корректно освободить ресурсы.
         """
+        self.local_evaluator.close()
+        self.calc_client.close()  # До закрытия WS: незавершённые запросы не переотправляются по HTTP
         self.ws_client.close()
+        for worker in list(self.page_workers):
+            worker.wait()
         super().closeEvent(event)
 
 
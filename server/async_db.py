@@ -0,0 +1,93 @@
+# server/async_db.py
+
+import os
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import database
+
+# Число потоков (и соединений) для чтения истории
+DB_READ_POOL_SIZE = int(os.environ.get("CALC_DB_READ_POOL_SIZE", 4))
+
+
+class ReadPool:
+    """
+    Пул потоков для чтения БД. У каждого потока своё соединение только для чтения,
+    поэтому в режиме WAL чтения идут параллельно друг другу и не ждут писателя истории.
+    """
+
+    def __init__(self, db_path: str, size: int = DB_READ_POOL_SIZE):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="history-reader")
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def _call(self, fn, args, kwargs):
+        return fn(self._connection(), *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Выполняет fn(conn, *args, **kwargs) в потоке чтения и возвращает результат."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, fn, args, kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
+
+# Асинхронный слой доступа к истории для обработчиков сервера.
+# Запись – через фоновый HistoryWriter (одно соединение, отдельный поток),
+# чтение – через ReadPool; в цикле событий не выполняется ни одного запроса к SQLite.
+_read_pool = None
+
+async def init(**writer_kwargs):
+    """Создаёт таблицы (в отдельном потоке), запускает писателя и пул чтения."""
+    global _read_pool
+    await asyncio.to_thread(database.init_db)
+    database.start_writer(**writer_kwargs)
+    _read_pool = ReadPool(database.DB_PATH)
+
+async def close():
+    """Останавливает пул чтения и сбрасывает очередь писателя на диск."""
+    global _read_pool
+    if _read_pool is not None:
+        await asyncio.to_thread(_read_pool.close)
+        _read_pool = None
+    await asyncio.to_thread(database.stop_writer)
+
+async def read(fn, *args, **kwargs):
+    """Выполняет fn(conn, ...) на соединении из пула чтения."""
+    return await _read_pool.run(fn, *args, **kwargs)
+
+async def get_all_records():
+    return await read(database.get_all_records)
+
+async def flush():
+    """Дожидается, пока всё поставленное в очередь писателя окажется в БД."""
+    await asyncio.to_thread(database.flush_writes)
+
+def add_record(expression: str, result: str, float_mode: bool, on_commit=None, timestamp: str = None) -> int:
+    """
+    Ставит запись в очередь писателя (не блокирует цикл событий). Возвращает id записи.
+    on_commit вызывается из потока писателя после фиксации (см. HistoryWriter.put).
+    """
+    return database.add_record(expression, result, float_mode, on_commit, timestamp)
+
+def add_records(records, on_commit=None) -> list:
+    return database.add_records(records, on_commit)
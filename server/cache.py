@@ -0,0 +1,115 @@
+# server/cache.py
+
+import os
+import time
+from collections import OrderedDict
+
+# Настройки кэша результатов (переменные окружения)
+CACHE_ENABLED = os.environ.get("CALC_CACHE_ENABLED", "1") != "0"
+CACHE_MAX_ENTRIES = int(os.environ.get("CALC_CACHE_MAX_ENTRIES", 10000))
+CACHE_MAX_BYTES = int(os.environ.get("CALC_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get("CALC_CACHE_TTL", 3600))  # секунд, 0 – без ограничения
+
+# Те же правила, что у C-вычислителя: isspace() в локали "C" и validateInput()
+C_SPACES = frozenset(" \t\n\v\f\r")
+OPERATORS = frozenset("()*+/-")
+DIGITS = frozenset("0123456789")
+
+
+def canonicalize(expression: str):
+    """
+    Приводит выражение к канонической форме: убирает пробелы, которые не влияют на разбор.
+    Пробел между двумя числами сохраняется ("1 2" – ошибка, а "12" – число).
+    Возвращает None, если в выражении есть символы, которые отверг бы validateInput().
+    """
+    out = []
+    pending_space = False
+    for c in expression:
+        if c in C_SPACES:
+            pending_space = True
+            continue
+        if c in DIGITS:
+            if pending_space and out and out[-1] in DIGITS:
+                out.append(" ")
+        elif c not in OPERATORS:
+            return None
+        pending_space = False
+        out.append(c)
+    return "".join(out)
+
+
+class ResultCache:
+    """
+    LRU-кэш успешных результатов вычисления с ограничением по числу записей, объёму и времени жизни.
+    Ключ – (каноническое выражение, float_mode). Ошибки не кэшируются: их смещение зависит от пробелов.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # ключ -> (результат, время записи)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(key, result: str) -> int:
+        return len(key[0]) + len(result)
+
+    def get(self, expression: str, float_mode: bool):
+        """Возвращает закэшированный результат или None."""
+        canonical = canonicalize(expression)
+        if canonical is None:
+            self.misses += 1
+            return None
+        key = (canonical, float_mode)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        result, stored_at = entry
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, expression: str, float_mode: bool, result: str):
+        """Сохраняет результат; при переполнении вытесняет давно не использованные записи."""
+        canonical = canonicalize(expression)
+        if canonical is None:
+            return
+        key = (canonical, float_mode)
+        size = self._entry_size(key, result)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (result, time.monotonic())
+        self.size_bytes += size
+        while len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        result, _ = self.entries.pop(key)
+        self.size_bytes -= self._entry_size(key, result)
+
+    def clear(self):
+        self.entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
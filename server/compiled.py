@@ -0,0 +1,301 @@
+# server/compiled.py
+"""
+Скомпилированные выражения: грамматика (grammar.parse) выполняется один раз, дальше выражение
+вычисляется много раз с разными значениями переменных без повторного разбора.
+
+    expr = compile("(price + tax) * qty", float_mode=False)
+    expr.evaluate({"price": 10, "tax": 2, "qty": 3})   # 36
+
+При компиляции константные подвыражения сворачиваются, а программа в обратной польской записи
+превращается в функцию Python из линейных присваиваний (без вложенных выражений, поэтому глубина
+скобок не упирается в ограничения компилятора Python). Очень длинные программы вместо этого
+исполняются интерпретатором байткода. Объекты сериализуются pickle (передаются в рабочие процессы
+без повторного разбора) и кэшируются по канонической форме выражения в ограниченном LRU-кэше.
+"""
+
+import os
+import math
+import builtins
+import operator
+from collections import OrderedDict
+
+from .grammar import (
+    ExpressionError, DIVISION_BY_ZERO, OVERFLOW, UNKNOWN_VARIABLE, WHITESPACE, DEFAULT_MAX_DEPTH, INT_MIN,
+    NUM, VAR, parse, validate, normalize, number_value, variable_offset, wrap_int,
+)
+
+# Максимальное число скомпилированных выражений в кэше
+COMPILE_CACHE_MAX_ENTRIES = int(os.environ.get("CALC_COMPILE_CACHE_MAX_ENTRIES", 1024))
+
+# Программы длиннее этого числа инструкций исполняются интерпретатором, а не генерируемой функцией
+INLINE_MAX_INSTRUCTIONS = 20000
+
+# Инструкции свёрнутой программы: ("const", значение) | ("arg", номер переменной) | (op, offset)
+CONST = "const"
+ARG = "arg"
+
+
+def _divide_int(left: int, right: int, offset: int) -> int:
+    left = wrap_int(left)
+    right = wrap_int(right)
+    if right == 0:
+        raise ExpressionError(DIVISION_BY_ZERO, offset)
+    if left == INT_MIN and right == -1:
+        raise ExpressionError(OVERFLOW, offset)
+    # Деление в C отбрасывает дробную часть (к нулю), // в Python округляет вниз
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+def _divide_float(left: float, right: float, offset: int) -> float:
+    if right == 0.0:
+        raise ExpressionError(DIVISION_BY_ZERO, offset)
+    return left / right
+
+
+def _apply(op: str, left, right, offset: int, float_mode: bool):
+    if op == "+":
+        return left + right if float_mode else wrap_int(left + right)
+    if op == "-":
+        return left - right if float_mode else wrap_int(left - right)
+    if op == "*":
+        return left * right if float_mode else wrap_int(left * right)
+    return _divide_float(left, right, offset) if float_mode else _divide_int(left, right, offset)
+
+
+def fold(program, float_mode: bool) -> tuple:
+    """
+    Сворачивает константы: операция над двумя константами заменяется её значением.
+    Операции, которые завершились бы ошибкой (деление на ноль), не сворачиваются –
+    ошибка возникает при вычислении, как у вычислителя на C.
+    """
+    code = []
+    constant = []  # для каждого элемента стека вычисления: константа ли он
+    for instruction in program.code:
+        op = instruction[0]
+        if op == NUM:
+            code.append((CONST, number_value(instruction[1], float_mode)))
+            constant.append(True)
+        elif op == VAR:
+            code.append((ARG, program.variables.index(instruction[1])))
+            constant.append(False)
+        else:
+            right_constant = constant.pop()
+            left_constant = constant.pop()
+            if left_constant and right_constant:
+                try:
+                    value = _apply(op, code[-2][1], code[-1][1], instruction[1], float_mode)
+                except ExpressionError:
+                    pass
+                else:
+                    del code[-2:]
+                    code.append((CONST, value))
+                    constant.append(True)
+                    continue
+            code.append(instruction)
+            constant.append(False)
+    return tuple(code)
+
+
+def _interpret(code: tuple, float_mode: bool, *args):
+    """Исполняет свёрнутую программу на стеке (для программ, слишком длинных для генерации функции)."""
+    stack = []
+    for op, operand in code:
+        if op == CONST:
+            stack.append(operand)
+        elif op == ARG:
+            stack.append(args[operand])
+        else:
+            right = stack.pop()
+            stack.append(_apply(op, stack.pop(), right, operand, float_mode))
+    return stack[0] if float_mode else wrap_int(stack[0])
+
+
+def _literal(value, constants: list) -> str:
+    if isinstance(value, float) and not math.isfinite(value):
+        constants.append(value)
+        return f"_c{len(constants) - 1}"
+    return f"({value!r})"
+
+
+def _generate(code: tuple, variables: tuple, float_mode: bool):
+    """
+    Генерирует функцию Python из свёрнутой программы. Каждый элемент стека – локальная переменная s<N>:
+
+        def _evaluate(v0, v1):
+            v0 = _convert(v0); v1 = _convert(v1)
+            s0 = v0 + v1
+            s0 = _wrap(s0 * (2))
+            return _wrap(s0)
+
+    В целочисленном режиме сложение и вычитание не приводятся к 32 битам после каждой операции:
+    остаток по модулю 2**32 от суммы не зависит от того, когда его брать. Приводятся результаты
+    умножения (чтобы числа не росли) и операнды деления.
+    """
+    if len(code) > INLINE_MAX_INSTRUCTIONS:
+        def function(*args):
+            return _interpret(code, float_mode, *args)
+        return function
+
+    constants = []
+    params = [f"v{i}" for i in range(len(variables))]
+    lines = [f"def _evaluate({', '.join(params)}):"]
+    lines += [f"    {param} = _convert({param})" for param in params]
+    stack = []  # операнды: литерал, v<N> или s<N>
+    for op, operand in code:
+        if op == CONST:
+            stack.append(_literal(operand, constants))
+        elif op == ARG:
+            stack.append(f"v{operand}")
+        else:
+            right = stack.pop()
+            left = stack.pop()
+            target = f"s{len(stack)}"
+            if op == "/":
+                divide = "_divide_float" if float_mode else "_divide_int"
+                lines.append(f"    {target} = {divide}({left}, {right}, {operand})")
+            elif op == "*" and not float_mode:
+                lines.append(f"    {target} = _wrap({left} * {right})")
+            else:
+                lines.append(f"    {target} = {left} {op} {right}")
+            stack.append(target)
+    lines.append(f"    return {stack[0]}" if float_mode else f"    return _wrap({stack[0]})")
+
+    namespace = {
+        "_convert": float if float_mode else operator.index,
+        "_wrap": wrap_int,
+        "_divide_int": _divide_int,
+        "_divide_float": _divide_float,
+    }
+    namespace.update((f"_c{i}", value) for i, value in enumerate(constants))
+    exec(builtins.compile("\n".join(lines), "<compiled expression>", "exec"), namespace)
+    return namespace["_evaluate"]
+
+
+class CompiledExpression:
+    """
+    Скомпилированное выражение. code – свёрнутая программа (кортеж инструкций), variables – имена
+    переменных по порядку появления. Смещения в code отсчитываются в канонической форме canonical;
+    ошибки вычисления пересчитываются в смещения исходной строки source.
+    """
+
+    __slots__ = ("source", "canonical", "float_mode", "code", "variables", "_function")
+
+    def __init__(self, source: str, canonical: str, float_mode: bool, code: tuple, variables: tuple):
+        self.source = source
+        self.canonical = canonical
+        self.float_mode = float_mode
+        self.code = code
+        self.variables = variables
+        self._function = _generate(code, variables, float_mode)
+
+    @classmethod
+    def from_program(cls, program, float_mode: bool):
+        return cls(program.source, program.source, float_mode, fold(program, float_mode), program.variables)
+
+    def with_source(self, source: str):
+        """Тот же скомпилированный код для другой записи того же выражения (без повторной генерации)."""
+        other = object.__new__(CompiledExpression)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        other.source = source
+        return other
+
+    def __reduce__(self):
+        # В рабочий процесс передаётся свёрнутая программа, функция генерируется там заново
+        return CompiledExpression, (self.source, self.canonical, self.float_mode, self.code, self.variables)
+
+    def __repr__(self):
+        return f"CompiledExpression({self.source!r}, float_mode={self.float_mode})"
+
+    def _source_offset(self, offset: int) -> int:
+        """Смещение в canonical -> смещение в source (ошибки всегда указывают на непробельный символ)."""
+        if self.source == self.canonical:
+            return offset
+        skip = sum(1 for char in self.canonical[:offset] if char != " ")
+        for position, char in enumerate(self.source):
+            if char not in WHITESPACE:
+                if not skip:
+                    return position
+                skip -= 1
+        return len(self.source)
+
+    def evaluate(self, values: dict = None):
+        """
+        Вычисляет выражение со значениями переменных values ({имя: число}).
+        Возвращает int (32-битный, как в C) или float; ошибки – ExpressionError со смещением в source.
+        """
+        try:
+            if not self.variables:
+                return self._function()
+            if values is None:
+                values = {}
+            return self._function(*map(values.__getitem__, self.variables))
+        except ExpressionError as e:
+            if self.source == self.canonical:
+                raise
+            raise ExpressionError(e.code, self._source_offset(e.offset)) from None
+        except KeyError:
+            missing = next(name for name in self.variables if name not in values)
+            raise ExpressionError(UNKNOWN_VARIABLE, variable_offset(self.source, missing)) from None
+        except TypeError:
+            raise ValueError("Variables must be integers in integer mode" if not self.float_mode
+                             else "Variables must be numbers") from None
+
+
+class CompileCache:
+    """LRU-кэш скомпилированных выражений. Ключ – (каноническое выражение, float_mode, max_depth)."""
+
+    def __init__(self, max_entries: int = COMPILE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        compiled = self.entries.get(key)
+        if compiled is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return compiled
+
+    def put(self, key, compiled: CompiledExpression):
+        self.entries[key] = compiled
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+compile_cache = CompileCache()
+
+
+def compile(expression: str, float_mode: bool = False, max_depth: int = DEFAULT_MAX_DEPTH,
+            cache: CompileCache = compile_cache) -> CompiledExpression:
+    """
+    Компилирует выражение (с переменными или без). Ошибки разбора бросаются как ExpressionError
+    со смещением в expression. cache=None – без кэша; ошибки не кэшируются.
+    """
+    canonical = normalize(expression)
+    if canonical is None:
+        validate(expression)
+    key = (canonical, float_mode, max_depth)
+    compiled = cache.get(key) if cache is not None else None
+    if compiled is None:
+        try:
+            program = parse(canonical, max_depth)
+        except ExpressionError:
+            # Смещение ошибки должно указывать в исходную строку, а не в каноническую
+            parse(expression, max_depth)
+            raise
+        compiled = CompiledExpression.from_program(program, float_mode)
+        if cache is not None:
+            cache.put(key, compiled)
+    return compiled if compiled.source == expression else compiled.with_source(expression)
@@ -2,48 +2,580 @@
 
 import sqlite3
 import os
+import time
+import fcntl
+import queue
+import functools
+import threading
 from datetime import datetime
 
+import structlog
+
+from . import search
+from .metrics import ERRORS, DB_COMMIT_SECONDS, DB_COMMITTED_RECORDS
+
 DB_PATH = os.path.join(os.getcwd(), "history.db")
 
+# Групповая запись истории (HistoryWriter).
+# Компромисс надёжности: /calc отвечает клиенту до фиксации записи на диске. При падении процесса
+# теряются записи, ещё не сброшенные в БД (не больше DB_BATCH_SIZE или DB_FLUSH_INTERVAL секунд).
+# DB_SYNCHRONOUS=NORMAL в режиме WAL не портит БД при сбое питания, но может потерять последние
+# транзакции; FULL делает fsync на каждую транзакцию (медленнее, но транзакция переживает сбой питания).
+DB_BATCH_SIZE = int(os.environ.get("CALC_DB_BATCH_SIZE", 500))
+DB_FLUSH_INTERVAL = float(os.environ.get("CALC_DB_FLUSH_INTERVAL", 0.05))  # секунд
+DB_SYNCHRONOUS = os.environ.get("CALC_DB_SYNCHRONOUS", "NORMAL")
+# Сколько секунд соединение ждёт блокировку записи (например, пока идёт VACUUM), прежде чем вернуть ошибку
+DB_BUSY_TIMEOUT = float(os.environ.get("CALC_DB_BUSY_TIMEOUT", 30))
+
+INSERT_SQL = """
+    INSERT INTO history (expression_id, result, float_mode, ts)
+    VALUES (?, ?, ?, ?)
+"""
+
+# Писатель выдаёт id заранее (в момент постановки в очередь), чтобы их можно было сразу разослать клиентам
+INSERT_WITH_ID_SQL = """
+    INSERT INTO history (id, expression_id, result, float_mode, ts)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+# Записи истории в прежнем виде (id, expression, result, float_mode, ts); ts – целое, см. from_epoch
+HISTORY_ROWS_SQL = """
+    SELECT h.id, e.expression, h.result, h.float_mode, h.ts
+    FROM history h JOIN expressions e ON e.id = h.expression_id
+"""
+
+# Индексы history. Массовый импорт удаляет их на время вставки и создаёт заново в конце
+HISTORY_INDEXES = {
+    # Для GET /history: фильтр по времени и по режиму с keyset-пагинацией по id
+    "idx_history_ts": "CREATE INDEX IF NOT EXISTS idx_history_ts ON history (ts)",
+    "idx_history_float_mode": "CREATE INDEX IF NOT EXISTS idx_history_float_mode ON history (float_mode, id)",
+    # Для GET /history/search: точный поиск по результату и записи найденных выражений, новые первыми
+    "idx_history_result": "CREATE INDEX IF NOT EXISTS idx_history_result ON history (result, id)",
+    "idx_history_expression": "CREATE INDEX IF NOT EXISTS idx_history_expression ON history (expression_id, id)",
+}
+
+# Сколько выражений искать в expressions одним запросом (ограничение на число параметров SQLite)
+EXPRESSION_LOOKUP_CHUNK = 500
+# Размер кэша id выражений у писателя истории; при переполнении кэш очищается
+EXPRESSION_CACHE_MAX_ENTRIES = 100_000
+
+logger = structlog.get_logger()
+
 def init_db():
-    """Создаёт таблицу history, если её нет."""
+    """
+    Создаёт таблицы expressions, history и history_archive и полнотекстовый индекс выражений, если их нет,
+    переводит БД в режим WAL и переносит историю из прежней схемы (см. migrate_history).
+    """
+    with sqlite3.connect(DB_PATH) as conn:
+        # Действует только для новой БД (до первой таблицы); у старой режим меняет первый VACUUM
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+    if "expression" in _history_columns(DB_PATH):
+        migrate_history(DB_PATH)
     with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                expression TEXT NOT NULL,
-                result TEXT NOT NULL,
-                float_mode BOOLEAN NOT NULL,
-                ts TEXT NOT NULL
-            )
-        """)
+        _create_tables(conn)
+        create_indexes(conn)
+        search.create_search_index(conn)
         conn.commit()
 
-def add_record(expression: str, result: str, float_mode: bool):
-    """Добавляет новую запись в таблицу."""
+def _history_columns(path: str) -> list:
+    with sqlite3.connect(path) as conn:
+        return [row[1] for row in conn.execute("PRAGMA table_info(history)")]
+
+def _create_tables(conn):
+    c = conn.cursor()
+    # Выражения хранятся один раз: записи истории ссылаются на них по id.
+    # Выражения, на которые больше нет ссылок (после переноса записей в архив), не удаляются
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS expressions (
+            id INTEGER PRIMARY KEY,
+            expression TEXT NOT NULL UNIQUE
+        )
+    """)
+    # ts – микросекунды Unix-времени (см. to_epoch/from_epoch)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            expression_id INTEGER NOT NULL REFERENCES expressions (id),
+            result TEXT NOT NULL,
+            float_mode BOOLEAN NOT NULL,
+            ts INTEGER NOT NULL
+        )
+    """)
+    # Сегменты архива истории (server/retention.py): файл columnar и диапазоны id/ts в нём.
+    # bytes – длина файла, подтверждённая вместе с удалением записей из history
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS history_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file TEXT NOT NULL,
+            rows INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL,
+            first_id INTEGER,
+            last_id INTEGER,
+            min_ts TEXT,
+            max_ts TEXT,
+            created TEXT NOT NULL
+        )
+    """)
+
+def migrate_history(path: str):
+    """
+    Переводит history прежней схемы (expression TEXT, ts TEXT в ISO 8601) в новую: выражения – в expressions,
+    ts – в микросекунды Unix-времени. id записей и счётчик AUTOINCREMENT сохраняются. Всё выполняется одной
+    транзакцией (при ошибке БД остаётся прежней), затем VACUUM возвращает освободившееся место
+    (и переводит БД в auto_vacuum=INCREMENTAL).
+    """
+    started = time.monotonic()
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    conn.create_function("to_epoch", 1, to_epoch, deterministic=True)
+    try:
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name in HISTORY_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+            conn.execute(f"DROP TABLE IF EXISTS {search.LEGACY_FTS_TABLE}")
+            conn.execute("ALTER TABLE history RENAME TO history_v1")
+            _create_tables(conn)
+            conn.execute("""
+                INSERT INTO expressions (expression)
+                SELECT expression FROM history_v1 GROUP BY expression ORDER BY MIN(id)
+            """)
+            rows = conn.execute("""
+                INSERT INTO history (id, expression_id, result, float_mode, ts)
+                SELECT h.id, e.id, h.result, h.float_mode, to_epoch(h.ts)
+                FROM history_v1 h JOIN expressions e ON e.expression = h.expression
+                ORDER BY h.id
+            """).rowcount
+            # Счётчик AUTOINCREMENT: id удалённых записей не должны выдаваться повторно
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'history_v1'").fetchone()
+            if row is not None:
+                if conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'history'",
+                                row).rowcount == 0:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('history', ?)", row)
+            conn.execute("DROP TABLE history_v1")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if rows:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logger.info("history_migrated", records=rows, pages_before=pages_before,
+                    pages_after=conn.execute("PRAGMA page_count").fetchone()[0],
+                    elapsed_s=round(time.monotonic() - started, 3))
+    finally:
+        conn.close()
+
+def create_indexes(conn):
+    for sql in HISTORY_INDEXES.values():
+        conn.execute(sql)
+
+def next_history_id(conn) -> int:
+    """Следующий свободный id истории (с учётом удалённых записей: AUTOINCREMENT не выдаёт id повторно)."""
+    row = conn.execute("""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'history'), 0),
+                   COALESCE((SELECT MAX(id) FROM history), 0))
+    """).fetchone()
+    return row[0] + 1
+
+def to_epoch(timestamp: str) -> int:
+    """ISO 8601 → микросекунды Unix-времени. Время без смещения – местное (как у datetime.now())."""
+    moment = datetime.fromisoformat(timestamp)
+    return int(moment.replace(microsecond=0).timestamp()) * 1_000_000 + moment.microsecond
+
+@functools.lru_cache(maxsize=65536)
+def _local_second(seconds: int) -> str:
+    return datetime.fromtimestamp(seconds).isoformat()
+
+def from_epoch(value: int) -> str:
+    """Микросекунды Unix-времени → ISO 8601 в местном времени, как datetime.now().isoformat()."""
+    seconds, microseconds = divmod(value, 1_000_000)
+    second = _local_second(seconds)
+    return f"{second}.{microseconds:06d}" if microseconds else second
+
+def history_rows(rows) -> list:
+    """Строки HISTORY_ROWS_SQL → кортежи (id, expression, result, float_mode, ts ISO 8601)."""
+    return [(id_, expression, result, float_mode, from_epoch(ts)) for id_, expression, result, float_mode, ts in rows]
+
+def _lookup_expressions(conn, expressions: list) -> dict:
+    ids = {}
+    for start in range(0, len(expressions), EXPRESSION_LOOKUP_CHUNK):
+        chunk = expressions[start:start + EXPRESSION_LOOKUP_CHUNK]
+        ids.update(conn.execute(
+            f"SELECT expression, id FROM expressions WHERE expression IN ({', '.join('?' * len(chunk))})", chunk
+        ))
+    return ids
+
+def intern_expressions(conn, expressions, known: dict = None) -> dict:
+    """
+    id выражений в таблице expressions: {expression: id}. Новые выражения добавляются
+    (и попадают в полнотекстовый индекс) в текущей транзакции conn.
+    known – кэш {expression: id} вызывающего: найденные в нём выражения не ищутся в БД, новые дописываются.
+    После отката транзакции кэш нужно очистить.
+    """
+    if known is None:
+        known = {}
+    ids = {}
+    missing = []
+    for expression in dict.fromkeys(expressions):
+        if expression in known:
+            ids[expression] = known[expression]
+        else:
+            missing.append(expression)
+    if missing:
+        # Вставка с OR IGNORE и один поиск вместо поиска, вставки новых и второго поиска; index_missing
+        # сам пропускает выражения, проиндексированные другим соединением после чтения last_id
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM expressions").fetchone()[0]
+        conn.executemany("INSERT OR IGNORE INTO expressions (expression) VALUES (?)", ((e,) for e in missing))
+        found = _lookup_expressions(conn, missing)
+        ids.update(found)
+        known.update(found)
+        if max(found.values()) > last_id:
+            search.index_missing(conn, last_id)
+    return ids
+
+def insert_records(conn, records, ids=None, known: dict = None) -> list:
+    """
+    Вставляет записи (expression, result, float_mode, ts в ISO 8601) в текущей транзакции conn.
+    ids – id записей (по одному на запись), без них id выдаёт SQLite; known – как в intern_expressions.
+    Возвращает список id.
+    """
+    records = list(records)
+    expression_ids = intern_expressions(conn, [record[0] for record in records], known)
+    rows = [(expression_ids[expression], result, float_mode, to_epoch(ts))
+            for expression, result, float_mode, ts in records]
+    if ids is not None:
+        conn.executemany(INSERT_WITH_ID_SQL, ((id_, *row) for id_, row in zip(ids, rows)))
+        return list(ids)
+    conn.executemany(INSERT_SQL, rows)
+    # Транзакция держит блокировку записи: AUTOINCREMENT выдал подряд идущие id, последний – last_insert_rowid
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+class _Flush:
+    """Маркер в очереди писателя: зафиксировать всё, что стоит перед ним, и выставить event."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+_STOP = object()
+
+
+class DatabaseBusyError(RuntimeError):
+    """В БД уже пишет другой процесс: запущен сервер или идёт загрузка из командной строки."""
+
+
+def lock_database(db_path: str = None):
+    """
+    Исключительная блокировка файла <db_path>.lock: её держат писатель истории сервера и загрузка
+    из командной строки, потому что оба выдают id записей сами. Возвращает открытый файл – блокировка
+    снимается при его закрытии (или при завершении процесса). Если блокировка занята – DatabaseBusyError.
+    """
+    path = db_path or DB_PATH
+    lock = open(path + ".lock", "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        raise DatabaseBusyError(f"{path} is in use by another writer (is the server running?)") from None
+    return lock
+
+
+class HistoryWriter:
+    """
+    Фоновый писатель истории. Владеет одним соединением SQLite (WAL) в отдельном потоке
+    и фиксирует записи из очереди пачками через executemany: по достижении batch_size
+    или через flush_interval секунд после первой несохранённой записи.
+    id записей выдаются при постановке в очередь: писатель – единственный, кто вставляет в history,
+    и на время работы держит блокировку lock_database.
+    О том, что записи действительно в БД, сообщает on_commit из put: его вызывает поток писателя
+    после фиксации, только с попавшими в БД записями.
+    """
+
+    def __init__(self, db_path: str = None, batch_size: int = DB_BATCH_SIZE,
+                 flush_interval: float = DB_FLUSH_INTERVAL, synchronous: str = DB_SYNCHRONOUS):
+        self.db_path = db_path or DB_PATH
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = None
+        self.next_id = None
+        self.id_lock = threading.Lock()
+        self.expression_ids = {}  # Кэш id выражений (см. intern_expressions)
+        self.committed = 0  # Число зафиксированных записей
+        self.dropped = 0    # Число записей, потерянных из-за ошибок БД
+
+    def start(self):
+        self.lock = lock_database(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            self.next_id = next_history_id(conn)
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Сбрасывает всё накопленное и останавливает поток."""
+        if self.thread:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        if self.lock:
+            self.lock.close()
+            self.lock = None
+
+    def put(self, records, on_commit=None) -> list:
+        """
+        Ставит в очередь список кортежей (expression, result, float_mode, ts). Не блокирует.
+        Возвращает выданные записям id. on_commit(committed) вызывается в потоке писателя после фиксации
+        со списком зафиксированных записей (id, expression, result, float_mode, ts); не вызывается,
+        если ни одна запись не попала в БД.
+        """
+        with self.id_lock:
+            first_id = self.next_id
+            self.next_id += len(records)
+            # Кладём в очередь под той же блокировкой, чтобы id шли в очереди по возрастанию
+            self.queue.put(([(first_id + i, *record) for i, record in enumerate(records)], on_commit))
+        return list(range(first_id, first_id + len(records)))
+
+    def reserve_ids(self, count: int) -> int:
+        """
+        Выдаёт count подряд идущих id для записей, которые вставляются мимо очереди (массовый импорт).
+        Возвращает первый из них.
+        """
+        with self.id_lock:
+            first_id = self.next_id
+            self.next_id += count
+        return first_id
+
+    def flush(self, timeout: float = None) -> bool:
+        """Ждёт, пока будет зафиксировано всё, что поставлено в очередь до вызова."""
+        marker = _Flush()
+        self.queue.put(marker)
+        return marker.event.wait(timeout)
+
+    def _insert(self, conn, records):
+        try:
+            with conn:
+                if len(self.expression_ids) > EXPRESSION_CACHE_MAX_ENTRIES:
+                    self.expression_ids.clear()
+                insert_records(conn, [record[1:] for record in records], [record[0] for record in records],
+                               self.expression_ids)
+        except sqlite3.Error:
+            # Выражения, добавленные в откаченной транзакции, есть в кэше, но не в БД
+            self.expression_ids.clear()
+            raise
+
+    def _commit(self, conn, pending):
+        """pending – пары (записи, on_commit) из put."""
+        if not pending:
+            return
+        records = [record for batch, _ in pending for record in batch]
+        committed_ids = None  # None – зафиксировано всё
+        with DB_COMMIT_SECONDS.time():
+            try:
+                self._insert(conn, records)
+            except sqlite3.Error as e:
+                ERRORS.labels(cause="db").inc()
+                logger.error("history_write_failed", error=str(e), records=len(records))
+                # Пачка откачена целиком: повторяем по одной записи, чтобы потерять только неисправимые
+                committed_ids = set()
+                for record in records:
+                    try:
+                        self._insert(conn, [record])
+                        committed_ids.add(record[0])
+                    except sqlite3.Error as e:
+                        self.dropped += 1
+                        logger.error("history_record_dropped", id=record[0], error=str(e))
+        committed = len(records) if committed_ids is None else len(committed_ids)
+        self.committed += committed
+        DB_COMMITTED_RECORDS.inc(committed)
+
+        for batch, on_commit in pending:
+            if on_commit is None:
+                continue
+            done = batch if committed_ids is None else [record for record in batch if record[0] in committed_ids]
+            if done:
+                try:
+                    on_commit(done)
+                except Exception as e:
+                    logger.exception("history_commit_callback_failed", error=str(e))
+        pending.clear()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if not pending else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self._commit(conn, pending)
+                continue
+
+            if item is _STOP:
+                self._commit(conn, pending)
+                break
+            if isinstance(item, _Flush):
+                self._commit(conn, pending)
+                item.event.set()
+                continue
+
+            if not pending:
+                deadline = time.monotonic() + self.flush_interval
+                pending_records = 0
+            pending.append(item)
+            pending_records += len(item[0])
+            if pending_records >= self.batch_size:
+                self._commit(conn, pending)
+        conn.close()
+
+
+# Писатель, запущенный сервером; без него записи пишутся синхронно, как раньше
+_writer = None
+
+def start_writer(**kwargs):
+    """Запускает фоновый писатель истории (вызывается при старте сервера)."""
+    global _writer
+    if _writer is None:
+        _writer = HistoryWriter(**kwargs)
+        _writer.start()
+    return _writer
+
+def stop_writer():
+    """Сбрасывает очередь на диск и останавливает писатель (вызывается при остановке сервера)."""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+def flush_writes(timeout: float = None) -> bool:
+    """Дожидается фиксации всех поставленных в очередь записей."""
+    return _writer.flush(timeout) if _writer is not None else True
+
+def writer_queue_depth() -> int:
+    """Число пачек, ожидающих записи фоновым писателем (0, если писатель не запущен)."""
+    return _writer.queue.qsize() if _writer is not None else 0
+
+def running_writer():
+    """Запущенный фоновый писатель или None."""
+    return _writer
+
+def _write(rows, on_commit=None) -> list:
+    if _writer is not None:
+        return _writer.put(rows, on_commit)
     with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        timestamp = datetime.now().isoformat()
-        c.execute("""
-            INSERT INTO history (expression, result, float_mode, ts)
-            VALUES (?, ?, ?, ?)
-        """, (expression, result, float_mode, timestamp))
+        ids = insert_records(conn, rows)
         conn.commit()
+    if on_commit is not None:
+        on_commit([(id_, *row) for id_, row in zip(ids, rows)])
+    return ids
+
+def add_record(expression: str, result: str, float_mode: bool, on_commit=None, timestamp: str = None) -> int:
+    """
+    Добавляет новую запись в таблицу. Возвращает её id; on_commit – как в HistoryWriter.put,
+    timestamp – время вычисления в ISO 8601 (по умолчанию – сейчас).
+    """
+    return _write([(expression, result, float_mode, timestamp or datetime.now().isoformat())], on_commit)[0]
+
+def add_records(records, on_commit=None) -> list:
+    """
+    Добавляет несколько записей одной транзакцией.
+    records – список кортежей (expression, result, float_mode). Возвращает список id.
+    """
+    timestamp = datetime.now().isoformat()
+    return _write([(expression, result, float_mode, timestamp) for expression, result, float_mode in records],
+                  on_commit)
+
+def fetch_history_since(conn, since: int = None, limit: int = 1000):
+    """
+    История для (пере)подключения WebSocket-клиента.
+    Если задан since и после него не больше limit записей – возвращает только их (дельту).
+    Иначе – последние limit записей. Возвращает (records, truncated), truncated=True,
+    если клиент получил не всё, что пропустил.
+    """
+    if since is not None:
+        delta = fetch_history_page(conn, cursor=since, limit=limit + 1)
+        if len(delta) <= limit:
+            return delta, False
+    recent = fetch_history_page(conn, limit=limit + 1, descending=True)
+    truncated = len(recent) > limit
+    return recent[:limit][::-1], truncated
+
+def _fetch_all_records(conn):
+    c = conn.cursor()
+    c.execute(f"{HISTORY_ROWS_SQL} ORDER BY h.id ASC")
+    rows = c.fetchall()
+    data = []
+    for row in rows:
+        data.append({
+            "expression": row[1],
+            "result": row[2],
+            "float_mode": bool(row[3]),
+            "timestamp": from_epoch(row[4])
+        })
+    return data
+
+def fetch_history_page(conn, cursor: int = None, limit: int = 100, descending: bool = False,
+                       since: str = None, until: str = None, float_mode: bool = None):
+    """
+    Keyset-пагинация истории: до limit записей строго после (или до, если descending) id=cursor.
+    since/until – границы ts (ISO-строки, since включительно, until – нет), float_mode – фильтр по режиму.
+    Возвращает список словарей с полем id.
+    """
+    conditions = []
+    params = []
+    if cursor is not None:
+        conditions.append("h.id < ?" if descending else "h.id > ?")
+        params.append(cursor)
+    if since is not None:
+        conditions.append("h.ts >= ?")
+        params.append(to_epoch(since))
+    if until is not None:
+        conditions.append("h.ts < ?")
+        params.append(to_epoch(until))
+    if float_mode is not None:
+        conditions.append("h.float_mode = ?")
+        params.append(float_mode)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "DESC" if descending else "ASC"
+    c = conn.execute(f"{HISTORY_ROWS_SQL} {where} ORDER BY h.id {order} LIMIT ?", (*params, limit))
+    return [
+        {"id": row[0], "expression": row[1], "result": row[2], "float_mode": bool(row[3]),
+         "timestamp": from_epoch(row[4])}
+        for row in c
+    ]
+
+def fetch_history_rows(conn, cursor: int = None, limit: int = 10000, since: str = None, until: str = None):
+    """
+    Порция истории для выгрузки: до limit кортежей (id, expression, result, float_mode, ts) с id > cursor
+    по возрастанию id, since/until – границы ts, как в fetch_history_page. Фильтр по ts не использует индекс
+    (унарный "+"): записи читаются в порядке id без сортировки, каждая порция продолжает предыдущую.
+    """
+    conditions = []
+    params = []
+    if cursor is not None:
+        conditions.append("h.id > ?")
+        params.append(cursor)
+    if since is not None:
+        conditions.append("+h.ts >= ?")
+        params.append(to_epoch(since))
+    if until is not None:
+        conditions.append("+h.ts < ?")
+        params.append(to_epoch(until))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return history_rows(conn.execute(f"{HISTORY_ROWS_SQL} {where} ORDER BY h.id LIMIT ?", (*params, limit)))
 
-def get_all_records():
-    """Возвращает ВСЮ историю (список словарей)."""
+def get_all_records(conn=None):
+    """Возвращает ВСЮ историю (список словарей). conn – готовое соединение (например, из пула чтения)."""
+    if conn is not None:
+        return _fetch_all_records(conn)
     with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("SELECT expression, result, float_mode, ts FROM history ORDER BY id ASC")
-        rows = c.fetchall()
-        data = []
-        for row in rows:
-            data.append({
-                "expression": row[0],
-                "result": row[1],
-                "float_mode": bool(row[2]),
-                "timestamp": row[3]
-            })
-        return data
+        return _fetch_all_records(conn)
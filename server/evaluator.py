@@ -0,0 +1,281 @@
+# server/evaluator.py
+
+import os
+import asyncio
+from collections import deque
+
+import structlog
+
+from . import libcalc
+from .metrics import EVALUATOR_RESTARTS
+
+APP_PATH = os.path.join("build", "app.exe")
+
+# Количество долгоживущих процессов app.exe --serve на каждый режим (int / float)
+EVAL_WORKERS = int(os.environ.get("CALC_EVAL_WORKERS", os.cpu_count() or 1))
+
+# Предел вложенности скобок (передаётся app.exe --max-depth и libcalc); None – значение по умолчанию из C
+EVAL_MAX_DEPTH = libcalc.CONFIGURED_MAX_DEPTH
+
+# Сколько ждать ответа процесса-вычислителя (секунд); зависший процесс перезапускается
+EVAL_TIMEOUT = float(os.environ.get("CALC_EVAL_TIMEOUT", 10))
+
+# Пауза между попытками перезапустить процесс, который не удаётся запустить (удваивается до максимума)
+RESTART_BACKOFF_MIN = 0.1
+RESTART_BACKOFF_MAX = 5.0
+
+# Бэкенд вычислений: "subprocess" – пул app.exe --serve, "library" – libcalc.so в процессе сервера
+EVAL_BACKEND = os.environ.get("CALC_EVAL_BACKEND", "subprocess")
+
+logger = structlog.get_logger()
+
+
+class EvaluatorError(Exception):
+    """Ошибка вычисления выражения (некорректный ввод или сбой процесса-вычислителя)."""
+
+    def __init__(self, message: str, offset: int = None):
+        super().__init__(message if offset is None else f"{message} at position {offset}")
+        self.offset = offset
+
+
+class EvaluatorWorker:
+    """
+    Один процесс app.exe в режиме --serve.
+    Запросы пишутся в stdin построчно, ответы читаются из stdout в том же порядке,
+    поэтому несколько запросов могут находиться в работе одновременно (конвейер).
+    Ответ ждётся не дольше timeout секунд; процесс, который не удаётся перезапустить, повторно
+    запускается с нарастающей паузой, а запросы к нему тем временем сразу получают EvaluatorError.
+    """
+
+    def __init__(self, cmd, timeout: float = EVAL_TIMEOUT):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.process = None
+        self.pending = deque()  # Futures ожидающих ответа запросов, в порядке отправки
+        self.reader_task = None
+        self.ready = asyncio.Event()  # Сброшен, пока процесс перезапускается
+        self.failed = None  # EvaluatorError, пока процесс не удаётся перезапустить
+        self.closing = False
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self.reader_task = asyncio.create_task(self._read_loop())
+        self.ready.set()
+
+    async def stop(self):
+        self.closing = True
+        if self.process and self.process.returncode is None:
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        if self.reader_task:
+            if not self.ready.is_set():
+                self.reader_task.cancel()  # Ждёт паузы между попытками перезапуска
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _submit(self, expressions) -> list:
+        """Отправляет выражения процессу одной записью и возвращает futures их результатов."""
+        if self.failed is not None:
+            raise self.failed
+        if not self.ready.is_set():
+            try:
+                await asyncio.wait_for(self.ready.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                raise EvaluatorError("Evaluator unavailable") from None
+            if self.failed is not None:
+                raise self.failed
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in expressions]
+        self.pending.extend(futures)
+        # Перевод строки – разделитель запросов; для парсера он всё равно пробельный символ
+        data = "".join(e.replace("\r", " ").replace("\n", " ") + "\n" for e in expressions)
+        try:
+            self.process.stdin.write(data.encode())
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            # Процесс упал – futures будут завершены с ошибкой в _read_loop
+            logger.warning("evaluator_write_failed", error=str(e))
+        return futures
+
+    async def evaluate(self, expression: str) -> str:
+        (future,) = await self._submit([expression])
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(1)
+            raise EvaluatorError("Evaluator timed out") from None
+
+    async def evaluate_many(self, expressions) -> list:
+        """Вычисляет список выражений; элемент результата – строка или EvaluatorError."""
+        futures = await self._submit(expressions)
+        if not futures:
+            return []
+        _, not_done = await asyncio.wait(futures, timeout=self.timeout)
+        if not_done:
+            # Отменённые futures _read_loop пропустит, если ответ всё же придёт
+            for future in not_done:
+                future.cancel()
+            self._timed_out(len(not_done))
+        return [
+            EvaluatorError("Evaluator timed out") if future.cancelled()
+            else future.exception() or future.result()
+            for future in futures
+        ]
+
+    def _timed_out(self, requests: int):
+        """Процесс не ответил вовремя: убиваем его, _read_loop перезапустит процесс."""
+        logger.error("evaluator_timeout", requests=requests, timeout=self.timeout)
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+
+    async def _read_loop(self):
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                break
+            future = self.pending.popleft()
+            output = line.decode().strip()
+            if future.done():
+                continue
+            if output.startswith("error"):
+                # Формат: "error <смещение> <описание>"
+                _, offset, message = output.split(" ", 2)
+                future.set_exception(EvaluatorError(message, int(offset)))
+            else:
+                future.set_result(output)
+
+        # stdout закрыт: процесс завершился
+        self.ready.clear()
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(EvaluatorError("Evaluator process crashed"))
+
+        if not self.closing:
+            returncode = await self.process.wait()
+            logger.error("evaluator_crashed", returncode=returncode)
+            EVALUATOR_RESTARTS.inc()
+            await self._restart()
+
+    async def _restart(self):
+        delay = RESTART_BACKOFF_MIN
+        while not self.closing:
+            try:
+                await self.start()
+            except Exception as e:
+                # Например, app.exe удалён или не запускается: не ждём вечно, а сразу отвечаем ошибкой
+                self.failed = EvaluatorError(f"Evaluator restart failed: {e}")
+                logger.error("evaluator_restart_failed", error=str(e), retry_in=delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESTART_BACKOFF_MAX)
+            else:
+                self.failed = None
+                return
+
+
+class EvaluatorPool:
+    """
+    Пул долгоживущих вычислителей для одного режима (int или float).
+    Каждый запрос уходит наименее загруженному процессу, упавшие процессы перезапускаются.
+    """
+
+    def __init__(self, size: int = EVAL_WORKERS, float_mode: bool = False, app_path: str = APP_PATH,
+                 max_depth: int = EVAL_MAX_DEPTH, timeout: float = EVAL_TIMEOUT):
+        cmd = [app_path, "--serve"]
+        if float_mode:
+            cmd.append("--float")
+        if max_depth is not None:
+            cmd += ["--max-depth", str(max_depth)]
+        self.workers = [EvaluatorWorker(cmd, timeout) for _ in range(max(1, size))]
+        self.next_index = 0
+
+    async def start(self):
+        for worker in self.workers:
+            await worker.start()
+
+    async def stop(self):
+        for worker in self.workers:
+            await worker.stop()
+
+    def _pick_worker(self) -> EvaluatorWorker:
+        # Наименее загруженный процесс (неперезапустившиеся – в последнюю очередь); при равной загрузке – по кругу
+        count = len(self.workers)
+        best = None
+        for offset in range(count):
+            worker = self.workers[(self.next_index + offset) % count]
+            if best is None or self._load(worker) < self._load(best):
+                best = worker
+            if not best.pending and best.failed is None:
+                break
+        self.next_index = (self.workers.index(best) + 1) % count
+        return best
+
+    @staticmethod
+    def _load(worker: EvaluatorWorker):
+        return worker.failed is not None, len(worker.pending)
+
+    async def evaluate(self, expression: str) -> str:
+        return await self._pick_worker().evaluate(expression)
+
+    async def evaluate_many(self, expressions) -> list:
+        # Весь пакет уходит одному процессу одной записью в его stdin
+        return await self._pick_worker().evaluate_many(expressions)
+
+
+class LibraryEvaluator:
+    """
+    Вычислитель на libcalc.so: выражение разбирается прямо в процессе сервера, без IPC.
+    Интерфейс совпадает с EvaluatorPool.
+    """
+
+    def __init__(self, float_mode: bool = False, lib_path: str = libcalc.LIB_PATH, max_depth: int = EVAL_MAX_DEPTH):
+        self.float_mode = float_mode
+        self.lib_path = lib_path
+        self.max_depth = max_depth
+
+    async def start(self):
+        libcalc.load_library(self.lib_path)
+
+    async def stop(self):
+        pass
+
+    async def evaluate(self, expression: str) -> str:
+        # Разбор длинного выражения не должен останавливать цикл событий: вызов уходит в поток,
+        # ctypes отпускает GIL на время вызова C-функции
+        try:
+            return await asyncio.to_thread(libcalc.evaluate, expression, self.float_mode, self.max_depth)
+        except libcalc.LibCalcError as e:
+            raise EvaluatorError(e.message, e.offset) from e
+
+    async def evaluate_many(self, expressions) -> list:
+        # Весь пакет – одним переходом в поток
+        return await asyncio.to_thread(self._evaluate_all, list(expressions))
+
+    def _evaluate_all(self, expressions: list) -> list:
+        results = []
+        for expression in expressions:
+            try:
+                results.append(libcalc.evaluate(expression, self.float_mode, self.max_depth))
+            except libcalc.LibCalcError as e:
+                results.append(EvaluatorError(e.message, e.offset))
+        return results
+
+
+def create_evaluator(float_mode: bool, backend: str = EVAL_BACKEND):
+    """Создаёт вычислитель выбранного бэкенда для режима float_mode."""
+    if backend == "library":
+        return LibraryEvaluator(float_mode=float_mode)
+    if backend == "subprocess":
+        return EvaluatorPool(float_mode=float_mode)
+    raise ValueError(f"Unknown evaluator backend: {backend}")
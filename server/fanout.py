@@ -0,0 +1,237 @@
+# server/fanout.py
+
+import os
+import json
+import time
+import asyncio
+from collections import deque
+
+import structlog
+
+from . import wire
+from .metrics import WS_BROADCAST_LAG, WS_DROPPED
+
+# Размер исходящей очереди одного WebSocket-клиента (в сообщениях)
+WS_QUEUE_SIZE = int(os.environ.get("CALC_WS_QUEUE_SIZE", 256))
+# Что делать, если очередь клиента полна:
+#   drop_oldest – выбросить самое старое сообщение;
+#   coalesce    – склеить всё ожидающее в одно сообщение {"records": [...]};
+#   disconnect  – отключить медленного клиента (он переподключится с ?since= и догонит историю).
+WS_QUEUE_POLICY = os.environ.get("CALC_WS_QUEUE_POLICY", "drop_oldest")
+
+# Окно склейки для двоичных клиентов (мс): записи, пришедшие за это время, уходят одним кадром
+WS_BATCH_WINDOW_MS = float(os.environ.get("CALC_WS_BATCH_WINDOW_MS", 5))
+
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Код закрытия WebSocket для отключённого медленного клиента ("Try Again Later")
+CLOSE_SLOW_CONSUMER = 1013
+
+logger = structlog.get_logger()
+
+
+def message_records(message: dict) -> list:
+    """Записи из сообщения рассылки: одиночная запись или пакет {"records": [...]}."""
+    return message["records"] if "records" in message else [message]
+
+
+class ClientConnection:
+    """
+    Исходящая сторона одного WebSocket-клиента: ограниченная очередь и собственная задача-отправитель.
+    Медленный клиент копит сообщения только в своей очереди и не задерживает остальных.
+    Двоичный клиент (binary=True) получает записи кадрами wire: всё, что накопилось за batch_window
+    секунд, отправляется одним кадром.
+    """
+
+    def __init__(self, ws, broadcaster, max_queue: int, policy: str, binary: bool = False,
+                 batch_window: float = WS_BATCH_WINDOW_MS / 1000):
+        self.ws = ws
+        self.broadcaster = broadcaster
+        self.max_queue = max_queue
+        self.policy = policy
+        self.binary = binary
+        self.batch_window = batch_window
+        # Тройки (сообщение, готовый кадр, время постановки в очередь);
+        # кадр – JSON-текст или, для двоичного клиента, тела записей wire.encode_records
+        self.queue = deque()
+        self.replies = deque()  # Ответы на запросы самого клиента (JSON-тексты): отправляются первыми
+        self.wakeup = asyncio.Event()
+        self.paused = True  # Пока клиенту отправляется начальная история
+        self.closed = False
+        self.dropped = 0
+        self.task = None
+
+    def start(self, last_id=None):
+        """
+        Запускает отправку после начальной истории.
+        Сообщения, накопленные за это время и уже вошедшие в историю (id <= last_id), отбрасываются.
+        """
+        if last_id is not None:
+            kept = deque()
+            for message, frame, queued_at in self.queue:
+                records = [record for record in message_records(message) if record["id"] > last_id]
+                if len(records) == len(message_records(message)):
+                    kept.append((message, frame, queued_at))
+                elif records:
+                    message = {"records": records}
+                    kept.append((message, self.encode(message), queued_at))
+            self.queue = kept
+        self.paused = False
+        self.task = asyncio.create_task(self._run())
+        self.wakeup.set()
+
+    def offer(self, message: dict, frame: str, queued_at: float = None):
+        """Ставит сообщение в очередь, не дожидаясь отправки. Применяет политику переполнения."""
+        if self.closed:
+            return
+        if queued_at is None:
+            queued_at = time.monotonic()
+        if len(self.queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                self.broadcaster.slow_disconnects += 1
+                self._detach()
+                asyncio.create_task(self._close_socket(CLOSE_SLOW_CONSUMER))
+                return
+            if self.policy == "coalesce":
+                records = [record for queued, _, _ in self.queue for record in message_records(queued)]
+                records.extend(message_records(message))
+                message = {"records": records}
+                frame = self.encode(message)
+                # Задержка склеенного сообщения считается от самого старого из склеенных
+                queued_at = self.queue[0][2] if self.queue else queued_at
+                self.broadcaster.coalesced += len(self.queue)
+                self.queue.clear()
+            else:
+                self.queue.popleft()
+                self.dropped += 1
+                self.broadcaster.dropped += 1
+                WS_DROPPED.inc()
+        self.queue.append((message, frame, queued_at))
+        if not self.paused:
+            self.wakeup.set()
+
+    def encode(self, message: dict):
+        """Кадр сообщения рассылки в кодировке этого клиента."""
+        if self.binary:
+            return wire.encode_records(message_records(message))
+        return json.dumps(message, ensure_ascii=False)
+
+    def reply(self, message: dict):
+        """
+        Ставит ответ на запрос этого клиента. Ответы идут вне очереди рассылки: они не выбрасываются
+        и не склеиваются политикой переполнения (их число ограничивает сам обработчик запросов).
+        """
+        if self.closed:
+            return
+        self.replies.append(json.dumps(message, ensure_ascii=False))
+        if not self.paused:
+            self.wakeup.set()
+
+    async def _run(self):
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.replies or self.queue:
+                    if self.replies:
+                        await self.ws.send_text(self.replies.popleft())
+                        continue
+                    if self.binary:
+                        await self._send_batch()
+                        continue
+                    _, frame, queued_at = self.queue.popleft()
+                    await self.ws.send_text(frame)
+                    WS_BROADCAST_LAG.observe(time.monotonic() - queued_at)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning("websocket_send_failed", error=str(e))
+        finally:
+            self.closed = True
+            self.broadcaster.unregister(self)
+
+    async def _send_batch(self):
+        """Ждёт batch_window и отправляет всё, что накопилось в очереди, одним двоичным кадром."""
+        if self.batch_window:
+            await asyncio.sleep(self.batch_window)
+        batch, self.queue = self.queue, deque()
+        if not batch:
+            return
+        count = sum(len(message_records(message)) for message, _, _ in batch)
+        await self.ws.send_bytes(wire.records_frame(count, [body for _, body, _ in batch]))
+        sent_at = time.monotonic()
+        for _, _, queued_at in batch:
+            WS_BROADCAST_LAG.observe(sent_at - queued_at)
+
+    def _detach(self):
+        """Снимает клиента с рассылки и останавливает отправителя."""
+        self.closed = True
+        self.broadcaster.unregister(self)
+        if self.task:
+            self.task.cancel()
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.ws.close(code=code)
+        except Exception:
+            pass
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self._detach()
+        await self._close_socket(code)
+
+
+class Broadcaster:
+    """
+    Рассылка новых вычислений всем WebSocket-клиентам.
+    Сообщение кодируется один раз для каждой кодировки (JSON и, если есть двоичные клиенты, wire)
+    и раскладывается по очередям клиентов без ожидания отправки.
+    """
+
+    def __init__(self, max_queue: int = WS_QUEUE_SIZE, policy: str = WS_QUEUE_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown WebSocket queue policy: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.clients = set()
+        self.published = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_disconnects = 0
+
+    def register(self, ws, binary: bool = False) -> ClientConnection:
+        """Регистрирует клиента. Рассылки копятся в его очереди, пока не вызван client.start()."""
+        client = ClientConnection(ws, self, self.max_queue, self.policy, binary)
+        self.clients.add(client)
+        return client
+
+    def unregister(self, client: ClientConnection):
+        self.clients.discard(client)
+
+    def publish(self, message: dict):
+        frame = json.dumps(message, ensure_ascii=False)
+        body = None
+        queued_at = time.monotonic()
+        self.published += 1
+        for client in list(self.clients):
+            if client.binary:
+                if body is None:
+                    body = wire.encode_records(message_records(message))
+                client.offer(message, body, queued_at)
+            else:
+                client.offer(message, frame, queued_at)
+
+    def stats(self) -> dict:
+        depths = [len(client.queue) for client in self.clients]
+        return {
+            "clients": len(depths),
+            "binary_clients": sum(1 for client in self.clients if client.binary),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "published": self.published,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "slow_disconnects": self.slow_disconnects,
+        }
@@ -0,0 +1,218 @@
+# server/grammar.py
+"""
+Python-порт грамматики calculator.c, дополненный именованными переменными:
+
+    expression := term (("+" | "-") term)*
+    term       := factor (("*" | "/") factor)*
+    factor     := number | variable | "(" expression ")"
+    variable   := [A-Za-z_][A-Za-z0-9_]*
+
+Выражение разбирается один раз в плоскую программу в обратной польской записи (кортеж инструкций),
+в том же порядке применения операций, что и у вычислителя на C. Разбор итеративный (явный стек уровней
+скобок, как calcParseExpressionIter), поэтому глубина вложенности не упирается в рекурсию Python.
+Коды и тексты ошибок, а также их смещения совпадают с calculator.c.
+"""
+
+import re
+
+from .evaluator import EvaluatorError
+
+# Пробельные символы isspace() из C (локаль "C")
+WHITESPACE = frozenset(" \t\n\v\f\r")
+DIGITS = frozenset("0123456789")
+OPERATORS = frozenset("+-*/")
+IDENTIFIER_START = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_")
+IDENTIFIER_CHARS = IDENTIFIER_START | DIGITS
+
+# Коды ошибок – как CalcError в calculator.h
+INVALID_CHAR = 1
+EXPECTED_NUMBER = 2
+UNARY_OPERATOR = 3
+MISSING_PAREN = 4
+DIVISION_BY_ZERO = 5
+OVERFLOW = 6
+TRAILING_INPUT = 7
+TOO_DEEP = 8
+UNKNOWN_VARIABLE = 9  # Только в Python: у вычислителя на C нет переменных
+
+ERROR_MESSAGES = {
+    INVALID_CHAR: "Invalid character",
+    EXPECTED_NUMBER: "Expected number",
+    UNARY_OPERATOR: "Unary operators are not allowed",
+    MISSING_PAREN: "Missing closing parenthesis",
+    DIVISION_BY_ZERO: "Division by zero",
+    OVERFLOW: "Integer overflow",
+    TRAILING_INPUT: "Unexpected input after expression",
+    TOO_DEEP: "Parentheses nested too deeply",
+    UNKNOWN_VARIABLE: "Unknown variable",
+}
+
+# Значение CALC_DEFAULT_MAX_DEPTH из calculator.h
+DEFAULT_MAX_DEPTH = 100000
+
+# Инструкции программы: ("num", value) | ("var", name) | (op, offset), op ∈ + - * /.
+# У "/" offset – позиция делителя (для ошибки деления на ноль), у остальных – позиция оператора.
+NUM = "num"
+VAR = "var"
+
+INT_MIN = -2 ** 31
+
+
+class ExpressionError(EvaluatorError):
+    """Ошибка разбора или вычисления выражения с кодом CalcError и смещением."""
+
+    def __init__(self, code: int, offset: int):
+        super().__init__(ERROR_MESSAGES[code], offset)
+        self.code = code
+
+
+class Program:
+    """Разобранное выражение: инструкции в обратной польской записи и имена переменных по порядку появления."""
+
+    __slots__ = ("source", "code", "variables")
+
+    def __init__(self, source: str, code: tuple, variables: tuple):
+        self.source = source
+        self.code = code
+        self.variables = variables
+
+    def __reduce__(self):
+        return Program, (self.source, self.code, self.variables)
+
+    def __repr__(self):
+        return f"Program({self.source!r})"
+
+
+def wrap_int(value: int) -> int:
+    """Приводит целое к диапазону int языка C (32 бита, с переполнением по модулю 2**32)."""
+    return (value - INT_MIN) % 2 ** 32 + INT_MIN
+
+
+def number_value(value: int, float_mode: bool):
+    """Значение числового литерала так, как его накапливает calcParseNumber / calcParseNumberF."""
+    if not float_mode:
+        return wrap_int(value)
+    if value < 2 ** 53:
+        return float(value)
+    result = 0.0
+    for digit in str(value):
+        result = result * 10.0 + float(digit)
+    return result
+
+
+def validate(source: str):
+    """Аналог calcValidate: первый недопустимый символ во всей строке – ошибка до разбора."""
+    for offset, char in enumerate(source):
+        if not (char in IDENTIFIER_CHARS or char in WHITESPACE or char in OPERATORS or char in "()"):
+            raise ExpressionError(INVALID_CHAR, offset)
+
+
+def normalize(source: str):
+    """
+    Каноническая форма выражения (ключ кэша): без пробелов, кроме одного между двумя словами
+    (числами или переменными), где пробел влияет на разбор ("1 2" – ошибка, а "12" – число).
+    Возвращает None, если в выражении есть символ, который отверг бы validate().
+    """
+    out = []
+    pending_space = False
+    for char in source:
+        if char in WHITESPACE:
+            pending_space = True
+            continue
+        if char in IDENTIFIER_CHARS:
+            if pending_space and out and out[-1] in IDENTIFIER_CHARS:
+                out.append(" ")
+        elif char not in OPERATORS and char != "(" and char != ")":
+            return None
+        pending_space = False
+        out.append(char)
+    return "".join(out)
+
+
+def variable_offset(source: str, name: str) -> int:
+    """Позиция первого вхождения переменной name в source (целым словом, а не частью другого имени)."""
+    match = re.search(rf"(?<![A-Za-z0-9_]){name}(?![A-Za-z0-9_])", source)
+    return match.start() if match else 0
+
+
+def parse(source: str, max_depth: int = DEFAULT_MAX_DEPTH) -> Program:
+    """Разбирает выражение в Program. При ошибке бросает ExpressionError с тем же смещением, что у C."""
+    validate(source)
+
+    code = []
+    variables = []
+    stack = []  # сохранённые кадры внешних уровней скобок: (add_op, mul_op, divisor_pos)
+    add_op = mul_op = None
+    divisor_pos = 0
+    length = len(source)
+    pos = 0
+
+    def skip(pos):
+        while pos < length and source[pos] in WHITESPACE:
+            pos += 1
+        return pos
+
+    while True:
+        # Множитель: число, переменная или открывающая скобка
+        pos = skip(pos)
+        char = source[pos] if pos < length else ""
+        if char == "+" or char == "-":
+            raise ExpressionError(UNARY_OPERATOR, pos)
+        if char == "(":
+            if len(stack) >= max_depth:
+                raise ExpressionError(TOO_DEEP, pos)
+            stack.append((add_op, mul_op, divisor_pos))
+            add_op = mul_op = None
+            pos += 1
+            continue
+        start = pos
+        if char in DIGITS:
+            while pos < length and source[pos] in DIGITS:
+                pos += 1
+            code.append((NUM, int(source[start:pos])))
+        elif char in IDENTIFIER_START:
+            while pos < length and source[pos] in IDENTIFIER_CHARS:
+                pos += 1
+            name = source[start:pos]
+            code.append((VAR, name))
+            if name not in variables:
+                variables.append(name)
+        else:
+            raise ExpressionError(EXPECTED_NUMBER, pos)
+
+        # Применяем множитель; если за ним ')', закрываем уровень и повторяем уровнем выше
+        while True:
+            if mul_op is not None:
+                code.append((mul_op, divisor_pos))
+            pos = skip(pos)
+            char = source[pos] if pos < length else ""
+            if char == "*" or char == "/":
+                break
+            if add_op is not None:
+                code.append(add_op)
+            if char == "+" or char == "-" or not stack:
+                break
+            if char != ")":
+                raise ExpressionError(MISSING_PAREN, pos)
+            pos += 1
+            add_op, mul_op, divisor_pos = stack.pop()
+
+        if char == "*" or char == "/":
+            operator_pos = pos
+            pos += 1
+            if char == "/":
+                pos = skip(pos)
+                divisor_pos = pos
+            else:
+                divisor_pos = operator_pos
+            mul_op = char
+        elif char == "+" or char == "-":
+            add_op = (char, pos)
+            mul_op = None
+            pos += 1
+        else:
+            break
+
+    if pos < length:
+        raise ExpressionError(TRAILING_INPUT, pos)
+    return Program(source, tuple(code), tuple(variables))
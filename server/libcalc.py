@@ -0,0 +1,82 @@
+# server/libcalc.py
+
+import os
+import ctypes
+
+LIB_PATH = os.path.join("build", "libcalc.so")
+
+# Значение CALC_DEFAULT_MAX_DEPTH из calculator.h
+DEFAULT_MAX_DEPTH = 100000
+
+# Предел вложенности скобок из CALC_MAX_DEPTH (общий для сервера и GUI); None – DEFAULT_MAX_DEPTH
+CONFIGURED_MAX_DEPTH = int(os.environ["CALC_MAX_DEPTH"]) if os.environ.get("CALC_MAX_DEPTH") else None
+
+_lib = None
+
+
+def load_library(path: str = LIB_PATH):
+    """
+    Загружает libcalc.so (один раз на процесс) и описывает сигнатуры функций.
+    """
+    global _lib
+    if _lib is None:
+        lib = ctypes.CDLL(os.path.abspath(path))
+
+        lib.evaluateInt.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_size_t)]
+        lib.evaluateInt.restype = ctypes.c_int
+
+        lib.evaluateFloat.argtypes = [
+            ctypes.c_char_p, ctypes.POINTER(ctypes.c_double), ctypes.POINTER(ctypes.c_size_t)
+        ]
+        lib.evaluateFloat.restype = ctypes.c_int
+
+        lib.evaluateIntDepth.argtypes = [
+            ctypes.c_char_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_size_t)
+        ]
+        lib.evaluateIntDepth.restype = ctypes.c_int
+
+        lib.evaluateFloatDepth.argtypes = [
+            ctypes.c_char_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_double), ctypes.POINTER(ctypes.c_size_t)
+        ]
+        lib.evaluateFloatDepth.restype = ctypes.c_int
+
+        lib.calcErrorMessage.argtypes = [ctypes.c_int]
+        lib.calcErrorMessage.restype = ctypes.c_char_p
+
+        _lib = lib
+    return _lib
+
+
+class LibCalcError(Exception):
+    """Ошибка разбора, возвращённая libcalc: код, смещение и описание."""
+
+    def __init__(self, code: int, offset: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.offset = offset
+        self.message = message
+
+
+def evaluate(expression: str, float_mode: bool = False, max_depth: int = None) -> str:
+    """
+    Вычисляет выражение в текущем процессе.
+    max_depth – предел вложенности скобок (None – DEFAULT_MAX_DEPTH).
+    Возвращает результат в том же текстовом виде, что печатает app.exe ("%d" / "%f").
+    """
+    if max_depth is None:
+        max_depth = DEFAULT_MAX_DEPTH
+    lib = load_library()
+    data = expression.encode()
+    offset = ctypes.c_size_t(0)
+
+    if float_mode:
+        value = ctypes.c_double()
+        code = lib.evaluateFloatDepth(data, max_depth, ctypes.byref(value), ctypes.byref(offset))
+    else:
+        value = ctypes.c_int()
+        code = lib.evaluateIntDepth(data, max_depth, ctypes.byref(value), ctypes.byref(offset))
+
+    if code != 0:
+        raise LibCalcError(code, offset.value, lib.calcErrorMessage(code).decode())
+
+    return "%f" % value.value if float_mode else "%d" % value.value
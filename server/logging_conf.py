@@ -1,35 +1,180 @@
 import structlog
+import atexit
 import json
+import os
 import sys
+import time
+import threading
+from collections import deque
 from pathlib import Path
 
 # Путь к файлу с логами (в папке build)
 LOG_FILE = Path("build") / "server.log"
 
-def file_json_log_processor():
+# Настройки файлового лога (переменные окружения)
+LOG_CONSOLE = os.environ.get("CALC_LOG_CONSOLE", "1") != "0"          # 0 – только файл
+LOG_QUEUE_SIZE = int(os.environ.get("CALC_LOG_QUEUE_SIZE", 10000))     # событий в очереди
+LOG_OVERFLOW = os.environ.get("CALC_LOG_OVERFLOW", "drop_new")         # drop_new | drop_oldest
+LOG_FLUSH_INTERVAL = float(os.environ.get("CALC_LOG_FLUSH_INTERVAL", 0.5))  # секунд
+LOG_MAX_BYTES = int(os.environ.get("CALC_LOG_MAX_BYTES", 50 * 1024 * 1024))  # 0 – без ротации по размеру
+LOG_ROTATE_INTERVAL = float(os.environ.get("CALC_LOG_ROTATE_INTERVAL", 0))   # секунд, 0 – без ротации по времени
+LOG_BACKUPS = int(os.environ.get("CALC_LOG_BACKUPS", 5))
+
+# Ждать места в очереди нельзя: события пишутся и из потока цикла событий сервера
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest")
+
+
+class QueueLogSink:
+    """
+    Неблокирующий приёмник JSON-логов: события кладутся в ограниченную очередь,
+    а отдельный поток пишет их пачками в один открытый файл и ротирует его
+    (server.log -> server.log.1 -> ...) по размеру и/или по времени.
+    При переполнении очереди и после close() события выбрасываются и учитываются в dropped.
+    """
+
+    def __init__(self, path=LOG_FILE, queue_size: int = LOG_QUEUE_SIZE, overflow: str = LOG_OVERFLOW,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, max_bytes: int = LOG_MAX_BYTES,
+                 rotate_interval: float = LOG_ROTATE_INTERVAL, backups: int = LOG_BACKUPS):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        self.path = Path(path)
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+
+        self.events = deque()
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.dropped = 0
+        self.file = None
+        self.opened_at = 0.0
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, event_dict: dict):
+        """Кладёт событие в очередь. Никогда не пишет в файл в вызывающем потоке."""
+        with self.condition:
+            if self.stopping or (len(self.events) >= self.queue_size and self.overflow == "drop_new"):
+                self.dropped += 1
+                return
+            if len(self.events) >= self.queue_size:
+                self.events.popleft()
+                self.dropped += 1
+            self.events.append(event_dict)
+            self.condition.notify_all()
+
+    def close(self):
+        """Дописывает очередь в файл и останавливает поток."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.opened_at = time.monotonic()
+
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                older.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._open()
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.monotonic() - self.opened_at >= self.rotate_interval
+
+    def _run(self):
+        self._open()
+        while True:
+            with self.condition:
+                if not self.events and not self.stopping:
+                    self.condition.wait(self.flush_interval)
+                batch = list(self.events)
+                self.events.clear()
+                stopping = self.stopping
+                self.condition.notify_all()
+
+            for event_dict in batch:
+                self.file.write(json.dumps(event_dict, ensure_ascii=False, default=str) + "\n")
+            if batch:
+                self.file.flush()
+                if self._should_rotate():
+                    self._rotate()
+            if stopping:
+                break
+        self.file.close()
+
+
+_sink = None
+_closed_sinks = []
+
+
+def file_json_log_processor(sink: QueueLogSink = None):
     """
-    Возвращает функцию, которая будет записывать event_dict в LOG_FILE как JSON.
+    Возвращает функцию, которая передаёт event_dict в очередь записи в LOG_FILE.
+    Сама запись в файл происходит в фоновом потоке QueueLogSink.
     """
+    global _sink
+    if sink is None:
+        if _sink is None:
+            _sink = QueueLogSink()
+            atexit.register(shutdown_logging)
+        sink = _sink
+
     def processor(logger, method_name, event_dict):
-        # Откроем файл в режиме 'append' и добавим JSON-строку
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            # Превратим event_dict в JSON-строку
-            line = json.dumps(event_dict, ensure_ascii=False)
-            f.write(line + "\n")
+        # Копия: следующие процессоры (ConsoleRenderer) изменяют event_dict
+        sink.put(dict(event_dict))
         return event_dict  # передаём дальше следующему процессору
     return processor
 
+
+def drop_event(logger, method_name, event_dict):
+    """Последний процессор, когда вывод в консоль выключен: событие уже отдано в файл."""
+    raise structlog.DropEvent
+
+
+def dropped_log_events() -> int:
+    """
+    Сколько событий не попало в файловый лог (переполнение очереди или остановка), за всё время работы
+    процесса: значение только растёт, в том числе после shutdown_logging.
+    """
+    sinks = _closed_sinks + ([_sink] if _sink is not None else [])
+    return sum(sink.dropped for sink in sinks)
+
+
+def shutdown_logging():
+    """Сбрасывает файловый лог на диск (вызывается при остановке сервера и при выходе)."""
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        # Процессор structlog держит закрытый приёмник и дальше: события после остановки считаются в нём
+        _closed_sinks.append(_sink)
+        _sink = None
+
+
 def configure_logging():
     """
     Настраивает structlog без участия стандартного logging:
-      1) Пишет JSON-строки в build/server.log
-      2) Выводит "человеко-читаемые" логи в консоль
+      1) Пишет JSON-строки в build/server.log (через фоновый поток)
+      2) Выводит "человеко-читаемые" логи в консоль (если не выключено CALC_LOG_CONSOLE=0)
     """
     structlog.configure(
         processors=[
             structlog.processors.TimeStamper(fmt="iso", utc=False),
             file_json_log_processor(),                 # Запись в файл JSON
-            structlog.dev.ConsoleRenderer()            # Вывод в консоль
+            structlog.dev.ConsoleRenderer() if LOG_CONSOLE else drop_event  # Вывод в консоль
         ],
         wrapper_class=structlog.BoundLogger,
         logger_factory=structlog.PrintLoggerFactory(file=sys.stdout),
@@ -0,0 +1,259 @@
+# server/metrics.py
+
+import time
+import bisect
+import threading
+
+# Границы корзин гистограмм длительностей, секунд (от 10 мкс до 10 с)
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, дочерние серии по значениям меток."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """
+    Монотонно растущий счётчик. Вместо inc можно задать функцию, возвращающую значение в момент сбора
+    (например, счётчик, который уже ведёт другой объект); она тоже не должна убывать.
+    """
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = None
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def set_function(self, function):
+        self.function = function
+
+    def _samples(self):
+        if self.function is not None:
+            yield "", "", self.function()
+            return
+        for key, child in list(self.children.items()):
+            yield "", _format_labels(self.labelnames, key), child.value
+
+
+class Gauge(_Metric):
+    """Текущее значение; можно задать функцию, вычисляющую значение в момент сбора."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = None
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def dec(self, amount=1):
+        self.children[()].dec(amount)
+
+    def set(self, value):
+        self.children[()].set(value)
+
+    def set_function(self, function):
+        self.function = function
+
+    def _samples(self):
+        if self.function is not None:
+            yield "", "", self.function()
+            return
+        for key, child in list(self.children.items()):
+            yield "", _format_labels(self.labelnames, key), child.value
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина – +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Контекстный менеджер: наблюдает длительность блока в гистограмме."""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами (кумулятивные счётчики в выводе, как в Prometheus)."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.children[()].observe(value)
+
+    def time(self):
+        return self.children[()].time()
+
+    def _samples(self):
+        for key, child in list(self.children.items()):
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative
+            yield "_sum", _format_labels(self.labelnames, key), total
+            yield "_count", _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате экспозиции Prometheus (version 0.0.4)."""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ========== Метрики сервера ==========
+
+REQUESTS = REGISTRY.register(Counter(
+    "calc_requests_total", "HTTP requests by endpoint", ["endpoint"]))
+ERRORS = REGISTRY.register(Counter(
+    "calc_errors_total", "Errors by cause: validation, expression, evaluator, db", ["cause"]))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "calc_stage_seconds", "Duration of request stages: parse, evaluate, broadcast", ["stage"]))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "calc_in_flight_evaluations", "Expressions currently being evaluated"))
+EVALUATOR_RESTARTS = REGISTRY.register(Counter(
+    "calc_evaluator_restarts_total", "Crashed app.exe --serve workers that were restarted"))
+DB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "calc_db_queue_depth", "Batches waiting in the history writer queue"))
+DB_COMMIT_SECONDS = REGISTRY.register(Histogram(
+    "calc_db_commit_seconds", "Duration of one history writer transaction"))
+DB_COMMITTED_RECORDS = REGISTRY.register(Counter(
+    "calc_db_committed_records_total", "History records committed by the writer"))
+HISTORY_ARCHIVED_RECORDS = REGISTRY.register(Counter(
+    "calc_history_archived_records_total", "History records moved to archive segments by the retention policy"))
+WS_CLIENTS = REGISTRY.register(Gauge(
+    "calc_ws_connected_clients", "Connected WebSocket clients"))
+WS_QUEUED = REGISTRY.register(Gauge(
+    "calc_ws_queued_messages", "Messages waiting in WebSocket client queues"))
+WS_DROPPED = REGISTRY.register(Counter(
+    "calc_ws_dropped_messages_total", "Messages dropped from full WebSocket client queues"))
+WS_BROADCAST_LAG = REGISTRY.register(Histogram(
+    "calc_ws_broadcast_lag_seconds", "Time from publish to send for one WebSocket client"))
+LOG_DROPPED = REGISTRY.register(Counter(
+    "calc_log_dropped_events_total", "Log events dropped because the log queue was full"))
+CACHE_HITS = REGISTRY.register(Counter(
+    "calc_cache_hits_total", "Result cache hits"))
+CACHE_MISSES = REGISTRY.register(Counter(
+    "calc_cache_misses_total", "Result cache misses"))
+
+# Серии стадий запроса, привязанные заранее (labels() на горячем пути не нужен)
+PARSE_SECONDS = STAGE_SECONDS.labels(stage="parse")
+EVALUATE_SECONDS = STAGE_SECONDS.labels(stage="evaluate")
+BROADCAST_SECONDS = STAGE_SECONDS.labels(stage="broadcast")
@@ -0,0 +1,318 @@
+# server/retention.py
+"""
+Политика хранения истории: записи старше CALC_RETENTION_MAX_AGE_DAYS и/или сверх
+CALC_RETENTION_MAX_ROWS последних переносятся из history в сжатые сегменты архива
+(файлы формата columnar из server/transfer.py в CALC_ARCHIVE_DIR), которые можно читать
+через iter_archive() и GET /history/archive.
+
+Фоновый поток раз в CALC_RETENTION_INTERVAL секунд переносит записи небольшими пачками
+в последний сегмент (новый – когда тот вырос до CALC_ARCHIVE_SEGMENT_MAX_BYTES):
+пачка дописывается в файл сегмента (с fsync), затем одной короткой транзакцией удаляется
+из history вместе с обновлением длины сегмента в history_archive. Между пачками – пауза,
+чтобы писатель истории не ждал блокировку. Если процесс упал между записью в файл
+и транзакцией, хвост файла сверх подтверждённой длины отрезается при следующем запуске.
+
+После переноса освобождённые страницы возвращаются ОС (PRAGMA incremental_vacuum), выполняется
+PRAGMA optimize; раз в CALC_VACUUM_INTERVAL секунд, если свободно много страниц, – полный VACUUM.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import structlog
+
+from . import database
+from .transfer import ColumnarEncoder, iter_columnar_file
+from .metrics import ERRORS, HISTORY_ARCHIVED_RECORDS
+
+# Политика (0 – ограничение не действует; обе нулевые – поток только обслуживает файл БД)
+RETENTION_MAX_AGE_DAYS = float(os.environ.get("CALC_RETENTION_MAX_AGE_DAYS", 0))
+RETENTION_MAX_ROWS = int(os.environ.get("CALC_RETENTION_MAX_ROWS", 0))
+
+RETENTION_INTERVAL = float(os.environ.get("CALC_RETENTION_INTERVAL", 600))  # секунд между проходами
+RETENTION_BATCH_SIZE = int(os.environ.get("CALC_RETENTION_BATCH_SIZE", 5000))
+RETENTION_BATCH_PAUSE = float(os.environ.get("CALC_RETENTION_BATCH_PAUSE", 0.05))  # секунд между пачками
+ARCHIVE_DIR = os.environ.get("CALC_ARCHIVE_DIR", os.path.join(os.getcwd(), "history-archive"))
+# Сегмент дописывается следующими проходами, пока не вырастет до этого размера
+ARCHIVE_SEGMENT_MAX_BYTES = int(os.environ.get("CALC_ARCHIVE_SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
+
+VACUUM_INTERVAL = float(os.environ.get("CALC_VACUUM_INTERVAL", 7 * 24 * 3600))  # 0 – без полного VACUUM
+# Полный VACUUM – только если свободные страницы составляют не меньше этой доли файла
+VACUUM_MIN_FREE_RATIO = 0.25
+# Страниц за один шаг incremental_vacuum (между шагами писатель успевает зафиксировать пачку)
+INCREMENTAL_VACUUM_PAGES = 2000
+
+logger = structlog.get_logger()
+
+
+class RetentionWorker:
+    """
+    Фоновый перенос устаревшей истории в архив. run_once() – один проход (используется и потоком).
+    """
+
+    def __init__(self, db_path: str = None, archive_dir: str = None,
+                 max_age_days: float = RETENTION_MAX_AGE_DAYS, max_rows: int = RETENTION_MAX_ROWS,
+                 interval: float = RETENTION_INTERVAL, batch_size: int = RETENTION_BATCH_SIZE,
+                 batch_pause: float = RETENTION_BATCH_PAUSE, vacuum_interval: float = VACUUM_INTERVAL,
+                 vacuum_min_free_ratio: float = VACUUM_MIN_FREE_RATIO):
+        self.db_path = db_path or database.DB_PATH
+        self.archive_dir = archive_dir or ARCHIVE_DIR
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_interval = vacuum_interval
+        self.vacuum_min_free_ratio = vacuum_min_free_ratio
+        self.stopping = threading.Event()
+        self.thread = None
+        self.last_vacuum = time.monotonic()
+        self.archived = 0  # Всего перенесено записей
+        self.runs = 0
+        self.vacuums = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_days > 0 or self.max_rows > 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="history-retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                self.run_once()
+            except (sqlite3.Error, OSError) as e:
+                ERRORS.labels(cause="db").inc()
+                logger.error("retention_failed", error=str(e))
+            self.stopping.wait(self.interval)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=database.DB_BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={database.DB_SYNCHRONOUS}")
+        return conn
+
+    def run_once(self) -> int:
+        """Переносит в архив всё, что вышло за политику, и обслуживает файл БД. Возвращает число записей."""
+        conn = self._connect()
+        try:
+            self._repair_segments(conn)
+            archived = self._archive_expired(conn) if self.enabled else 0
+            self._compact(conn)
+        finally:
+            conn.close()
+        self.runs += 1
+        return archived
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.archive_dir, name)
+
+    def _repair_segments(self, conn):
+        """Отрезает у сегментов неподтверждённый хвост и удаляет сегменты, в которые ничего не перенесено."""
+        for segment_id, name, rows, size in conn.execute(
+                "SELECT id, file, rows, bytes FROM history_archive").fetchall():
+            path = self._segment_path(name)
+            if not os.path.exists(path):
+                logger.error("archive_segment_missing", file=name, rows=rows)
+                continue
+            if not rows:
+                os.remove(path)
+                with conn:
+                    conn.execute("DELETE FROM history_archive WHERE id = ?", (segment_id,))
+            elif os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _expired_batch(self, conn, cutoff: int, last_expired_id: int) -> list:
+        """
+        Следующая пачка записей вне политики: сначала по возрасту (по индексу ts), затем по числу строк.
+        Записи – кортежи (id, expression, result, float_mode, ts в ISO 8601), как в архиве.
+        """
+        rows = []
+        if cutoff is not None:
+            rows = conn.execute(f"{database.HISTORY_ROWS_SQL} WHERE h.ts < ? ORDER BY h.ts LIMIT ?",
+                                (cutoff, self.batch_size)).fetchall()
+        if not rows and last_expired_id is not None:
+            rows = conn.execute(f"{database.HISTORY_ROWS_SQL} WHERE h.id <= ? ORDER BY h.id LIMIT ?",
+                                (last_expired_id, self.batch_size)).fetchall()
+        rows.sort()
+        return database.history_rows(rows)
+
+    def _archive_expired(self, conn) -> int:
+        cutoff = None
+        if self.max_age_days > 0:
+            cutoff = database.to_epoch((datetime.now() - timedelta(days=self.max_age_days)).isoformat())
+        # Граница по числу строк считается один раз за проход: новые записи её только сдвигают вверх
+        last_expired_id = None
+        if self.max_rows > 0:
+            row = conn.execute("SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?",
+                               (self.max_rows,)).fetchone()
+            last_expired_id = row[0] if row else None
+
+        encoder = ColumnarEncoder()
+        segment = None
+        archived = 0
+        started = time.monotonic()
+        while not self.stopping.is_set():
+            rows = self._expired_batch(conn, cutoff, last_expired_id)
+            if not rows:
+                break
+            if segment is None or segment[2] >= ARCHIVE_SEGMENT_MAX_BYTES:
+                segment = self._current_segment(conn, encoder)
+            self._archive_batch(conn, segment, encoder.encode(rows), rows)
+            archived += len(rows)
+            self.archived += len(rows)
+            HISTORY_ARCHIVED_RECORDS.inc(len(rows))
+            if self.batch_pause:
+                time.sleep(self.batch_pause)
+        if archived:
+            logger.info("history_archived", records=archived, file=segment[1],
+                        elapsed_s=round(time.monotonic() - started, 3))
+        return archived
+
+    def _current_segment(self, conn, encoder) -> list:
+        """
+        Сегмент для дописывания: последний, если он не достиг ARCHIVE_SEGMENT_MAX_BYTES, иначе новый.
+        Возвращает [id, имя файла, подтверждённая длина].
+        """
+        row = conn.execute("SELECT id, file, bytes FROM history_archive ORDER BY id DESC LIMIT 1").fetchone()
+        if row is not None and row[2] < ARCHIVE_SEGMENT_MAX_BYTES and os.path.exists(self._segment_path(row[1])):
+            return list(row)
+        return self._create_segment(conn, encoder)
+
+    def _create_segment(self, conn, encoder) -> list:
+        """Новый файл сегмента с заголовком."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = f"history-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.calc"
+        header = encoder.header()
+        with open(self._segment_path(name), "wb") as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        with conn:
+            cursor = conn.execute("INSERT INTO history_archive (file, bytes, created) VALUES (?, ?, ?)",
+                                  (name, len(header), datetime.now().isoformat()))
+        return [cursor.lastrowid, name, len(header)]
+
+    def _archive_batch(self, conn, segment: list, data: bytes, rows: list):
+        segment_id, name, size = segment
+        # Сначала данные на диске, потом удаление: при сбое между шагами записи остаются в history
+        with open(self._segment_path(name), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        timestamps = [row[4] for row in rows]
+        with conn:
+            conn.execute("""
+                UPDATE history_archive SET
+                    rows = rows + ?, bytes = ?,
+                    first_id = MIN(COALESCE(first_id, ?), ?), last_id = MAX(COALESCE(last_id, ?), ?),
+                    min_ts = MIN(COALESCE(min_ts, ?), ?), max_ts = MAX(COALESCE(max_ts, ?), ?)
+                WHERE id = ?
+            """, (len(rows), size + len(data), rows[0][0], rows[0][0], rows[-1][0], rows[-1][0],
+                  min(timestamps), min(timestamps), max(timestamps), max(timestamps), segment_id))
+            conn.executemany("DELETE FROM history WHERE id = ?", ((row[0],) for row in rows))
+        segment[2] = size + len(data)
+
+    def _compact(self, conn):
+        """Возвращает свободные страницы ОС, обновляет статистику планировщика, по расписанию – VACUUM."""
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            while not self.stopping.is_set():
+                if not conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                    break
+                conn.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})").fetchall()
+                if self.batch_pause:
+                    time.sleep(self.batch_pause)
+        conn.execute("PRAGMA optimize")
+
+        if not self.vacuum_interval or time.monotonic() - self.last_vacuum < self.vacuum_interval:
+            return
+        self.last_vacuum = time.monotonic()
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        # Полный VACUUM держит блокировку записи всё время работы – только когда он заметно уменьшит файл
+        # (или чтобы перевести старую БД в auto_vacuum=INCREMENTAL)
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if pages and (free / pages >= self.vacuum_min_free_ratio or mode != 2):
+            started = time.monotonic()
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.vacuums += 1
+            logger.info("history_vacuum", pages_before=pages, free_pages=free,
+                        elapsed_s=round(time.monotonic() - started, 3))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_age_days": self.max_age_days,
+            "max_rows": self.max_rows,
+            "runs": self.runs,
+            "archived": self.archived,
+            "vacuums": self.vacuums,
+        }
+
+
+def fetch_segments(conn, since: str = None, until: str = None) -> list:
+    """Сегменты архива, в которых могут быть записи с since <= ts < until: (file, bytes) по порядку id."""
+    return conn.execute("""
+        SELECT file, bytes FROM history_archive
+        WHERE rows > 0 AND (? IS NULL OR max_ts >= ?) AND (? IS NULL OR min_ts < ?)
+        ORDER BY first_id
+    """, (since, since, until, until)).fetchall()
+
+
+def archive_stats(conn) -> dict:
+    segments, rows, size = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(rows), 0), COALESCE(SUM(bytes), 0) FROM history_archive WHERE rows > 0"
+    ).fetchone()
+    return {"segments": segments, "records": rows, "bytes": size}
+
+
+def iter_archive(segments, since: str = None, until: str = None, archive_dir: str = None):
+    """
+    Записи архива (id, expression, result, float_mode, ts) с since <= ts < until – списками по блокам.
+    segments – результат fetch_segments(); читается только подтверждённая часть каждого файла.
+    """
+    for name, size in segments:
+        for rows in iter_columnar_file(os.path.join(archive_dir or ARCHIVE_DIR, name), size):
+            if since is not None or until is not None:
+                rows = [row for row in rows
+                        if (since is None or row[4] >= since) and (until is None or row[4] < until)]
+            if rows:
+                yield rows
+
+
+# Поток, запущенный сервером
+_worker = None
+
+def start_worker(**kwargs):
+    """Запускает фоновый перенос истории в архив, если задана политика. Возвращает поток или None."""
+    global _worker
+    if _worker is None:
+        worker = RetentionWorker(**kwargs)
+        if not worker.enabled and not worker.vacuum_interval:
+            return None
+        worker.start()
+        _worker = worker
+    return _worker
+
+def stop_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
+
+def worker_stats() -> dict:
+    return _worker.stats() if _worker is not None else {"enabled": False}
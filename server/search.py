@@ -0,0 +1,163 @@
+# server/search.py
+"""
+Поиск по истории: полнотекстовый индекс FTS5 с токенизатором trigram по тексту выражений
+(поиск подстроки и префикса, в том числе "/ 0"), B-tree индексы по result, ts, float_mode и expression_id
+(см. database.HISTORY_INDEXES) и постраничная выдача для GET /history/search.
+
+expressions_fts – FTS5 с внешним содержимым (content='expressions'): индексируется каждое выражение
+один раз, сколько бы записей истории на него ни ссылалось. Выражения из expressions не удаляются,
+поэтому индекс только пополняется – database.intern_expressions добавляет в него новые выражения
+в той же транзакции, что и запись истории. Триггеры не используются: вставка в FTS5 из триггера
+в несколько раз медленнее той же вставки пачкой.
+
+Если SQLite собран без FTS5 или без trigram (до 3.34), индекс не создаётся, а поиск подстроки
+идёт полным просмотром expressions.
+
+Перестроение индекса (после ручного изменения expressions):
+
+    PYTHONPATH=. python -m server.search rebuild [--db history.db]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+import structlog
+
+from . import database
+
+FTS_TABLE = "expressions_fts"
+# Индекс по history.expression прежней схемы (до таблицы expressions), удаляется при переносе
+LEGACY_FTS_TABLE = "history_fts"
+
+logger = structlog.get_logger()
+
+
+def search_available(conn) -> bool:
+    """Есть ли в БД полнотекстовый индекс."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)).fetchone() is not None
+
+
+def create_search_index(conn) -> bool:
+    """
+    Создаёт expressions_fts, если его нет; новый индекс сразу заполняется по существующим выражениям.
+    Возвращает False, если SQLite не поддерживает FTS5 с trigram.
+    """
+    if search_available(conn):
+        return True
+    try:
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                expression, content='expressions', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning("search_index_unavailable", error=str(e), sqlite=sqlite3.sqlite_version)
+        return False
+    if conn.execute("SELECT 1 FROM expressions LIMIT 1").fetchone() is not None:
+        rebuild_search_index(conn)
+    return True
+
+
+def rebuild_search_index(conn):
+    """Перестраивает expressions_fts целиком по содержимому expressions."""
+    started = time.monotonic()
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    logger.info("search_index_rebuilt", elapsed_s=round(time.monotonic() - started, 3))
+
+
+def index_missing(conn, after_id: int):
+    """
+    Индексирует выражения с id > after_id, которых ещё нет в индексе. Вызывается в транзакции,
+    добавившей выражения: уже проиндексированные (другим соединением) повторно не добавляются.
+    """
+    if search_available(conn):
+        conn.execute(f"""
+            INSERT INTO {FTS_TABLE}(rowid, expression)
+            SELECT id, expression FROM expressions
+            WHERE id > ? AND id NOT IN (SELECT id FROM {FTS_TABLE}_docsize WHERE id > ?)
+        """, (after_id, after_id))
+
+
+def _like_condition(column: str, text: str, template: str) -> tuple:
+    """Условие LIKE для поиска text буквально. ESCAPE – только если он нужен: с ним trigram не использует индекс."""
+    if not any(char in text for char in "\\%_"):
+        return f"{column} LIKE ?", template.format(text)
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{column} LIKE ? ESCAPE '\\'", template.format(escaped)
+
+
+def fetch_search_page(conn, query: str = None, prefix: str = None, result: str = None, cursor: int = None,
+                      limit: int = 100, since: str = None, until: str = None, float_mode: bool = None):
+    """
+    Поиск по истории, новые записи первыми: query – подстрока expression, prefix – начало expression,
+    result – точное значение результата, since/until/float_mode – как в fetch_history_page.
+    cursor – id последней записи предыдущей страницы. Возвращает список словарей с полем id.
+
+    Подстрока и префикс ищутся по expressions_fts (без учёта регистра); строки короче трёх символов
+    не дают триграмм, для них индекс просматривается целиком.
+    """
+    use_fts = search_available(conn)
+    matches = []
+    conditions = []
+    params = []
+    for text, template in ((query, "%{}%"), (prefix, "{}%")):
+        if text:
+            condition, pattern = _like_condition("expression" if use_fts else "e.expression", text, template)
+            matches.append(condition)
+            params.append(pattern)
+    if matches and use_fts:
+        # Сначала подходящие выражения по индексу, затем их записи – по idx_history_expression
+        conditions.append(f"h.expression_id IN (SELECT rowid FROM {FTS_TABLE} WHERE {' AND '.join(matches)})")
+    else:
+        conditions.extend(matches)
+    if cursor is not None:
+        conditions.append("h.id < ?")
+        params.append(cursor)
+    if result is not None:
+        conditions.append("h.result = ?")
+        params.append(result)
+    if since is not None:
+        conditions.append("h.ts >= ?")
+        params.append(database.to_epoch(since))
+    if until is not None:
+        conditions.append("h.ts < ?")
+        params.append(database.to_epoch(until))
+    if float_mode is not None:
+        conditions.append("h.float_mode = ?")
+        params.append(float_mode)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    c = conn.execute(f"{database.HISTORY_ROWS_SQL} {where} ORDER BY h.id DESC LIMIT ?", (*params, limit))
+    return [
+        {"id": row[0], "expression": row[1], "result": row[2], "float_mode": bool(row[3]),
+         "timestamp": database.from_epoch(row[4])}
+        for row in c
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=None, help="путь к history.db (по умолчанию ./history.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="перестроить полнотекстовый индекс и создать недостающие индексы history")
+    args = parser.parse_args(argv)
+
+    if args.db is not None:
+        database.DB_PATH = os.path.abspath(args.db)
+    database.init_db()
+    with sqlite3.connect(database.DB_PATH, timeout=database.DB_BUSY_TIMEOUT) as conn:
+        # Индекс перестраивается на месте, одной транзакцией: таблица не пропадает, и писатель
+        # работающего сервера только ждёт конца транзакции, а не получает ошибку
+        if not search_available(conn):
+            sys.exit("SQLite does not support FTS5 with the trigram tokenizer")
+        rebuild_search_index(conn)
+        database.create_indexes(conn)
+        conn.execute("PRAGMA optimize")
+    print("search index rebuilt", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
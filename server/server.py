@@ -1,129 +1,720 @@
 # server/server.py
 
+import os
 import json
 import asyncio
 import structlog
+from collections import OrderedDict
+from datetime import datetime
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi import WebSocket, WebSocketDisconnect
 
-from logging_conf import configure_logging
-from .database import init_db, add_record, get_all_records
+from logging_conf import configure_logging, shutdown_logging, dropped_log_events
+from . import async_db
+from .database import fetch_history_page, fetch_history_since, writer_queue_depth
+from .evaluator import EvaluatorError, create_evaluator, EVAL_BACKEND
+from .cache import ResultCache, CACHE_ENABLED
+from .streaming import iter_lines, parse_calc_item, parse_item, ordered_window, DuplexStreamingResponse
+from .fanout import Broadcaster
+from . import vectorized
+from . import transfer
+from . import retention
+from . import search
+from . import wire
+from .metrics import (
+    REGISTRY, REQUESTS, ERRORS, IN_FLIGHT, WS_CLIENTS, WS_QUEUED, DB_QUEUE_DEPTH, CACHE_HITS, CACHE_MISSES, LOG_DROPPED,
+    PARSE_SECONDS, EVALUATE_SECONDS, BROADCAST_SECONDS,
+)
 
 logger = configure_logging()
 
+# Максимальное число выражений в одном запросе POST /calc/batch
+BATCH_MAX_ITEMS = int(os.environ.get("CALC_BATCH_MAX_ITEMS", 10000))
+
+# Ограничения GET /history: максимальный размер страницы и размер порции, читаемой одним запросом к БД
+HISTORY_MAX_LIMIT = int(os.environ.get("CALC_HISTORY_MAX_LIMIT", 10000))
+HISTORY_CHUNK = 500
+
+# Сколько записей истории максимум отдаётся WebSocket-клиенту при подключении
+WS_HISTORY_LIMIT = int(os.environ.get("CALC_WS_HISTORY_LIMIT", 1000))
+
+# Сколько запросов calc одного WebSocket-клиента вычисляется одновременно; следующие ждут (клиент не читается)
+WS_MAX_INFLIGHT = int(os.environ.get("CALC_WS_MAX_INFLIGHT", 64))
+
+# Сколько последних ответов на calc помнится для повторов с тем же (session, id)
+WS_IDEMPOTENCY_KEYS = int(os.environ.get("CALC_WS_IDEMPOTENCY_KEYS", 100000))
+
+# POST /calc/stream?history=true пишет историю и рассылает её пачками такого размера
+STREAM_HISTORY_CHUNK = int(os.environ.get("CALC_STREAM_HISTORY_CHUNK", 1000))
+
 app = FastAPI()
 
-# Храним активные WebSocket'ы
-connected_clients = set()
+# Активные WebSocket'ы: у каждого своя ограниченная очередь и задача-отправитель
+broadcaster = Broadcaster()
+
+# Вычислители (пул app.exe --serve или libcalc.so): ключ – режим float
+evaluators = {}
+
+# Кэш результатов по каноническому выражению
+result_cache = ResultCache()
+
+# Метрики, которые вычисляются из уже существующей статистики в момент запроса /metrics
+WS_CLIENTS.set_function(lambda: len(broadcaster.clients))
+WS_QUEUED.set_function(lambda: broadcaster.stats()["queued"])
+DB_QUEUE_DEPTH.set_function(writer_queue_depth)
+CACHE_HITS.set_function(lambda: result_cache.stats()["hits"])
+CACHE_MISSES.set_function(lambda: result_cache.stats()["misses"])
+LOG_DROPPED.set_function(dropped_log_events)
 
 @app.on_event("startup")
 async def on_startup():
     # При старте приложения инициализируем БД
     logger.info("startup_init_db")
-    init_db()
+    await async_db.init()
+
+    # Запускаем вычислители для обоих режимов
+    for float_mode in (False, True):
+        evaluator = create_evaluator(float_mode)
+        await evaluator.start()
+        evaluators[float_mode] = evaluator
+    logger.info("startup_evaluators", backend=EVAL_BACKEND)
+
+    # Перенос устаревшей истории в архив и обслуживание файла БД (если задана политика хранения)
+    if retention.start_worker() is not None:
+        logger.info("startup_retention", **retention.worker_stats())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for evaluator in evaluators.values():
+        await evaluator.stop()
+    evaluators.clear()
+
+    await asyncio.to_thread(retention.stop_worker)
+
+    # Дописываем на диск всё, что ещё стоит в очереди писателя истории
+    await async_db.close()
+
+    # И всё, что ещё стоит в очереди файлового лога
+    await asyncio.to_thread(shutdown_logging)
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     logger.error("validation_error", detail=str(exc))
+    ERRORS.labels(cause="validation").inc()
     return JSONResponse(
         status_code=400,
         content={"error": "Invalid JSON or missing body"},
     )
 
+@app.get("/history")
+async def history_page(cursor: int = None, limit: int = 100, direction: str = "forward",
+                       since: str = None, until: str = None, float: bool = None):
+    """
+    Страница истории с keyset-пагинацией по id.
+    cursor – id последней полученной записи, direction – forward (старые → новые) или backward.
+    Ответ {"records": [...], "next_cursor": id | null} отдаётся потоком: страница читается из БД
+    порциями по HISTORY_CHUNK записей и не собирается в памяти целиком.
+    """
+    if direction not in ("forward", "backward"):
+        return JSONResponse(status_code=400, content={"error": "direction must be 'forward' or 'backward'"})
+    if not 1 <= limit <= HISTORY_MAX_LIMIT:
+        return JSONResponse(status_code=400, content={"error": f"limit must be between 1 and {HISTORY_MAX_LIMIT}"})
+    error = invalid_time_range(since, until)
+    if error is not None:
+        return error
+
+    descending = direction == "backward"
+
+    async def generate():
+        yield b'{"records":['
+        last_id = cursor
+        remaining = limit
+        first = True
+        while remaining > 0:
+            size = min(remaining, HISTORY_CHUNK)
+            chunk = await async_db.read(fetch_history_page, last_id, size, descending, since, until, float)
+            for record in chunk:
+                yield (("" if first else ",") + json.dumps(record, ensure_ascii=False)).encode("utf-8")
+                first = False
+            remaining -= len(chunk)
+            if chunk:
+                last_id = chunk[-1]["id"]
+            if len(chunk) < size:
+                break
+        # Полная страница – возможно, есть продолжение
+        next_cursor = last_id if remaining == 0 else None
+        yield f'],"next_cursor":{json.dumps(next_cursor)}}}'.encode("utf-8")
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+@app.get("/history/search")
+async def history_search(q: str = None, prefix: str = None, result: str = None, since: str = None,
+                         until: str = None, float: bool = None, cursor: int = None, limit: int = 100):
+    """
+    Поиск по истории, новые записи первыми: q – подстрока выражения (например, "/ 0"), prefix – начало
+    выражения, result – точный результат, since/until/float – как в /history.
+    cursor – next_cursor предыдущей страницы. Ответ {"records": [...], "next_cursor": id | null}.
+    """
+    if not 1 <= limit <= HISTORY_MAX_LIMIT:
+        return JSONResponse(status_code=400, content={"error": f"limit must be between 1 and {HISTORY_MAX_LIMIT}"})
+    error = invalid_time_range(since, until)
+    if error is not None:
+        return error
+    records = await async_db.read(search.fetch_search_page, q, prefix, result, cursor, limit, since, until, float)
+    next_cursor = records[-1]["id"] if len(records) == limit else None
+    return {"records": records, "next_cursor": next_cursor}
+
+def invalid_time_range(since: str, until: str):
+    """Ответ 400, если since/until – не ISO 8601, иначе None."""
+    for name, value in (("since", since), ("until", until)):
+        if value is not None:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                return JSONResponse(status_code=400, content={"error": f"Invalid {name}: expected ISO 8601"})
+    return None
+
+@app.get("/history/export")
+async def history_export(format: str = "ndjson", since: str = None, until: str = None):
+    """
+    Выгрузка истории (since <= ts < until) в формате ndjson, csv или columnar (см. server/transfer.py).
+    Отдаётся потоком: порции по EXPORT_CHUNK_ROWS записей читаются и кодируются в потоке пула чтения.
+    """
+    if format not in transfer.FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"format must be one of {', '.join(transfer.FORMATS)}"})
+    error = invalid_time_range(since, until)
+    if error is not None:
+        return error
+    encoder = transfer.ENCODERS[format]()
+
+    async def generate():
+        yield encoder.header()
+        cursor = None
+        while True:
+            data, cursor, count = await async_db.read(
+                transfer.read_encoded_chunk, encoder, cursor, transfer.EXPORT_CHUNK_ROWS, since, until
+            )
+            if data:
+                yield data
+            if count < transfer.EXPORT_CHUNK_ROWS:
+                break
+        yield encoder.footer()
+
+    filename = f"history.{encoder.extension}"
+    return StreamingResponse(generate(), media_type=encoder.media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.post("/history/import")
+async def history_import(request: Request, format: str = "ndjson"):
+    """
+    Загрузка истории из тела запроса (формат как у /history/export), тело разбирается по мере поступления.
+    Записи получают новые id после существующих; WebSocket-клиентам они не рассылаются.
+    При ошибке во входе уже зафиксированные транзакции остаются: ответ 400 с числом загруженных записей.
+    """
+    if format not in transfer.FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"format must be one of {', '.join(transfer.FORMATS)}"})
+    logger.info("history_import_started", format=format)
+
+    importer = transfer.HistoryImporter(format)
+    await asyncio.to_thread(importer.open)
+    try:
+        async for chunk in request.stream():
+            await asyncio.to_thread(importer.feed, chunk)
+        await asyncio.to_thread(importer.finish)
+    except ValueError as e:
+        ERRORS.labels(cause="validation").inc()
+        logger.error("history_import_failed", error=str(e), imported=importer.imported)
+        return JSONResponse(status_code=400, content={"error": str(e), "imported": importer.imported})
+    finally:
+        await asyncio.to_thread(importer.close)
+    logger.info("history_import_finished", imported=importer.imported)
+    return {"imported": importer.imported}
+
+@app.get("/history/archive")
+async def history_archive(format: str = "ndjson", since: str = None, until: str = None):
+    """
+    Записи, перенесённые политикой хранения в архив (since <= ts < until), в формате как у /history/export.
+    Сегменты читаются и кодируются поблочно в отдельном потоке.
+    """
+    if format not in transfer.FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"format must be one of {', '.join(transfer.FORMATS)}"})
+    error = invalid_time_range(since, until)
+    if error is not None:
+        return error
+    encoder = transfer.ENCODERS[format]()
+    segments = await async_db.read(retention.fetch_segments, since, until)
+    blocks = retention.iter_archive(segments, since, until)
+
+    def next_encoded():
+        rows = next(blocks, None)
+        return encoder.encode(rows) if rows is not None else None
+
+    async def generate():
+        yield encoder.header()
+        while (data := await asyncio.to_thread(next_encoded)) is not None:
+            yield data
+        yield encoder.footer()
+
+    return StreamingResponse(generate(), media_type=encoder.media_type)
+
+@app.get("/history/retention")
+async def history_retention():
+    """Политика хранения, статистика фонового переноса и размер архива."""
+    return {"worker": retention.worker_stats(), "archive": await async_db.read(retention.archive_stats)}
+
 @app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
-    await ws.accept()
-    connected_clients.add(ws)
+async def websocket_endpoint(ws: WebSocket, since: int = None, encoding: str = "json", session: str = None):
+    """
+    При подключении клиент получает {"history": [...], "since": since, "truncated": bool}:
+    с ?since=<id> – только записи после этого id, без него (или если пропущено больше
+    WS_HISTORY_LIMIT записей) – последние WS_HISTORY_LIMIT записей. Каждая запись несёт id.
+
+    С ?encoding=binary история и рассылка приходят двоичными кадрами (см. wire), а записи,
+    пришедшие за CALC_WS_BATCH_WINDOW_MS, склеиваются в один кадр; ответы на calc остаются JSON.
 
-    # Например, высылаем сразу всю историю из БД
-    all_records = get_all_records()  # Возвращает список dict'ов
-    await ws.send_json({"history": all_records})
+    Затем клиент может отправлять вычисления, не дожидаясь ответов на предыдущие:
+    {"type": "calc", "id": <id корреляции>, "expression": "...", "float": bool, "cache": bool,
+    "timestamp": "<ISO 8601, необязательно>"}. Ответ – {"type": "calc_result", "id": ..., "result": "...",
+    "record_id": ...} или {"type": "calc_error", "id": ..., "error": "..."}; ответы могут приходить
+    не по порядку запросов. Само вычисление, как и после POST /calc, рассылается всем клиентам.
+    timestamp – время вычисления на клиенте (например, сделанного без связи), иначе – время получения.
+
+    С ?session=<id клиента> id корреляции служит ключом идемпотентности: повтор calc с тем же id
+    (в том числе после переподключения) получает прежний ответ и не создаёт вторую запись истории.
+    """
+    if encoding not in wire.ENCODINGS:
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    binary = encoding == "binary"
+    client = broadcaster.register(ws, binary)
+    inflight = set()
+    inflight_slots = asyncio.Semaphore(WS_MAX_INFLIGHT)
 
     try:
+        # Всё, что уже получило id, должно попасть в снимок; более новое придёт рассылкой
+        await async_db.flush()
+        records, truncated = await async_db.read(fetch_history_since, since, WS_HISTORY_LIMIT)
+        if binary:
+            await ws.send_bytes(wire.history_frame(records, since, truncated))
+        else:
+            await ws.send_json({"history": records, "since": since, "truncated": truncated})
+        client.start(records[-1]["id"] if records else since)
+
         while True:
-            # Сервер ждёт сообщения (если нужно), иначе просто висит
-            msg = await ws.receive_text()
-            print("Получено сообщение:", msg)
+            try:
+                message = json.loads(await ws.receive_text())
+            except ValueError as e:
+                client.reply({"type": "error", "error": f"Invalid JSON: {e}"})
+                continue
+            if not isinstance(message, dict) or message.get("type") != "calc":
+                client.reply({"type": "error", "error": "Unknown message type, expected 'calc'"})
+                continue
+            # Не больше WS_MAX_INFLIGHT вычислений на клиента: дальше сокет не читается, пока они не завершатся
+            await inflight_slots.acquire()
+            task = asyncio.create_task(websocket_calc(client, message, session))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+            task.add_done_callback(lambda _: inflight_slots.release())
     except WebSocketDisconnect:
-        connected_clients.remove(ws)
+        pass
+    finally:
+        for task in list(inflight):
+            task.cancel()
+        await client.close()
+
+# (session, id корреляции) -> future ответа на calc; None в future – вычисление прервано, можно повторить
+calc_replies = OrderedDict()
+
+async def websocket_calc(client, message: dict, session: str = None):
+    """
+    Вычисление из WebSocket-сообщения calc: как POST /calc, ответ – клиенту с тем же id.
+    С session повтор того же id получает ответ первого вычисления (см. websocket_endpoint).
+    """
+    REQUESTS.labels(endpoint="/ws").inc()
+    correlation_id = message.get("id")
+    key = (session, correlation_id) if session is not None and correlation_id is not None else None
+    if key is None:
+        client.reply(await calc_reply(message))
+        return
+
+    while key in calc_replies:
+        reply = await asyncio.shield(calc_replies[key])
+        if reply is not None:
+            client.reply(reply)
+            return
+    done = asyncio.get_running_loop().create_future()
+    calc_replies[key] = done
+    if len(calc_replies) > WS_IDEMPOTENCY_KEYS:
+        calc_replies.popitem(last=False)
+    reply = None
+    try:
+        reply = await calc_reply(message)
+    finally:
+        # Прерванное вычисление (клиент отключился) ничего не записало – повтор выполнит его заново
+        if reply is None and calc_replies.get(key) is done:
+            del calc_replies[key]
+        done.set_result(reply)
+    client.reply(reply)
+
+async def calc_reply(message: dict) -> dict:
+    """Проверяет и выполняет calc, сохраняет результат в историю; возвращает ответ клиенту."""
+    correlation_id = message.get("id")
+    try:
+        expression, float_mode = parse_calc_item(message, False)
+        timestamp = message.get("timestamp")
+        if timestamp is not None:
+            if not isinstance(timestamp, str):
+                raise ValueError("'timestamp' must be an ISO 8601 string")
+            datetime.fromisoformat(timestamp)
+    except ValueError as e:
+        ERRORS.labels(cause="validation").inc()
+        return {"type": "calc_error", "id": correlation_id, "error": str(e)}
+    try:
+        output = await evaluate_one(expression, float_mode, bool(message.get("cache", True)) and CACHE_ENABLED)
+    except EvaluatorError as e:
+        return {"type": "calc_error", "id": correlation_id, "error": str(e)}
+    record_id = save_and_broadcast(expression, output, float_mode, timestamp)
+    return {"type": "calc_result", "id": correlation_id, "result": output, "record_id": record_id}
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus: задержки стадий, ошибки, очереди, WebSocket-клиенты."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/ws/stats")
+async def websocket_stats():
+    return broadcaster.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
 
 @app.post("/calc")
-async def calculate(request: Request, float: bool = False):
+async def calculate(request: Request, float: bool = False, cache: bool = True):
     logger.info("request_received", method="POST", url=str(request.url), float=float)
+    REQUESTS.labels(endpoint="/calc").inc()
 
     # Проверка контента
     if request.headers.get("content-type") != "application/json":
         logger.error("invalid_content_type", content_type=request.headers.get("content-type"))
+        ERRORS.labels(cause="validation").inc()
         return JSONResponse(status_code=400, content={"error": "Invalid content type, must be application/json"})
 
     try:
-        body = await request.body()
-        if not body:
-            raise ValueError("Empty body")
+        with PARSE_SECONDS.time():
+            body = await request.body()
+            if not body:
+                raise ValueError("Empty body")
 
-        expression = json.loads(body.decode("utf-8"))
-        if not isinstance(expression, str):
-            expression = str(expression)
+            expression = json.loads(body.decode("utf-8"))
+            if not isinstance(expression, str):
+                expression = str(expression)
 
     except Exception as e:
         logger.exception("invalid_json", error=str(e))
+        ERRORS.labels(cause="validation").inc()
         return JSONResponse(status_code=400, content={"error": f"Invalid JSON: {e}"})
 
-    # Собираем команду для C-приложения
-    cmd = ["./build/app.exe"]
-    if float:
-        cmd.append("--float")
+    try:
+        output = await evaluate_one(expression, float, cache and CACHE_ENABLED)
+    except EvaluatorError as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    save_and_broadcast(expression, output, float)
+    return JSONResponse(content=output)
 
-    logger.info("executing_subprocess_async", cmd=cmd, expression=expression)
+
+async def evaluate_all(expressions: list, float_mode: bool, use_cache: bool) -> list:
+    """
+    Общий путь вычисления для /calc, /calc/batch, /calc/stream и WebSocket: кэш результатов,
+    один вызов вычислителя на все промахи (учитывается в calc_in_flight_evaluations и стадии evaluate),
+    запись результатов в кэш и учёт ошибок в метриках.
+    Возвращает список того же размера: результат (строка) или исключение.
+    """
+    outputs = [result_cache.get(expression, float_mode) if use_cache else None for expression in expressions]
+    misses = [i for i, output in enumerate(outputs) if output is None]
+    if not misses:
+        return outputs
+
+    evaluator = evaluators[float_mode]
+    IN_FLIGHT.inc(len(misses))
     try:
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await process.communicate(input=expression.encode())
-
-        if process.returncode != 0:
-            logger.error("calc_error", stderr=stderr.decode().strip())
-            return JSONResponse(
-                status_code=500,
-                content={"error": stderr.decode().strip()}
-            )
+        with EVALUATE_SECONDS.time():
+            if len(misses) == 1:
+                try:
+                    evaluated = [await evaluator.evaluate(expressions[misses[0]])]
+                except EvaluatorError as e:
+                    evaluated = [e]
+            else:
+                evaluated = await evaluator.evaluate_many([expressions[i] for i in misses])
+    except Exception as e:
+        logger.exception("evaluator_error", error=str(e))
+        evaluated = [EvaluatorError(f"Evaluator error: {e}")] * len(misses)
+    finally:
+        IN_FLIGHT.dec(len(misses))
+
+    for i, output in zip(misses, evaluated):
+        if isinstance(output, Exception):
+            count_evaluation_error(output)
+        elif use_cache:
+            result_cache.put(expressions[i], float_mode, output)
+        outputs[i] = output
+    return outputs
+
 
-        output = stdout.decode().strip()
-        logger.info("calc_success", output=output)
+async def evaluate_one(expression: str, float_mode: bool, use_cache: bool) -> str:
+    """Одно выражение через evaluate_all; ошибка вычисления логируется и пробрасывается."""
+    logger.info("evaluating", expression=expression, float=float_mode)
+    (output,) = await evaluate_all([expression], float_mode, use_cache)
+    if isinstance(output, Exception):
+        logger.error("calc_error", error=str(output))
+        raise output
+    logger.info("calc_success", output=output)
+    return output
 
-        # Сохраняем в БД
-        add_record(expression, output, float)
 
-        # Рассылаем всем WebSocket-клиентам (новая корутина)
-        asyncio.create_task(broadcast_new_record(expression, output, float))
+def save_and_broadcast(expression: str, output: str, float_mode: bool, timestamp: str = None) -> int:
+    """
+    Ставит вычисление в историю (timestamp – ISO 8601, по умолчанию – сейчас); WebSocket-клиентам
+    оно рассылается после фиксации в БД. Возвращает id записи.
+    """
+    return async_db.add_record(expression, output, float_mode, broadcast_on_commit(single=True), timestamp)
 
-        return JSONResponse(content=output)
 
+@app.post("/calc/batch")
+async def calculate_batch(request: Request, float: bool = False, cache: bool = True):
+    """
+    Вычисляет массив выражений за один запрос.
+    Элемент массива – строка или объект {"expression": "...", "float": bool}; float по умолчанию берётся из query.
+    Возвращает массив того же размера: {"expression", "result"} или {"expression", "error"} для каждого элемента.
+    """
+    logger.info("batch_request_received", url=str(request.url), float=float)
+    REQUESTS.labels(endpoint="/calc/batch").inc()
+
+    if request.headers.get("content-type") != "application/json":
+        logger.error("invalid_content_type", content_type=request.headers.get("content-type"))
+        ERRORS.labels(cause="validation").inc()
+        return JSONResponse(status_code=400, content={"error": "Invalid content type, must be application/json"})
+
+    try:
+        with PARSE_SECONDS.time():
+            items = json.loads((await request.body()).decode("utf-8"))
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array")
     except Exception as e:
-        logger.exception("subprocess_error", error=str(e))
-        return JSONResponse(status_code=500, content={"error": f"Subprocess error: {e}"})
+        logger.exception("invalid_json", error=str(e))
+        ERRORS.labels(cause="validation").inc()
+        return JSONResponse(status_code=400, content={"error": f"Invalid JSON: {e}"})
+
+    if len(items) > BATCH_MAX_ITEMS:
+        ERRORS.labels(cause="validation").inc()
+        return JSONResponse(status_code=400, content={"error": f"Too many items, max {BATCH_MAX_ITEMS}"})
+
+    use_cache = cache and CACHE_ENABLED
+    results = [None] * len(items)
+    expressions = [None] * len(items)
+    modes = [float] * len(items)
+    to_evaluate = {False: [], True: []}  # режим -> индексы элементов
+
+    for i, item in enumerate(items):
+        try:
+            expression, modes[i] = parse_calc_item(item, float)
+        except ValueError as e:
+            results[i] = {"expression": item.get("expression") if isinstance(item, dict) else item, "error": str(e)}
+            ERRORS.labels(cause="validation").inc()
+            continue
+        expressions[i] = expression
+        to_evaluate[modes[i]].append(i)
+
+    # Один вызов evaluate_all (и не больше одного вызова вычислителя) на каждый режим
+    for float_mode, indices in to_evaluate.items():
+        if not indices:
+            continue
+        outputs = await evaluate_all([expressions[i] for i in indices], float_mode, use_cache)
+        for i, output in zip(indices, outputs):
+            if isinstance(output, Exception):
+                results[i] = {"expression": expressions[i], "error": str(output)}
+            else:
+                results[i] = {"expression": expressions[i], "result": output}
+
+    records = [
+        (result["expression"], result["result"], modes[i])
+        for i, result in enumerate(results) if "result" in result
+    ]
+    logger.info("batch_done", items=len(items), succeeded=len(records))
+
+    if records:
+        # Вся история пакета – одной транзакцией, рассылка – одним сообщением
+        async_db.add_records(records, broadcast_on_commit(single=False))
 
+    return JSONResponse(content=results)
 
-async def broadcast_new_record(expression: str, result: str, float_mode: bool):
-    """Рассылает всем подключённым WebSocket'ам новое вычисление и очищает мёртвые сокеты."""
-    message = {
-        "expression": expression,
-        "result": result,
-        "float_mode": float_mode,
-    }
-    to_remove = set()
 
-    for ws in connected_clients.copy():
+def count_evaluation_error(error: Exception):
+    """Ошибка в выражении (есть позиция) – причина expression, сбой вычислителя – evaluator."""
+    cause = "expression" if getattr(error, "offset", None) is not None else "evaluator"
+    ERRORS.labels(cause=cause).inc()
+
+
+@app.post("/calc/stream")
+async def calculate_stream(request: Request, float: bool = False, cache: bool = True, history: bool = False):
+    """
+    Потоковое вычисление: тело – NDJSON (по выражению на строку: JSON-строка или {"expression", "float"}),
+    ответ – NDJSON {"line", "expression", "result"} или {"line", "error"} в порядке входных строк.
+    Вход читается по мере обработки, в работе не более STREAM_MAX_IN_FLIGHT выражений,
+    поэтому память не зависит от размера задания.
+    """
+    logger.info("stream_request_received", url=str(request.url), float=float, history=history)
+    REQUESTS.labels(endpoint="/calc/stream").inc()
+
+    if request.headers.get("content-type") != "application/x-ndjson":
+        logger.error("invalid_content_type", content_type=request.headers.get("content-type"))
+        ERRORS.labels(cause="validation").inc()
+        return JSONResponse(status_code=400, content={"error": "Invalid content type, must be application/x-ndjson"})
+
+    use_cache = cache and CACHE_ENABLED
+
+    async def numbered_lines():
+        lineno = 0
+        async for line in iter_lines(request.stream()):
+            lineno += 1
+            if isinstance(line, Exception) or line.strip():
+                yield lineno, line
+
+    async def process(numbered):
+        # Возвращает (строка ответа, запись для истории или None)
+        lineno, line = numbered
+        if isinstance(line, Exception):
+            ERRORS.labels(cause="validation").inc()
+            return {"line": lineno, "error": str(line)}, None
         try:
-            await ws.send_json(message)
-        except Exception as e:
-            logger.warning("websocket_broadcast_failed", error=str(e))
-            to_remove.add(ws)
+            expression, float_mode = parse_item(line, float)
+        except json.JSONDecodeError as e:
+            ERRORS.labels(cause="validation").inc()
+            return {"line": lineno, "error": f"Invalid JSON: {e}"}, None
+        except ValueError as e:
+            ERRORS.labels(cause="validation").inc()
+            return {"line": lineno, "error": str(e)}, None
+        (output,) = await evaluate_all([expression], float_mode, use_cache)
+        if isinstance(output, Exception):
+            return {"line": lineno, "expression": expression, "error": str(output)}, None
+        return {"line": lineno, "expression": expression, "result": output}, (expression, output, float_mode)
+
+    def flush_history(records):
+        async_db.add_records(records, broadcast_on_commit(single=False))
+
+    async def generate():
+        records = []
+        count = 0
+        async for payload, record in ordered_window(numbered_lines(), process):
+            count += 1
+            if history and record:
+                records.append(record)
+                if len(records) >= STREAM_HISTORY_CHUNK:
+                    flush_history(records)
+                    records = []
+            yield (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        if records:
+            flush_history(records)
+        logger.info("stream_done", lines=count)
+
+    return DuplexStreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.post("/calc/vector")
+async def calculate_vector(request: Request, expression: str = None, float: bool = False):
+    """
+    Вычисляет одно выражение с переменными над столбцами: выражение разбирается один раз,
+    вычисление идёт над всеми строками сразу (NumPy). Тело запроса:
+      application/json – {"expression": "(a + b) * 2 - c", "columns": {"a": [...], ...}, "float": bool};
+      text/csv         – таблица с заголовком, выражение в ?expression=;
+      application/x-npz – архив np.savez, выражение в ?expression=.
+    Ответ: {"rows": n, "results": [...], "errors": [{"row", "error"}]}, в строке с ошибкой результат null.
+    История и рассылка для векторных вычислений не ведутся.
+    """
+    logger.info("vector_request_received", url=str(request.url), float=float)
+    REQUESTS.labels(endpoint="/calc/vector").inc()
+
+    if vectorized.np is None:
+        return JSONResponse(status_code=501, content={"error": "NumPy is not installed"})
+
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip()
+    try:
+        with PARSE_SECONDS.time():
+            body = await request.body()
+            if content_type == "application/json":
+                payload = json.loads(body.decode("utf-8"))
+                if not isinstance(payload, dict) or not isinstance(payload.get("columns"), dict):
+                    raise ValueError('Expected {"expression": ..., "columns": {...}}')
+                expression = payload.get("expression", expression)
+                float = bool(payload.get("float", float))
+                columns = payload["columns"]
+                if not all(isinstance(column, list) for column in columns.values()):
+                    raise ValueError("Columns must be arrays")
+            elif content_type == "text/csv":
+                columns = await asyncio.to_thread(vectorized.load_csv, body)
+            elif content_type == "application/x-npz":
+                columns = await asyncio.to_thread(vectorized.load_npz, body)
+            else:
+                raise ValueError("Content type must be application/json, text/csv or application/x-npz")
+            if not isinstance(expression, str):
+                raise ValueError("Expression must be a string")
+    except Exception as e:
+        logger.error("invalid_vector_request", error=str(e))
+        ERRORS.labels(cause="validation").inc()
+        return JSONResponse(status_code=400, content={"error": f"Invalid request: {e}"})
+
+    if max((len(column) for column in columns.values()), default=0) > vectorized.VECTOR_MAX_ROWS:
+        ERRORS.labels(cause="validation").inc()
+        return JSONResponse(status_code=400, content={"error": f"Too many rows, max {vectorized.VECTOR_MAX_ROWS}"})
+
+    try:
+        with EVALUATE_SECONDS.time():
+            result = await asyncio.to_thread(vectorized.evaluate_columns, expression, columns, float)
+    except EvaluatorError as e:
+        count_evaluation_error(e)
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except ValueError as e:
+        ERRORS.labels(cause="validation").inc()
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    errors = result.errors()
+    if errors:
+        ERRORS.labels(cause="expression").inc(len(errors))
+    values = result.values.tolist()
+    for row, _ in errors:
+        values[row] = None
+    logger.info("vector_done", rows=len(values), errors=len(errors))
+    return JSONResponse(content={
+        "rows": len(values),
+        "results": values,
+        "errors": [{"row": row, "error": message} for row, message in errors],
+    })
+
+
+def broadcast_on_commit(single: bool):
+    """
+    Колбэк on_commit для async_db.add_record(s): новые вычисления рассылаются WebSocket-клиентам только
+    после фиксации в БД, поэтому клиенты не увидят записей, которых нет в истории.
+    Писатель вызывает его в своём потоке – публикация передаётся в цикл событий.
+    single – одиночная запись рассылается как есть, иначе одним сообщением {"records": [...]}.
+    """
+    loop = asyncio.get_running_loop()
+
+    def on_commit(committed):
+        loop.call_soon_threadsafe(broadcast_committed, committed, single)
+    return on_commit
+
 
-    connected_clients.difference_update(to_remove)
\ No newline at end of file
+def broadcast_committed(committed, single: bool):
+    """Ставит зафиксированные записи (id, expression, result, float_mode, ts) в очереди всех WebSocket'ов."""
+    records = [
+        {"id": record_id, "expression": expression, "result": result, "float_mode": float_mode}
+        for record_id, expression, result, float_mode, _ in committed
+    ]
+    with BROADCAST_SECONDS.time():
+        broadcaster.publish(records[0] if single and len(records) == 1 else {"records": records})
@@ -0,0 +1,112 @@
+# server/streaming.py
+
+import os
+import json
+import asyncio
+from collections import deque
+
+from starlette.requests import ClientDisconnect
+from fastapi.responses import StreamingResponse
+
+# Максимум одновременно вычисляемых строк одного потока
+STREAM_MAX_IN_FLIGHT = int(os.environ.get("CALC_STREAM_MAX_IN_FLIGHT", 256))
+# Максимальная длина одной строки NDJSON (байт); более длинные строки отвергаются целиком
+STREAM_MAX_LINE_BYTES = int(os.environ.get("CALC_STREAM_MAX_LINE_BYTES", 1024 * 1024))
+
+
+class LineTooLong(Exception):
+    """Строка входного потока длиннее STREAM_MAX_LINE_BYTES."""
+
+
+async def iter_lines(chunks, max_line_bytes: int = STREAM_MAX_LINE_BYTES):
+    """
+    Разбивает асинхронный поток байтовых кусков на строки, не накапливая весь поток в памяти.
+    Вместо слишком длинной строки отдаёт исключение LineTooLong (как элемент, а не raise),
+    остаток такой строки пропускается до следующего перевода строки.
+    """
+    buffer = bytearray()
+    skipping = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if not skipping:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        buffer.clear()
+                        skipping = True
+                        yield LineTooLong(f"Line exceeds {max_line_bytes} bytes")
+                break
+            if skipping:
+                skipping = False
+            else:
+                buffer += chunk[start:end]
+                if len(buffer) > max_line_bytes:
+                    yield LineTooLong(f"Line exceeds {max_line_bytes} bytes")
+                else:
+                    yield bytes(buffer)
+            buffer.clear()
+            start = end + 1
+    if buffer and not skipping:
+        yield bytes(buffer)
+
+
+def parse_calc_item(item, default_float: bool):
+    """
+    Элемент запроса на вычисление (пакет, поток, WebSocket): строка или объект
+    {"expression": "...", "float": bool}. float – только JSON-булево ("false" или 0 – ошибка).
+    Возвращает (expression, float_mode); при ошибке бросает ValueError.
+    """
+    float_mode = default_float
+    if isinstance(item, dict):
+        float_mode = item.get("float", default_float)
+        item = item.get("expression")
+        if not isinstance(float_mode, bool):
+            raise ValueError("'float' must be a boolean")
+    if not isinstance(item, str):
+        raise ValueError("Expression must be a string")
+    return item, float_mode
+
+
+def parse_item(line: bytes, default_float: bool):
+    """Разбирает строку NDJSON (см. parse_calc_item); при ошибке бросает ValueError."""
+    return parse_calc_item(json.loads(line), default_float)
+
+
+async def ordered_window(items, process, max_in_flight: int = STREAM_MAX_IN_FLIGHT):
+    """
+    Запускает process(item) для элементов асинхронного итератора items, держа в работе
+    не более max_in_flight задач, и отдаёт результаты в исходном порядке по мере готовности.
+    Новые элементы читаются только когда есть место в окне – это и есть обратное давление.
+    """
+    in_flight = deque()
+    try:
+        async for item in items:
+            in_flight.append(asyncio.ensure_future(process(item)))
+            # Отдаём уже готовые результаты, не дожидаясь заполнения окна
+            while in_flight and (in_flight[0].done() or len(in_flight) >= max_in_flight):
+                yield await in_flight.popleft()
+        while in_flight:
+            yield await in_flight.popleft()
+    finally:
+        # Клиент отключился или поток прерван – незавершённые вычисления больше не нужны
+        for task in in_flight:
+            task.cancel()
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse, который можно отдавать, пока тело запроса ещё читается.
+    Обычный StreamingResponse (ASGI < 2.4) параллельно слушает receive() в ожидании отключения
+    клиента и забирает себе куски тела запроса. Здесь отключение замечается по ошибке send()
+    или по ClientDisconnect при чтении тела.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
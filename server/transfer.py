@@ -0,0 +1,561 @@
+# server/transfer.py
+"""
+Массовая выгрузка и загрузка истории в потоковых форматах:
+
+    ndjson   – одна запись JSON на строку, поля как у GET /history;
+    csv      – заголовок id,expression,result,float_mode,timestamp;
+    columnar – сжатый поколоночный формат (ниже), самый компактный и быстрый.
+
+Выгрузка читает history порциями по id (keyset), загрузка разбирает вход по мере поступления
+и вставляет записи executemany большими транзакциями; если БД не обслуживает сервер, индексы
+на время загрузки удаляются и создаются заново в конце. Память не зависит от размера истории.
+
+Формат columnar: заголовок COLUMNAR_MAGIC, затем блоки. Блок – "<II" (число строк, размер тела)
+и тело из пяти столбцов, каждый – "<I" (размер) и данные, сжатые zlib:
+    id         – int64: первый id, затем разности соседних;
+    float_mode – по байту на строку;
+    expression, result, timestamp – строки UTF-8: байт 0 и строки через "\\0" или, если в какой-то
+                 строке есть "\\0", байт 1, uint32 длины строк в байтах, затем сами строки подряд.
+Все числа – little-endian.
+
+Командная строка (загрузка отказывается работать, пока БД держит запущенный сервер – тогда
+POST /history/import, чтобы id загруженных записей не совпали с уже выданными писателем):
+
+    PYTHONPATH=. python -m server.transfer export --format columnar --since 2024-01-01 -o history.calc
+    PYTHONPATH=. python -m server.transfer import --format columnar history.calc
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import zlib
+import codecs
+import struct
+import sqlite3
+import argparse
+from array import array
+from itertools import accumulate
+from collections import deque
+from datetime import datetime
+
+from . import database
+
+# Записей в одной порции выгрузки (и в одном блоке columnar)
+EXPORT_CHUNK_ROWS = int(os.environ.get("CALC_EXPORT_CHUNK_ROWS", 50000))
+# Записей в одной транзакции загрузки
+IMPORT_TRANSACTION_ROWS = int(os.environ.get("CALC_IMPORT_TRANSACTION_ROWS", 200000))
+# Размер куска, которым читается файл при загрузке из командной строки
+READ_SIZE = 1024 * 1024
+
+COLUMNAR_MAGIC = b"CALCHIST1\n"
+BLOCK_HEADER = struct.Struct("<II")
+COLUMN_HEADER = struct.Struct("<I")
+
+CSV_FIELDS = ["id", "expression", "result", "float_mode", "timestamp"]
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def make_record(expression, result, float_mode, timestamp, number: int) -> tuple:
+    """
+    Проверяет поля загружаемой записи и возвращает кортеж (expression, result, float_mode, ts).
+    number – номер записи во входе (для сообщения об ошибке).
+    """
+    if not isinstance(expression, str) or not isinstance(result, str):
+        raise ValueError(f"Record {number}: expression and result must be strings")
+    if not isinstance(float_mode, bool):
+        raise ValueError(f"Record {number}: float_mode must be a boolean")
+    try:
+        datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        raise ValueError(f"Record {number}: invalid timestamp, expected ISO 8601") from None
+    return expression, result, float_mode, timestamp
+
+
+def check_timestamps(timestamps, first_number: int):
+    """Проверка make_record для столбца ts целиком (разбор в цикле C)."""
+    try:
+        deque(map(datetime.fromisoformat, timestamps), maxlen=0)
+    except (TypeError, ValueError):
+        for number, timestamp in enumerate(timestamps, first_number):
+            make_record("", "", False, timestamp, number)
+
+
+class Encoder:
+    """Кодировщик выгрузки: header(), затем encode(rows) на каждую порцию, затем footer()."""
+
+    media_type = "application/octet-stream"
+    extension = "bin"
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, rows) -> bytes:
+        raise NotImplementedError
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class NdjsonEncoder(Encoder):
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    # Строки кодируются по отдельности: без промежуточного словаря на каждую запись
+    _string = json.JSONEncoder(ensure_ascii=False).encode
+
+    def encode(self, rows) -> bytes:
+        string = self._string
+        return "".join(
+            f'{{"id": {row[0]}, "expression": {string(row[1])}, "result": {string(row[2])}, '
+            f'"float_mode": {"true" if row[3] else "false"}, "timestamp": {string(row[4])}}}\n'
+            for row in rows
+        ).encode("utf-8")
+
+
+class CsvEncoder(Encoder):
+    media_type = "text/csv"
+    extension = "csv"
+
+    def _rows(self, rows) -> bytes:
+        out = io.StringIO()
+        csv.writer(out, lineterminator="\n").writerows(rows)
+        return out.getvalue().encode("utf-8")
+
+    def header(self) -> bytes:
+        return self._rows([CSV_FIELDS])
+
+    def encode(self, rows) -> bytes:
+        return self._rows((row[0], row[1], row[2], int(row[3]), row[4]) for row in rows)
+
+
+class ColumnarEncoder(Encoder):
+    media_type = "application/x-calc-history"
+    extension = "calc"
+
+    def header(self) -> bytes:
+        return COLUMNAR_MAGIC
+
+    @staticmethod
+    def _strings(values) -> bytes:
+        joined = "\0".join(values)
+        if joined.count("\0") == len(values) - 1:
+            return b"\0" + joined.encode("utf-8")
+        encoded = [value.encode("utf-8") for value in values]
+        return b"\1" + _little_endian(array("I", map(len, encoded))) + b"".join(encoded)
+
+    def encode(self, rows) -> bytes:
+        if not rows:
+            return b""
+        ids, expressions, results, modes, timestamps = zip(*rows)
+        deltas = array("q", ids)
+        for i in range(len(deltas) - 1, 0, -1):
+            deltas[i] -= deltas[i - 1]
+        columns = [
+            _little_endian(deltas),
+            bytes(bool(mode) for mode in modes),
+            self._strings(expressions),
+            self._strings(results),
+            self._strings(timestamps),
+        ]
+        body = b"".join(COLUMN_HEADER.pack(len(data)) + data for data in map(zlib.compress, columns))
+        return BLOCK_HEADER.pack(len(rows), len(body)) + body
+
+
+class Decoder:
+    """
+    Разбор входа загрузки по мере поступления: feed(data) возвращает записи, целиком пришедшие
+    к этому моменту, close() – остаток. Записи – кортежи (expression, result, float_mode, ts).
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def feed(self, data: bytes) -> list:
+        raise NotImplementedError
+
+    def close(self) -> list:
+        return []
+
+
+class NdjsonDecoder(Decoder):
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+
+    def _parse(self, lines) -> list:
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            self.count += 1
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise ValueError(f"Record {self.count}: invalid JSON") from None
+            if not isinstance(item, dict):
+                raise ValueError(f"Record {self.count}: expected a JSON object")
+            records.append(make_record(item.get("expression"), item.get("result"), item.get("float_mode", False),
+                                       item.get("timestamp"), self.count))
+        return records
+
+    def feed(self, data: bytes) -> list:
+        end = data.rfind(b"\n")
+        if end < 0:
+            self.buffer += data
+            return []
+        lines = (bytes(self.buffer) + data[:end]).split(b"\n")
+        self.buffer[:] = data[end + 1:]
+        return self._parse(lines)
+
+    def close(self) -> list:
+        lines = [bytes(self.buffer)]
+        self.buffer.clear()
+        return self._parse(lines)
+
+
+class CsvDecoder(Decoder):
+    """Строки CSV могут содержать переводы строки в кавычках: запись кончается на \\n при чётном числе кавычек."""
+
+    def __init__(self):
+        super().__init__()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.pending = ""
+        self.columns = None
+
+    def _parse(self, text: str) -> list:
+        records = []
+        for row in csv.reader(io.StringIO(text)):
+            if not row:
+                continue
+            if self.columns is None:
+                self.columns = {name: i for i, name in enumerate(row)}
+                missing = {"expression", "result", "float_mode", "timestamp"} - set(self.columns)
+                if missing:
+                    raise ValueError(f"CSV header is missing: {', '.join(sorted(missing))}")
+                continue
+            self.count += 1
+            try:
+                expression, result, float_mode, timestamp = (
+                    row[self.columns[name]] for name in ("expression", "result", "float_mode", "timestamp")
+                )
+            except IndexError:
+                raise ValueError(f"Record {self.count}: row does not match the header") from None
+            if float_mode not in ("0", "1"):
+                raise ValueError(f"Record {self.count}: float_mode must be 0 or 1")
+            records.append(make_record(expression, result, float_mode == "1", timestamp, self.count))
+        return records
+
+    def feed(self, data: bytes) -> list:
+        text = self.pending + self.text.decode(data)
+        # Конец последней полной записи: перевод строки вне кавычек
+        end = -1
+        quotes = 0
+        position = 0
+        while True:
+            newline = text.find("\n", position)
+            if newline < 0:
+                break
+            quotes += text.count('"', position, newline)
+            if quotes % 2 == 0:
+                end = newline
+            position = newline + 1
+        self.pending = text[end + 1:]
+        return self._parse(text[:end + 1]) if end >= 0 else []
+
+    def close(self) -> list:
+        text = self.pending + self.text.decode(b"", final=True)
+        self.pending = ""
+        return self._parse(text)
+
+
+class ColumnarDecoder(Decoder):
+    """with_ids – отдавать записи с исходным id первым полем (чтение архива), а не для загрузки."""
+
+    def __init__(self, with_ids: bool = False):
+        super().__init__()
+        self.buffer = bytearray()
+        self.started = False
+        self.with_ids = with_ids
+
+    @staticmethod
+    def _strings(data: bytes, rows: int) -> list:
+        if data[:1] == b"\0":
+            return data[1:].decode("utf-8").split("\0")
+        lengths = _from_little_endian("I", data[1:1 + 4 * rows])
+        values = []
+        position = 1 + 4 * rows
+        for length in lengths:
+            values.append(data[position:position + length].decode("utf-8"))
+            position += length
+        return values
+
+    def _block(self, rows: int, body: bytes) -> list:
+        columns = []
+        position = 0
+        for _ in range(5):
+            (size,) = COLUMN_HEADER.unpack_from(body, position)
+            position += COLUMN_HEADER.size
+            columns.append(zlib.decompress(body[position:position + size]))
+            position += size
+        modes = [mode == 1 for mode in columns[1]]
+        expressions, results, timestamps = (self._strings(column, rows) for column in columns[2:])
+        if not len(modes) == len(expressions) == len(results) == len(timestamps) == rows:
+            raise ValueError("Corrupted columnar block")
+        # Типы столбцов заданы форматом, проверяется только время
+        check_timestamps(timestamps, self.count + 1)
+        self.count += rows
+        if self.with_ids:
+            ids = accumulate(_from_little_endian("q", columns[0]))
+            return list(zip(ids, expressions, results, modes, timestamps))
+        return list(zip(expressions, results, modes, timestamps))
+
+    def feed(self, data: bytes) -> list:
+        self.buffer += data
+        if not self.started:
+            if len(self.buffer) < len(COLUMNAR_MAGIC):
+                return []
+            if self.buffer[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+                raise ValueError("Not a columnar history file")
+            del self.buffer[:len(COLUMNAR_MAGIC)]
+            self.started = True
+        records = []
+        while len(self.buffer) >= BLOCK_HEADER.size:
+            rows, size = BLOCK_HEADER.unpack_from(self.buffer)
+            end = BLOCK_HEADER.size + size
+            if len(self.buffer) < end:
+                break
+            try:
+                records.extend(self._block(rows, bytes(self.buffer[BLOCK_HEADER.size:end])))
+            except (zlib.error, struct.error, UnicodeDecodeError):
+                raise ValueError("Corrupted columnar block") from None
+            del self.buffer[:end]
+        return records
+
+    def close(self) -> list:
+        if self.buffer or not self.started:
+            raise ValueError("Truncated columnar history file")
+        return []
+
+
+ENCODERS = {"ndjson": NdjsonEncoder, "csv": CsvEncoder, "columnar": ColumnarEncoder}
+DECODERS = {"ndjson": NdjsonDecoder, "csv": CsvDecoder, "columnar": ColumnarDecoder}
+FORMATS = tuple(ENCODERS)
+
+
+def iter_columnar_file(path: str, size: int = None):
+    """
+    Записи (id, expression, result, float_mode, ts) файла columnar – списками по блокам.
+    size – читать только первые size байт (дописываемый сегмент архива).
+    """
+    decoder = ColumnarDecoder(with_ids=True)
+    remaining = size if size is not None else float("inf")
+    with open(path, "rb") as source:
+        while remaining > 0:
+            data = source.read(int(min(READ_SIZE, remaining)))
+            if not data:
+                break
+            remaining -= len(data)
+            records = decoder.feed(data)
+            if records:
+                yield records
+    decoder.close()
+
+
+def read_encoded_chunk(conn, encoder: Encoder, cursor: int = None, limit: int = EXPORT_CHUNK_ROWS,
+                       since: str = None, until: str = None):
+    """Порция выгрузки: (закодированные байты, id последней записи, число записей)."""
+    rows = database.fetch_history_rows(conn, cursor, limit, since, until)
+    return encoder.encode(rows), (rows[-1][0] if rows else cursor), len(rows)
+
+
+def export_history(out, fmt: str = "ndjson", since: str = None, until: str = None, db_path: str = None,
+                   chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    """Пишет историю (записи с since <= ts < until) в двоичный поток out. Возвращает число записей."""
+    encoder = ENCODERS[fmt]()
+    conn = sqlite3.connect(f"file:{db_path or database.DB_PATH}?mode=ro", uri=True)
+    try:
+        out.write(encoder.header())
+        cursor = None
+        total = 0
+        while True:
+            data, cursor, count = read_encoded_chunk(conn, encoder, cursor, chunk_rows, since, until)
+            out.write(data)
+            total += count
+            if count < chunk_rows:
+                break
+        out.write(encoder.footer())
+    finally:
+        conn.close()
+    return total
+
+
+class HistoryImporter:
+    """
+    Загрузка истории: feed(data) с кусками входа в формате fmt (или add(records) с готовыми записями),
+    затем close(). Записи вставляются executemany транзакциями по transaction_rows; индексы history
+    удаляются при open() и создаются заново в close() (при defer_indexes).
+    id выдаются по порядку после существующих. Если в процессе работает писатель истории – через него,
+    чтобы не пересечься с id, которые он уже выдал, а индексы не трогаются: по ним идут запросы сервера.
+    Иначе open() берёт database.lock_database (если её уже не взял вызывающий – locked), и загрузка
+    в БД работающего сервера завершается database.DatabaseBusyError.
+    """
+
+    def __init__(self, fmt: str = "ndjson", db_path: str = None,
+                 transaction_rows: int = IMPORT_TRANSACTION_ROWS, defer_indexes: bool = True, locked: bool = False):
+        self.decoder = DECODERS[fmt]()
+        self.db_path = db_path or database.DB_PATH
+        self.transaction_rows = transaction_rows
+        self.defer_indexes = defer_indexes
+        self.locked = locked
+        self.conn = None
+        self.lock = None
+        self.next_id = None
+        self.expression_ids = {}
+        self.pending = []
+        self.imported = 0
+
+    def open(self):
+        if database.running_writer() is None:
+            if not self.locked:
+                self.lock = database.lock_database(self.db_path)
+        else:
+            self.defer_indexes = False
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={database.DB_SYNCHRONOUS}")
+        self.conn.execute("PRAGMA cache_size=-65536")  # 64 МБ – для построения индексов в конце
+        if self.defer_indexes:
+            with self.conn:
+                for name in database.HISTORY_INDEXES:
+                    self.conn.execute(f"DROP INDEX IF EXISTS {name}")
+        self.next_id = database.next_history_id(self.conn)
+        return self
+
+    def _reserve_ids(self, count: int) -> int:
+        writer = database.running_writer()
+        if writer is not None:
+            return writer.reserve_ids(count)
+        first_id = self.next_id
+        self.next_id += count
+        return first_id
+
+    def _commit(self, records):
+        first_id = self._reserve_ids(len(records))
+        with self.conn:
+            database.insert_records(self.conn, records, range(first_id, first_id + len(records)),
+                                    self.expression_ids)
+        self.imported += len(records)
+
+    def add(self, records):
+        self.pending.extend(records)
+        while len(self.pending) >= self.transaction_rows:
+            self._commit(self.pending[:self.transaction_rows])
+            del self.pending[:self.transaction_rows]
+
+    def feed(self, data: bytes):
+        self.add(self.decoder.feed(data))
+
+    def finish(self):
+        """Разбирает остаток входа и фиксирует всё, что накоплено."""
+        self.add(self.decoder.close())
+        if self.pending:
+            self._commit(self.pending)
+            self.pending = []
+
+    def close(self) -> int:
+        """Создаёт индексы и закрывает соединение (также после ошибки). Возвращает число загруженных записей."""
+        if self.conn is not None:
+            with self.conn:
+                database.create_indexes(self.conn)
+            self.conn.close()
+            self.conn = None
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+        return self.imported
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def import_history(source, fmt: str = "ndjson", db_path: str = None, **kwargs) -> int:
+    """Загружает историю из двоичного потока source. Возвращает число записей."""
+    with HistoryImporter(fmt, db_path, **kwargs) as importer:
+        while True:
+            data = source.read(READ_SIZE)
+            if not data:
+                break
+            importer.feed(data)
+        importer.finish()
+    return importer.imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=None, help="путь к history.db (по умолчанию ./history.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="выгрузить историю")
+    export.add_argument("--format", choices=FORMATS, default="ndjson")
+    export.add_argument("--since", help="ts >= since (ISO 8601)")
+    export.add_argument("--until", help="ts < until (ISO 8601)")
+    export.add_argument("-o", "--output", default="-", help="файл (по умолчанию stdout)")
+
+    load = commands.add_parser("import", help="загрузить историю")
+    load.add_argument("--format", choices=FORMATS, default="ndjson")
+    load.add_argument("input", nargs="?", default="-", help="файл (по умолчанию stdin)")
+
+    args = parser.parse_args(argv)
+    if args.db is not None:
+        database.DB_PATH = os.path.abspath(args.db)
+    if args.command == "export":
+        for value in (args.since, args.until):
+            if value is not None:
+                datetime.fromisoformat(value)
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            count = export_history(out, args.format, args.since, args.until)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        print(f"exported {count} records", file=sys.stderr)
+    else:
+        # Блокировка – до init_db: миграции и индексы тоже нельзя трогать в БД работающего сервера
+        try:
+            lock = database.lock_database()
+        except database.DatabaseBusyError as e:
+            parser.exit(1, f"error: {e}\n")
+        source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+        try:
+            database.init_db()
+            count = import_history(source, args.format, locked=True)
+        except ValueError as e:
+            parser.exit(1, f"error: {e}\n")
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+            lock.close()
+        print(f"imported {count} records", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# server/vectorized.py
+"""
+Векторное вычисление одного выражения с переменными над столбцами NumPy:
+выражение разбирается один раз (grammar.parse), затем каждая инструкция выполняется сразу над всеми строками.
+Семантика как у вычислителя на C: в целочисленном режиме – 32-битный int с переполнением по модулю,
+деление с отбрасыванием дробной части, INT_MIN / -1 – ошибка переполнения; деление на ноль – ошибка
+только в своей строке, остальные строки считаются.
+
+NumPy – необязательная зависимость: без него модуль импортируется, но вычисление бросает VectorUnavailable.
+"""
+
+import io
+import os
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+from .grammar import Program, ExpressionError, ERROR_MESSAGES, DIVISION_BY_ZERO, OVERFLOW, UNKNOWN_VARIABLE
+from .grammar import NUM, VAR, INT_MIN, parse, number_value, variable_offset
+
+# Максимальное число строк в одном запросе POST /calc/vector
+VECTOR_MAX_ROWS = int(os.environ.get("CALC_VECTOR_MAX_ROWS", 10_000_000))
+
+
+class VectorUnavailable(RuntimeError):
+    """NumPy не установлен."""
+
+
+class VectorResult:
+    """
+    Результат векторного вычисления: values – значения по строкам (0 в строках с ошибкой),
+    error_codes – код CalcError по строкам (0 – без ошибки), error_offsets – смещение ошибки в выражении.
+    """
+
+    def __init__(self, values, error_codes, error_offsets):
+        self.values = values
+        self.error_codes = error_codes
+        self.error_offsets = error_offsets
+
+    def __len__(self):
+        return len(self.values)
+
+    def errors(self):
+        """Список (строка, текст ошибки) для строк с ошибкой."""
+        rows = np.flatnonzero(self.error_codes)
+        return [
+            (int(row), f"{ERROR_MESSAGES[int(self.error_codes[row])]} at position {int(self.error_offsets[row])}")
+            for row in rows
+        ]
+
+
+def require_numpy():
+    if np is None:
+        raise VectorUnavailable("NumPy is not installed")
+
+
+def _column(name: str, values, float_mode: bool):
+    array = np.asarray(values)
+    if array.ndim != 1:
+        raise ValueError(f"Column '{name}' must be one-dimensional")
+    if float_mode:
+        return array.astype(np.float64, copy=False)
+    if array.dtype.kind == "f":
+        if not np.all(np.isfinite(array)) or not np.all(array == np.trunc(array)):
+            raise ValueError(f"Column '{name}' must contain integers in integer mode")
+        array = array.astype(np.int64)
+    elif array.dtype.kind not in "iub":
+        raise ValueError(f"Column '{name}' must be numeric")
+    # Как присваивание в int языка C: значения вне диапазона переполняются по модулю 2**32
+    return array.astype(np.int32)
+
+
+def _divide(left, right, float_mode: bool, record, offset: int):
+    if float_mode:
+        zero = right == 0.0
+        record(zero, DIVISION_BY_ZERO, offset)
+        return left / np.where(zero, 1.0, right)
+
+    zero = right == 0
+    overflow = (left == INT_MIN) & (right == -1)
+    record(zero, DIVISION_BY_ZERO, offset)
+    record(overflow, OVERFLOW, offset)
+    divisor = np.where(zero | overflow, np.int32(1), right).astype(np.int32)
+    # Деление NumPy округляет вниз, в C – к нулю: поправка для ненулевого остатка при разных знаках
+    quotient = np.floor_divide(left, divisor)
+    remainder = np.remainder(left, divisor)
+    return quotient + ((remainder != 0) & ((left < 0) != (divisor < 0))).astype(np.int32)
+
+
+def evaluate_columns(expression, columns: dict, float_mode: bool = False, rows: int = None) -> VectorResult:
+    """
+    Вычисляет выражение (строку или Program) для каждой строки столбцов columns ({имя: массив}).
+    rows – число строк, если в выражении нет переменных. Ошибки разбора бросаются как ExpressionError,
+    ошибки вычисления возвращаются по строкам в VectorResult.
+    """
+    require_numpy()
+    program = expression if isinstance(expression, Program) else parse(expression)
+
+    arrays = {}
+    for name in program.variables:
+        if name not in columns:
+            raise ExpressionError(UNKNOWN_VARIABLE, variable_offset(program.source, name))
+        arrays[name] = _column(name, columns[name], float_mode)
+    lengths = {len(array) for array in arrays.values()}
+    if len(lengths) > 1:
+        raise ValueError("Columns must have the same length")
+    count = lengths.pop() if lengths else (rows if rows is not None else 1)
+
+    dtype = np.float64 if float_mode else np.int32
+    error_codes = np.zeros(count, dtype=np.int8)
+    error_offsets = np.zeros(count, dtype=np.int64)
+
+    def record(mask, code, offset):
+        # Запоминается только первая ошибка строки – как в C, где разбор останавливается на ней
+        mask = np.broadcast_to(mask, (count,))
+        new = mask & (error_codes == 0)
+        error_codes[new] = code
+        error_offsets[new] = offset
+
+    stack = []
+    with np.errstate(over="ignore", invalid="ignore"):
+        for instruction in program.code:
+            op = instruction[0]
+            if op == NUM:
+                stack.append(dtype(number_value(instruction[1], float_mode)))
+            elif op == VAR:
+                stack.append(arrays[instruction[1]])
+            else:
+                right = stack.pop()
+                left = stack.pop()
+                if op == "+":
+                    stack.append(np.add(left, right, dtype=dtype))
+                elif op == "-":
+                    stack.append(np.subtract(left, right, dtype=dtype))
+                elif op == "*":
+                    stack.append(np.multiply(left, right, dtype=dtype))
+                else:
+                    stack.append(_divide(left, right, float_mode, record, instruction[1]))
+
+    values = np.array(np.broadcast_to(stack.pop(), (count,)), dtype=dtype)
+    values[error_codes != 0] = 0
+    return VectorResult(values, error_codes, error_offsets)
+
+
+def load_csv(data: bytes) -> dict:
+    """Столбцы из CSV с заголовком (имена столбцов – имена переменных)."""
+    require_numpy()
+    text = io.StringIO(data.decode("utf-8"))
+    header = text.readline().strip()
+    if not header:
+        raise ValueError("CSV header is missing")
+    names = [name.strip() for name in header.split(",")]
+    table = np.loadtxt(text, delimiter=",", ndmin=2, dtype=np.float64)
+    if table.size and table.shape[1] != len(names):
+        raise ValueError("CSV rows do not match the header")
+    if not table.size:
+        table = table.reshape(0, len(names))
+    return {name: table[:, i] for i, name in enumerate(names)}
+
+
+def load_npz(data: bytes) -> dict:
+    """Столбцы из архива .npz (np.savez): имя массива – имя переменной."""
+    require_numpy()
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        return {name: archive[name] for name in archive.files}
@@ -0,0 +1,74 @@
+# server/wire.py
+"""
+Двоичное кодирование рассылки WebSocket (клиент подключается с ?encoding=binary).
+
+Кадр (little-endian):
+    заголовок FRAME  – тип (B: 1 – записи, 2 – история), флаги (B: 1 – truncated, 2 – since задан),
+                       число записей (I), since (q, 0 – не задан);
+    записи подряд    – RECORD: id (q), float_mode (B), длины expression (I), result (I), timestamp (H),
+                       затем сами строки в UTF-8 (timestamp пустой, если его нет).
+
+Ответы на запросы calc и сообщения об ошибках остаются текстовыми JSON-кадрами.
+"""
+
+import struct
+
+ENCODINGS = ("json", "binary")
+
+FRAME = struct.Struct("<BBIq")
+RECORD = struct.Struct("<qBIIH")
+
+FRAME_RECORDS = 1
+FRAME_HISTORY = 2
+
+FLAG_TRUNCATED = 1
+FLAG_SINCE = 2
+
+
+def encode_records(records) -> bytes:
+    """Записи без заголовка: тела можно склеивать, а заголовок с общим числом добавить при отправке."""
+    parts = []
+    for record in records:
+        expression = record["expression"].encode()
+        result = str(record["result"]).encode()
+        timestamp = record.get("timestamp", "").encode()
+        parts.append(RECORD.pack(record["id"], bool(record["float_mode"]),
+                                 len(expression), len(result), len(timestamp)))
+        parts += (expression, result, timestamp)
+    return b"".join(parts)
+
+
+def records_frame(count: int, bodies) -> bytes:
+    """Кадр рассылки из уже закодированных тел (encode_records) с общим числом записей count."""
+    return FRAME.pack(FRAME_RECORDS, 0, count, 0) + b"".join(bodies)
+
+
+def history_frame(records: list, since: int = None, truncated: bool = False) -> bytes:
+    """Кадр начальной истории – двоичный аналог {"history": [...], "since": ..., "truncated": ...}."""
+    flags = (FLAG_TRUNCATED if truncated else 0) | (FLAG_SINCE if since is not None else 0)
+    return FRAME.pack(FRAME_HISTORY, flags, len(records), since or 0) + encode_records(records)
+
+
+def decode_frame(data: bytes) -> dict:
+    """Кадр → сообщение того же вида, что в JSON-протоколе: {"records": [...]} или {"history": [...], ...}."""
+    kind, flags, count, since = FRAME.unpack_from(data)
+    offset = FRAME.size
+    records = []
+    for _ in range(count):
+        record_id, float_mode, expression_len, result_len, timestamp_len = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        record = {
+            "id": record_id,
+            "expression": data[offset:offset + expression_len].decode(),
+            "result": data[offset + expression_len:offset + expression_len + result_len].decode(),
+            "float_mode": bool(float_mode),
+        }
+        offset += expression_len + result_len
+        if timestamp_len:
+            record["timestamp"] = data[offset:offset + timestamp_len].decode()
+            offset += timestamp_len
+        records.append(record)
+    if kind == FRAME_HISTORY:
+        return {"history": records, "since": since if flags & FLAG_SINCE else None,
+                "truncated": bool(flags & FLAG_TRUNCATED)}
+    return {"records": records}
@@ -0,0 +1,658 @@
+#include <ctype.h>
+#include <limits.h>
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "calculator.h"
+
+/*
+Реентерабельное ядро вычислителя. Не использует глобального состояния и не завершает процесс:
+ошибка записывается в CalcParser (код и смещение от начала выражения), после чего разбор
+сворачивается. Используется программой app.exe и собирается в библиотеку libcalc.so.
+*/
+
+/*
+Вход: парсер, код ошибки
+Выход: ничего
+Задача: Запоминает первую ошибку разбора и позицию, на которой она произошла
+*/
+static void setError(CalcParser *parser, CalcError error)
+{
+    if (parser->error == CALC_OK)
+    {
+        parser->error = error;
+        parser->error_offset = (size_t)(parser->pos - parser->start);
+    }
+}
+
+/*
+Вход: парсер
+Выход: ничего
+Задача: Пропускает пробельные символы
+*/
+static void skip(CalcParser *parser)
+{
+    while (*parser->pos && isspace((unsigned char)*parser->pos))
+        parser->pos++;
+}
+
+void calcParserInit(CalcParser *parser, const char *expression)
+{
+    parser->start = expression;
+    parser->pos = expression;
+    parser->error = CALC_OK;
+    parser->error_offset = 0;
+    parser->max_depth = CALC_DEFAULT_MAX_DEPTH;
+}
+
+CalcError calcValidate(const char *str, size_t *error_offset)
+{
+    for (const char *c = str; *c; c++)
+    {
+        if (!(isdigit((unsigned char)*c) || isspace((unsigned char)*c) || *c == '(' || *c == ')' || *c == '*' ||
+              *c == '+' || *c == '/' || *c == '-'))
+        {
+            if (error_offset)
+                *error_offset = (size_t)(c - str);
+            return CALC_ERR_INVALID_CHAR;
+        }
+    }
+    return CALC_OK;
+}
+
+/* ========== ЦЕЛОЧИСЛЕННЫЙ РЕЖИМ ========== */
+
+int calcParseNumber(CalcParser *parser)
+{
+    if (!isdigit((unsigned char)*parser->pos))
+    {
+        setError(parser, CALC_ERR_EXPECTED_NUMBER);
+        return 0;
+    }
+    int result = 0;
+    while (*parser->pos && isdigit((unsigned char)*parser->pos))
+    {
+        result = result * 10 + (*parser->pos - '0');
+        parser->pos++;
+    }
+    return result;
+}
+
+int calcParseFactor(CalcParser *parser)
+{
+    skip(parser);
+
+    // Унарные плюс и минус запрещены
+    if (*parser->pos == '+' || *parser->pos == '-')
+    {
+        setError(parser, CALC_ERR_UNARY_OPERATOR);
+        return 0;
+    }
+
+    if (*parser->pos == '(')
+    {
+        parser->pos++; // пропускаем '('
+        int result = calcParseExpression(parser);
+        if (parser->error)
+            return 0;
+        skip(parser);
+        if (*parser->pos != ')')
+        {
+            setError(parser, CALC_ERR_MISSING_PAREN);
+            return 0;
+        }
+        parser->pos++; // пропускаем ')'
+        return result;
+    }
+    return calcParseNumber(parser);
+}
+
+int calcParseTerm(CalcParser *parser)
+{
+    int result = calcParseFactor(parser);
+    while (!parser->error)
+    {
+        skip(parser);
+        if (*parser->pos == '*')
+        {
+            parser->pos++;
+            result *= calcParseFactor(parser);
+        }
+        else if (*parser->pos == '/')
+        {
+            parser->pos++;
+            skip(parser);
+            const char *divisor_pos = parser->pos;
+            int divisor = calcParseFactor(parser);
+            if (parser->error)
+                return 0;
+            if (divisor == 0 || (result == INT_MIN && divisor == -1))
+            {
+                parser->pos = divisor_pos;
+                setError(parser, divisor == 0 ? CALC_ERR_DIVISION_BY_ZERO : CALC_ERR_OVERFLOW);
+                return 0;
+            }
+            result /= divisor;
+        }
+        else
+        {
+            break;
+        }
+    }
+    return parser->error ? 0 : result;
+}
+
+int calcParseExpression(CalcParser *parser)
+{
+    int result = calcParseTerm(parser);
+    while (!parser->error)
+    {
+        skip(parser);
+        if (*parser->pos == '+')
+        {
+            parser->pos++;
+            result += calcParseTerm(parser);
+        }
+        else if (*parser->pos == '-')
+        {
+            parser->pos++;
+            result -= calcParseTerm(parser);
+        }
+        else
+        {
+            break;
+        }
+    }
+    return parser->error ? 0 : result;
+}
+
+/* ========== ВЕЩЕСТВЕННЫЙ РЕЖИМ ========== */
+
+double calcParseNumberF(CalcParser *parser)
+{
+    if (!isdigit((unsigned char)*parser->pos))
+    {
+        setError(parser, CALC_ERR_EXPECTED_NUMBER);
+        return 0.0;
+    }
+    double result = 0.0;
+    while (*parser->pos && isdigit((unsigned char)*parser->pos))
+    {
+        result = result * 10.0 + ((double)(*parser->pos - '0'));
+        parser->pos++;
+    }
+    return result;
+}
+
+double calcParseFactorF(CalcParser *parser)
+{
+    skip(parser);
+
+    if (*parser->pos == '+' || *parser->pos == '-')
+    {
+        setError(parser, CALC_ERR_UNARY_OPERATOR);
+        return 0.0;
+    }
+
+    if (*parser->pos == '(')
+    {
+        parser->pos++; // пропускаем '('
+        double result = calcParseExpressionF(parser);
+        if (parser->error)
+            return 0.0;
+        skip(parser);
+        if (*parser->pos != ')')
+        {
+            setError(parser, CALC_ERR_MISSING_PAREN);
+            return 0.0;
+        }
+        parser->pos++; // пропускаем ')'
+        return result;
+    }
+    return calcParseNumberF(parser);
+}
+
+double calcParseTermF(CalcParser *parser)
+{
+    double result = calcParseFactorF(parser);
+    while (!parser->error)
+    {
+        skip(parser);
+        if (*parser->pos == '*')
+        {
+            parser->pos++;
+            result *= calcParseFactorF(parser);
+        }
+        else if (*parser->pos == '/')
+        {
+            parser->pos++;
+            skip(parser);
+            const char *divisor_pos = parser->pos;
+            double divisor = calcParseFactorF(parser);
+            if (parser->error)
+                return 0.0;
+            if (divisor == 0.0)
+            {
+                parser->pos = divisor_pos;
+                setError(parser, CALC_ERR_DIVISION_BY_ZERO);
+                return 0.0;
+            }
+            result /= divisor;
+        }
+        else
+        {
+            break;
+        }
+    }
+    return parser->error ? 0.0 : result;
+}
+
+double calcParseExpressionF(CalcParser *parser)
+{
+    double result = calcParseTermF(parser);
+    while (!parser->error)
+    {
+        skip(parser);
+        if (*parser->pos == '+')
+        {
+            parser->pos++;
+            result += calcParseTermF(parser);
+        }
+        else if (*parser->pos == '-')
+        {
+            parser->pos++;
+            result -= calcParseTermF(parser);
+        }
+        else
+        {
+            break;
+        }
+    }
+    return parser->error ? 0.0 : result;
+}
+
+/* ========== ИТЕРАТИВНЫЙ РАЗБОР ========== */
+
+/*
+Та же грамматика, что у рекурсивного спуска, но уровни скобок хранятся в явном стеке кадров.
+Кадр – состояние одного уровня: сумма разобранных термов, текущий терм и ожидающие операции.
+Операции применяются в том же порядке, что и в рекурсивном разборе, поэтому результаты
+(включая переполнение int) и коды/смещения ошибок совпадают.
+*/
+
+// Кадров на стеке вызова; глубже – стек кадров переносится в кучу
+#define LOCAL_FRAMES 64
+
+typedef struct
+{
+    int sum;                 // сумма уже разобранных термов уровня
+    int product;             // текущий терм
+    char add_op;             // '+', '-' или 0 перед первым термом
+    char mul_op;             // '*', '/' или 0 перед первым множителем
+    const char *divisor_pos; // позиция делителя (для смещения ошибки деления)
+} IntFrame;
+
+typedef struct
+{
+    double sum;
+    double product;
+    char add_op;
+    char mul_op;
+    const char *divisor_pos;
+} FloatFrame;
+
+/*
+Вход: текущий массив кадров, локальный массив, указатель на ёмкость, размер кадра
+Выход: массив вдвое большей ёмкости или NULL (исходный массив тогда не изменяется)
+Задача: Увеличивает стек кадров; при первом росте копирует кадры из локального массива в кучу
+*/
+static void *growFrames(void *frames, void *local, size_t *capacity, size_t size)
+{
+    size_t grown = *capacity * 2;
+    void *result;
+    if (frames == local)
+    {
+        result = malloc(grown * size);
+        if (result)
+            memcpy(result, frames, *capacity * size);
+    }
+    else
+    {
+        result = realloc(frames, grown * size);
+    }
+    if (result)
+        *capacity = grown;
+    return result;
+}
+
+int calcParseExpressionIter(CalcParser *parser)
+{
+    IntFrame local[LOCAL_FRAMES];
+    IntFrame *frames = local;
+    size_t capacity = LOCAL_FRAMES;
+    size_t depth = 0;
+    IntFrame frame = {0, 0, 0, 0, NULL};
+    int result = 0;
+
+    for (;;)
+    {
+        // Множитель: число или открывающая скобка
+        skip(parser);
+        char c = *parser->pos;
+        if (c == '+' || c == '-')
+        {
+            setError(parser, CALC_ERR_UNARY_OPERATOR);
+            break;
+        }
+        if (c == '(')
+        {
+            if (depth >= parser->max_depth)
+            {
+                setError(parser, CALC_ERR_TOO_DEEP);
+                break;
+            }
+            if (depth == capacity)
+            {
+                IntFrame *grown = growFrames(frames, local, &capacity, sizeof(IntFrame));
+                if (!grown)
+                {
+                    setError(parser, CALC_ERR_TOO_DEEP);
+                    break;
+                }
+                frames = grown;
+            }
+            frames[depth++] = frame;
+            frame = (IntFrame){0, 0, 0, 0, NULL};
+            parser->pos++; // пропускаем '('
+            continue;
+        }
+        int value = calcParseNumber(parser);
+        if (parser->error)
+            break;
+
+        // Применяем значение к терму; если за ним ')', закрываем уровень и повторяем уровнем выше
+        for (;;)
+        {
+            if (frame.mul_op == '*')
+            {
+                frame.product *= value;
+            }
+            else if (frame.mul_op == '/')
+            {
+                if (value == 0 || (frame.product == INT_MIN && value == -1))
+                {
+                    parser->pos = frame.divisor_pos;
+                    setError(parser, value == 0 ? CALC_ERR_DIVISION_BY_ZERO : CALC_ERR_OVERFLOW);
+                    break;
+                }
+                frame.product /= value;
+            }
+            else
+            {
+                frame.product = value;
+            }
+
+            skip(parser);
+            c = *parser->pos;
+            if (c == '*' || c == '/')
+                break;
+
+            // Терм закончился
+            if (frame.add_op == '+')
+                frame.sum += frame.product;
+            else if (frame.add_op == '-')
+                frame.sum -= frame.product;
+            else
+                frame.sum = frame.product;
+            if (c == '+' || c == '-' || depth == 0)
+                break;
+
+            // Выражение в скобках закончилось
+            if (c != ')')
+            {
+                setError(parser, CALC_ERR_MISSING_PAREN);
+                break;
+            }
+            parser->pos++; // пропускаем ')'
+            value = frame.sum;
+            frame = frames[--depth];
+        }
+        if (parser->error)
+            break;
+
+        if (c == '*' || c == '/')
+        {
+            frame.mul_op = c;
+            parser->pos++;
+            if (c == '/')
+            {
+                skip(parser);
+                frame.divisor_pos = parser->pos;
+            }
+        }
+        else if (c == '+' || c == '-')
+        {
+            frame.add_op = c;
+            frame.mul_op = 0;
+            parser->pos++;
+        }
+        else
+        {
+            result = frame.sum;
+            break;
+        }
+    }
+
+    if (frames != local)
+        free(frames);
+    return parser->error ? 0 : result;
+}
+
+double calcParseExpressionIterF(CalcParser *parser)
+{
+    FloatFrame local[LOCAL_FRAMES];
+    FloatFrame *frames = local;
+    size_t capacity = LOCAL_FRAMES;
+    size_t depth = 0;
+    FloatFrame frame = {0.0, 0.0, 0, 0, NULL};
+    double result = 0.0;
+
+    for (;;)
+    {
+        skip(parser);
+        char c = *parser->pos;
+        if (c == '+' || c == '-')
+        {
+            setError(parser, CALC_ERR_UNARY_OPERATOR);
+            break;
+        }
+        if (c == '(')
+        {
+            if (depth >= parser->max_depth)
+            {
+                setError(parser, CALC_ERR_TOO_DEEP);
+                break;
+            }
+            if (depth == capacity)
+            {
+                FloatFrame *grown = growFrames(frames, local, &capacity, sizeof(FloatFrame));
+                if (!grown)
+                {
+                    setError(parser, CALC_ERR_TOO_DEEP);
+                    break;
+                }
+                frames = grown;
+            }
+            frames[depth++] = frame;
+            frame = (FloatFrame){0.0, 0.0, 0, 0, NULL};
+            parser->pos++; // пропускаем '('
+            continue;
+        }
+        double value = calcParseNumberF(parser);
+        if (parser->error)
+            break;
+
+        for (;;)
+        {
+            if (frame.mul_op == '*')
+            {
+                frame.product *= value;
+            }
+            else if (frame.mul_op == '/')
+            {
+                if (value == 0.0)
+                {
+                    parser->pos = frame.divisor_pos;
+                    setError(parser, CALC_ERR_DIVISION_BY_ZERO);
+                    break;
+                }
+                frame.product /= value;
+            }
+            else
+            {
+                frame.product = value;
+            }
+
+            skip(parser);
+            c = *parser->pos;
+            if (c == '*' || c == '/')
+                break;
+
+            if (frame.add_op == '+')
+                frame.sum += frame.product;
+            else if (frame.add_op == '-')
+                frame.sum -= frame.product;
+            else
+                frame.sum = frame.product;
+            if (c == '+' || c == '-' || depth == 0)
+                break;
+
+            if (c != ')')
+            {
+                setError(parser, CALC_ERR_MISSING_PAREN);
+                break;
+            }
+            parser->pos++; // пропускаем ')'
+            value = frame.sum;
+            frame = frames[--depth];
+        }
+        if (parser->error)
+            break;
+
+        if (c == '*' || c == '/')
+        {
+            frame.mul_op = c;
+            parser->pos++;
+            if (c == '/')
+            {
+                skip(parser);
+                frame.divisor_pos = parser->pos;
+            }
+        }
+        else if (c == '+' || c == '-')
+        {
+            frame.add_op = c;
+            frame.mul_op = 0;
+            parser->pos++;
+        }
+        else
+        {
+            result = frame.sum;
+            break;
+        }
+    }
+
+    if (frames != local)
+        free(frames);
+    return parser->error ? 0.0 : result;
+}
+
+/* ========== ВЫЧИСЛЕНИЕ ЦЕЛОГО ВЫРАЖЕНИЯ ========== */
+
+/*
+Вход: парсер после разбора выражения, указатель для смещения ошибки
+Выход: итоговый код ошибки
+Задача: Проверяет, что после выражения остались только пробелы, и отдаёт код и смещение ошибки
+*/
+static CalcError finish(CalcParser *parser, size_t *error_offset)
+{
+    if (!parser->error)
+    {
+        skip(parser);
+        if (*parser->pos != '\0')
+            setError(parser, CALC_ERR_TRAILING_INPUT);
+    }
+    if (parser->error && error_offset)
+        *error_offset = parser->error_offset;
+    return parser->error;
+}
+
+CalcError evaluateIntDepth(const char *expression, size_t max_depth, int *result, size_t *error_offset)
+{
+    CalcError error = calcValidate(expression, error_offset);
+    if (error)
+        return error;
+
+    CalcParser parser;
+    calcParserInit(&parser, expression);
+    parser.max_depth = max_depth;
+    int value = calcParseExpressionIter(&parser);
+    error = finish(&parser, error_offset);
+    if (!error && result)
+        *result = value;
+    return error;
+}
+
+CalcError evaluateFloatDepth(const char *expression, size_t max_depth, double *result, size_t *error_offset)
+{
+    CalcError error = calcValidate(expression, error_offset);
+    if (error)
+        return error;
+
+    CalcParser parser;
+    calcParserInit(&parser, expression);
+    parser.max_depth = max_depth;
+    double value = calcParseExpressionIterF(&parser);
+    error = finish(&parser, error_offset);
+    if (!error && result)
+        *result = value;
+    return error;
+}
+
+CalcError evaluateInt(const char *expression, int *result, size_t *error_offset)
+{
+    return evaluateIntDepth(expression, CALC_DEFAULT_MAX_DEPTH, result, error_offset);
+}
+
+CalcError evaluateFloat(const char *expression, double *result, size_t *error_offset)
+{
+    return evaluateFloatDepth(expression, CALC_DEFAULT_MAX_DEPTH, result, error_offset);
+}
+
+const char *calcErrorMessage(CalcError error)
+{
+    switch (error)
+    {
+    case CALC_OK:
+        return "OK";
+    case CALC_ERR_INVALID_CHAR:
+        return "Invalid character";
+    case CALC_ERR_EXPECTED_NUMBER:
+        return "Expected number";
+    case CALC_ERR_UNARY_OPERATOR:
+        return "Unary operators are not allowed";
+    case CALC_ERR_MISSING_PAREN:
+        return "Missing closing parenthesis";
+    case CALC_ERR_DIVISION_BY_ZERO:
+        return "Division by zero";
+    case CALC_ERR_OVERFLOW:
+        return "Integer overflow";
+    case CALC_ERR_TRAILING_INPUT:
+        return "Unexpected input after expression";
+    case CALC_ERR_TOO_DEEP:
+        return "Parentheses nested too deeply";
+    }
+    return "Unknown error";
+}
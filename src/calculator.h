@@ -1,10 +1,14 @@
 #ifndef CALCULATOR_H
 #define CALCULATOR_H
 
+#include <stddef.h>
+#include <stdio.h>
+
 extern int use_float;
 void skipSpaces(char **expression);
 void trim(char *str);
 void validateInput(const char *str);
+char *readInput(FILE *stream, size_t *length);
 int parseNumber(char **expression);
 int parseFactor(char **expression);
 int parseTerm(char **expression);
@@ -14,4 +18,56 @@ double parseFactorF(char **expression);
 double parseTermF(char **expression);
 double parseExpressionF(char **expression);
 
+/* ========== Реентерабельное ядро (calculator.c, libcalc.so) ========== */
+
+// Коды ошибок вычисления. Значения входят в ABI libcalc.so – не менять порядок.
+typedef enum
+{
+    CALC_OK = 0,
+    CALC_ERR_INVALID_CHAR = 1,
+    CALC_ERR_EXPECTED_NUMBER = 2,
+    CALC_ERR_UNARY_OPERATOR = 3,
+    CALC_ERR_MISSING_PAREN = 4,
+    CALC_ERR_DIVISION_BY_ZERO = 5,
+    CALC_ERR_OVERFLOW = 6,
+    CALC_ERR_TRAILING_INPUT = 7,
+    CALC_ERR_TOO_DEEP = 8
+} CalcError;
+
+// Максимальная глубина вложенности скобок по умолчанию для итеративного разбора
+#define CALC_DEFAULT_MAX_DEPTH 100000
+
+// Состояние разбора одного выражения
+typedef struct
+{
+    const char *start;   // начало выражения (для вычисления смещения ошибки)
+    const char *pos;     // текущая позиция
+    CalcError error;     // первая ошибка разбора
+    size_t error_offset; // смещение первой ошибки от start
+    size_t max_depth;    // предел вложенности скобок для итеративного разбора
+} CalcParser;
+
+void calcParserInit(CalcParser *parser, const char *expression);
+CalcError calcValidate(const char *str, size_t *error_offset);
+int calcParseNumber(CalcParser *parser);
+int calcParseFactor(CalcParser *parser);
+int calcParseTerm(CalcParser *parser);
+int calcParseExpression(CalcParser *parser);
+double calcParseNumberF(CalcParser *parser);
+double calcParseFactorF(CalcParser *parser);
+double calcParseTermF(CalcParser *parser);
+double calcParseExpressionF(CalcParser *parser);
+// Итеративный разбор с явным стеком: те же результаты и ошибки, что у calcParseExpression(F),
+// но глубина скобок ограничена только parser->max_depth, а не стеком вызовов C
+int calcParseExpressionIter(CalcParser *parser);
+double calcParseExpressionIterF(CalcParser *parser);
+
+// Вычисляют выражение целиком. При ошибке возвращают её код и смещение, result не изменяется.
+CalcError evaluateInt(const char *expression, int *result, size_t *error_offset);
+CalcError evaluateFloat(const char *expression, double *result, size_t *error_offset);
+// То же с заданным пределом вложенности скобок (evaluateInt/evaluateFloat – CALC_DEFAULT_MAX_DEPTH)
+CalcError evaluateIntDepth(const char *expression, size_t max_depth, int *result, size_t *error_offset);
+CalcError evaluateFloatDepth(const char *expression, size_t max_depth, double *result, size_t *error_offset);
+const char *calcErrorMessage(CalcError error);
+
 #endif // CALCULATOR_H
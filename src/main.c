@@ -1,5 +1,4 @@
 #include <ctype.h>
-#include <stdbool.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
@@ -11,12 +10,6 @@
 // Глобальный флаг: 0 – целочисленный режим, 1 – вещественный режим
 int use_float = 0;
 
-/* Прототипы функций для целочисленного режима */
-int parseExpression(char **expression);
-
-/* Прототипы функций для вещественного режима */
-double parseExpressionF(char **expression);
-
 /*
 Вход: указатель на строку (pointer to pointer)
 Выход: ничего
@@ -59,17 +52,73 @@ void trim(char *str)
 */
 void validateInput(const char *str)
 {
-    while (*str)
+    if (calcValidate(str, NULL) != CALC_OK)
+    {
+        // Недопустимый символ – завершаем работу с ошибкой.
+        exit(1);
+    }
+}
+
+/*
+Вход: входной поток, указатель для длины прочитанного (может быть NULL)
+Выход: строка со всем содержимым потока (освобождается вызывающим через free) или NULL при ошибке
+Задача: Читает поток целиком за один проход блоками fread в буфер, растущий вдвое:
+время линейно по размеру входа, размер выражения ограничен только памятью
+*/
+char *readInput(FILE *stream, size_t *length)
+{
+    size_t capacity = INPUT_SIZE;
+    size_t used = 0;
+    char *buffer = malloc(capacity);
+    if (!buffer)
+        return NULL;
+
+    for (;;)
     {
-        char c = *str;
-        if (!(isdigit((unsigned char)c) || isspace((unsigned char)c) || c == '(' || c == ')' || c == '*' || c == '+' ||
-              c == '/' || c == '-'))
+        if (capacity - used < INPUT_SIZE)
         {
-            // Недопустимый символ – завершаем работу с ошибкой.
-            exit(1);
+            char *grown = realloc(buffer, capacity * 2);
+            if (!grown)
+            {
+                free(buffer);
+                return NULL;
+            }
+            buffer = grown;
+            capacity *= 2;
         }
-        str++;
+        size_t wanted = capacity - used - 1; // место под завершающий '\0'
+        size_t n = fread(buffer + used, 1, wanted, stream);
+        used += n;
+        if (n < wanted)
+            break;
     }
+
+    if (ferror(stream))
+    {
+        free(buffer);
+        return NULL;
+    }
+    buffer[used] = '\0';
+    if (length)
+        *length = used;
+    return buffer;
+}
+
+/*
+Функции ниже – обёртки над реентерабельным ядром из calculator.c с прежним поведением:
+при ошибке разбора процесс завершается с кодом 1.
+*/
+
+/*
+Вход: парсер после разбора, указатель на строку (pointer to pointer)
+Выход: ничего (выход через exit, если разбор завершился ошибкой)
+Задача: Сдвигает указатель на строку на разобранную ядром часть
+*/
+static void advance(const CalcParser *parser, char **expression)
+{
+    if (parser->error)
+        exit(1);
+    *expression += parser->pos - parser->start;
 }
 
 /* ========== ЦЕЛОЧИСЛЕННЫЙ РЕЖИМ ========== */
@@ -81,17 +130,10 @@ void validateInput(const char *str)
 */
 int parseNumber(char **expression)
 {
-    if (!isdigit((unsigned char)**expression))
-    {
-        // Первый символ не цифра – значит, это не число!
-        exit(1);
-    }
-    int result = 0;
-    while (**expression && isdigit((unsigned char)**expression))
-    {
-        result = result * 10 + (**expression - '0');
-        (*expression)++;
-    }
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    int result = calcParseNumber(&parser);
+    advance(&parser, expression);
     return result;
 }
 
@@ -102,30 +144,11 @@ int parseNumber(char **expression)
 */
 int parseFactor(char **expression)
 {
-    skipSpaces(expression);
-
-    // Если встречаем знак + или - именно в начале фактора, это запрещённый "унарный" вариант.
-    if (**expression == '+' || **expression == '-')
-    {
-        exit(1);
-    }
-
-    if (**expression == '(')
-    {
-        (*expression)++; // пропускаем '('
-        int result = parseExpression(expression);
-        skipSpaces(expression);
-        if (**expression != ')')
-        {
-            exit(1); // отсутствует закрывающая скобка
-        }
-        (*expression)++; // пропускаем ')'
-        return result;
-    }
-    else
-    {
-        return parseNumber(expression);
-    }
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    int result = calcParseFactor(&parser);
+    advance(&parser, expression);
+    return result;
 }
 
 /*
@@ -135,29 +158,10 @@ int parseFactor(char **expression)
 */
 int parseTerm(char **expression)
 {
-    int result = parseFactor(expression);
-    while (true)
-    {
-        skipSpaces(expression);
-        if (**expression == '*')
-        {
-            (*expression)++;
-            int factor = parseFactor(expression);
-            result *= factor;
-        }
-        else if (**expression == '/')
-        {
-            (*expression)++;
-            int divisor = parseFactor(expression);
-            if (divisor == 0)
-                exit(1); // деление на 0 запрещено
-            result /= divisor;
-        }
-        else
-        {
-            break;
-        }
-    }
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    int result = calcParseTerm(&parser);
+    advance(&parser, expression);
     return result;
 }
 
@@ -168,25 +172,10 @@ int parseTerm(char **expression)
 */
 int parseExpression(char **expression)
 {
-    int result = parseTerm(expression);
-    while (true)
-    {
-        skipSpaces(expression);
-        if (**expression == '+')
-        {
-            (*expression)++;
-            result += parseTerm(expression);
-        }
-        else if (**expression == '-')
-        {
-            (*expression)++;
-            result -= parseTerm(expression);
-        }
-        else
-        {
-            break;
-        }
-    }
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    int result = calcParseExpression(&parser);
+    advance(&parser, expression);
     return result;
 }
 
@@ -199,16 +188,10 @@ int parseExpression(char **expression)
 */
 double parseNumberF(char **expression)
 {
-    if (!isdigit((unsigned char)**expression))
-    {
-        exit(1);
-    }
-    double result = 0.0;
-    while (**expression && isdigit((unsigned char)**expression))
-    {
-        result = result * 10.0 + ((double)(**expression - '0'));
-        (*expression)++;
-    }
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    double result = calcParseNumberF(&parser);
+    advance(&parser, expression);
     return result;
 }
 
@@ -219,26 +202,11 @@ double parseNumberF(char **expression)
 */
 double parseFactorF(char **expression)
 {
-    skipSpaces(expression);
-    // Если встречаем унарный плюс, это ошибка.
-    if (**expression == '+' || **expression == '-')
-    {
-        exit(1);
-    }
-
-    if (**expression == '(')
-    {
-        (*expression)++; // пропускаем '('
-        double result = parseExpressionF(expression);
-        skipSpaces(expression);
-        if (**expression != ')')
-        {
-            exit(1); // отсутствует закрывающая скобка
-        }
-        (*expression)++; // пропускаем ')'
-        return result;
-    }
-    return parseNumberF(expression);
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    double result = calcParseFactorF(&parser);
+    advance(&parser, expression);
+    return result;
 }
 
 /*
@@ -248,29 +216,10 @@ double parseFactorF(char **expression)
 */
 double parseTermF(char **expression)
 {
-    double result = parseFactorF(expression);
-    while (true)
-    {
-        skipSpaces(expression);
-        if (**expression == '*')
-        {
-            (*expression)++;
-            double factor = parseFactorF(expression);
-            result *= factor;
-        }
-        else if (**expression == '/')
-        {
-            (*expression)++;
-            double divisor = parseFactorF(expression);
-            if (divisor == 0.0)
-                exit(1); // деление на 0 запрещено
-            result /= divisor;
-        }
-        else
-        {
-            break;
-        }
-    }
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    double result = calcParseTermF(&parser);
+    advance(&parser, expression);
     return result;
 }
 
@@ -281,26 +230,95 @@ double parseTermF(char **expression)
 */
 double parseExpressionF(char **expression)
 {
-    double result = parseTermF(expression);
-    while (true)
+    CalcParser parser;
+    calcParserInit(&parser, *expression);
+    double result = calcParseExpressionF(&parser);
+    advance(&parser, expression);
+    return result;
+}
+
+#ifndef UNIT_TEST
+// Предел вложенности скобок (--max-depth N)
+static size_t max_depth = CALC_DEFAULT_MAX_DEPTH;
+
+/*
+Вход: строка с выражением
+Выход: 0 при успехе, 1 при ошибке
+Задача: Вычисляет выражение в текущем режиме и печатает результат.
+При ошибке печатает строку "error <смещение> <описание>", если задан verbose_error, иначе ничего.
+*/
+static int evaluateAndPrint(const char *input, int verbose_error)
+{
+    CalcError error;
+    size_t offset = 0;
+
+    if (use_float)
     {
-        skipSpaces(expression);
-        if (**expression == '+')
-        {
-            (*expression)++;
-            result += parseTermF(expression);
-        }
-        else if (**expression == '-')
-        {
-            (*expression)++;
-            result -= parseTermF(expression);
-        }
-        else
+        double result;
+        error = evaluateFloatDepth(input, max_depth, &result, &offset);
+        if (!error)
+            printf("%f\n", result);
+    }
+    else
+    {
+        int result;
+        error = evaluateIntDepth(input, max_depth, &result, &offset);
+        if (!error)
+            printf("%d\n", result);
+    }
+
+    if (error && verbose_error)
+        printf("error %zu %s\n", offset, calcErrorMessage(error));
+    return error ? 1 : 0;
+}
+
+/*
+Вход: входной поток, указатель на буфер и указатель на его ёмкость
+Выход: длина прочитанной строки или -1, если поток закончился
+Задача: Читает одну строку произвольной длины (без символа '\n'), при необходимости расширяя буфер
+*/
+static long readLine(FILE *stream, char **buffer, size_t *capacity)
+{
+    size_t length = 0;
+    int c;
+    while ((c = getc(stream)) != EOF && c != '\n')
+    {
+        if (length + 1 >= *capacity)
         {
-            break;
+            char *grown = realloc(*buffer, *capacity * 2);
+            if (!grown)
+                exit(1);
+            *buffer = grown;
+            *capacity *= 2;
         }
+        (*buffer)[length++] = (char)c;
     }
-    return result;
+    if (c == EOF && length == 0)
+        return -1;
+    (*buffer)[length] = '\0';
+    return (long)length;
+}
+
+/*
+Вход: выражения со стандартного потока ввода, по одному на строку
+Выход: по одной строке с результатом (или "error ...") на каждое выражение
+Задача: Долгоживущий режим для пула вычислителей сервера: обрабатывает строки, пока не закроется stdin
+*/
+static int serve(void)
+{
+    size_t capacity = INPUT_SIZE;
+    char *line = malloc(capacity);
+    if (!line)
+        return 1;
+
+    while (readLine(stdin, &line, &capacity) >= 0)
+    {
+        evaluateAndPrint(line, 1);
+        fflush(stdout);
+    }
+
+    free(line);
+    return 0;
 }
 
 /*
@@ -308,48 +326,37 @@ double parseExpressionF(char **expression)
 Выход: вывод результата вычисления через stdout
 Задача: Читает входной текст, проверяет корректность символов, разбирает арифметическое выражение
 в целочисленном или вещественном режиме (в зависимости от флага --float), и выводит результат.
+С флагом --serve обрабатывает поток выражений построчно, не завершаясь при ошибках.
+--max-depth N ограничивает вложенность скобок (по умолчанию CALC_DEFAULT_MAX_DEPTH).
 */
-#ifndef UNIT_TEST
 int main(int argc, char *argv[])
 {
-    if (argc > 1)
+    int serve_requested = 0;
+    for (int i = 1; i < argc; i++)
     {
-        if (strcmp(argv[1], "--float") == 0)
+        if (strcmp(argv[i], "--float") == 0)
         {
             use_float = 1;
         }
+        else if (strcmp(argv[i], "--serve") == 0)
+        {
+            serve_requested = 1;
+        }
+        else if (strcmp(argv[i], "--max-depth") == 0 && i + 1 < argc)
+        {
+            max_depth = strtoul(argv[++i], NULL, 10);
+        }
     }
 
-    char buffer[INPUT_SIZE];
-    char input[INPUT_SIZE] = "";
-
-    while (fgets(buffer, sizeof(buffer), stdin))
-    {
-        strcat(input, buffer);
-    }
-
-    trim(input);
-    validateInput(input);
+    if (serve_requested)
+        return serve();
 
-    char *expression = input;
+    char *input = readInput(stdin, NULL);
+    if (!input)
+        return 1;
 
-    if (use_float)
-    {
-        double result = parseExpressionF(&expression);
-        skipSpaces(&expression);
-        if (*expression != '\0')
-            exit(1);
-        printf("%f\n", result);
-    }
-    else
-    {
-        int result = parseExpression(&expression);
-        skipSpaces(&expression);
-        if (*expression != '\0')
-            exit(1);
-        printf("%d\n", result);
-    }
-
-    return 0;
+    int status = evaluateAndPrint(input, 0);
+    free(input);
+    return status;
 }
 #endif
@@ -0,0 +1,82 @@
+# tests/integration/test_async_db.py
+
+import time
+import asyncio
+import sqlite3
+
+import pytest
+
+from server import database, async_db
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "history.db"))
+    yield database.DB_PATH
+
+
+def fill_history(path, rows):
+    with sqlite3.connect(path) as conn:
+        database.insert_records(
+            conn,
+            ((f"{i} + 1", str(i + 1), i % 2 == 0, "2024-01-01T00:00:00") for i in range(rows)),
+        )
+
+
+def test_read_and_write_roundtrip(db):
+    async def scenario():
+        await async_db.init()
+        try:
+            async_db.add_record("2 + 2", "4", False)
+            await asyncio.to_thread(database.flush_writes, 5)
+            return await async_db.get_all_records()
+        finally:
+            await async_db.close()
+
+    records = asyncio.run(scenario())
+    assert [(r["expression"], r["result"]) for r in records] == [("2 + 2", "4")]
+
+
+def test_event_loop_responsive_during_large_query(db):
+    """
+    Пока большой запрос истории выполняется в пуле чтения, цикл событий продолжает
+    обслуживать другие корутины: задержка тиков остаётся маленькой.
+    """
+    async def scenario():
+        await async_db.init()
+        fill_history(db, 300_000)
+        try:
+            query = asyncio.create_task(async_db.get_all_records())
+            ticks = 0
+            max_lag = 0.0
+            while not query.done():
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                max_lag = max(max_lag, time.perf_counter() - started)
+                ticks += 1
+            return len(await query), ticks, max_lag
+        finally:
+            await async_db.close()
+
+    rows, ticks, max_lag = asyncio.run(scenario())
+    assert rows == 300_000
+    assert ticks > 10, "цикл событий не получал управления во время запроса"
+    assert max_lag < 0.25, f"цикл событий простаивал {max_lag:.3f} с"
+
+
+def test_reads_do_not_wait_for_writes(db):
+    """Открытая пишущая транзакция не блокирует чтение (WAL)."""
+    async def scenario():
+        await async_db.init()
+        fill_history(db, 10)
+        writer = sqlite3.connect(db, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        database.insert_records(writer, [("1", "1", False, "2024-01-01T00:00:00")])
+        try:
+            return await asyncio.wait_for(async_db.get_all_records(), timeout=2)
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+            await async_db.close()
+
+    assert len(asyncio.run(scenario())) == 10
@@ -0,0 +1,73 @@
+# tests/integration/test_cache.py
+
+import random
+import subprocess
+import time
+
+from server.cache import ResultCache, canonicalize
+
+
+def run_app(expression, float_mode=False):
+    """Вычисляет выражение через app.exe; возвращает stdout или None при ошибке."""
+    cmd = ["./build/app.exe"] + (["--float"] if float_mode else [])
+    res = subprocess.run(cmd, input=expression, text=True, capture_output=True)
+    return res.stdout.strip() if res.returncode == 0 else None
+
+
+def test_canonicalize_whitespace():
+    assert canonicalize("2+3*(7-1)") == canonicalize(" 2 + 3 * ( 7 - 1 )\t\n") == "2+3*(7-1)"
+
+
+def test_canonicalize_keeps_space_between_numbers():
+    # "1 2" – ошибка в C-вычислителе, её нельзя склеивать в "12"
+    assert canonicalize("1 2") == "1 2"
+    assert canonicalize("12") == "12"
+
+
+def test_canonicalize_rejects_invalid_chars():
+    assert canonicalize("abc + 5") is None
+    assert canonicalize("1 + 2") is None  # неразрывный пробел не isspace() в локали "C"
+
+
+def test_canonical_form_matches_evaluator():
+    """
+    Каноническая форма должна вычисляться так же, как исходное выражение.
+    """
+    rng = random.Random(42)
+    tokens = ["1", "2", "10", "(", ")", "+", "-", "*", "/", "0"]
+    spaces = ["", " ", "  ", "\t", "\n"]
+    for _ in range(200):
+        expression = "".join(rng.choice(tokens) + rng.choice(spaces) for _ in range(rng.randint(1, 8)))
+        assert run_app(canonicalize(expression)) == run_app(expression), expression
+
+
+def test_cache_hit_and_miss_counters():
+    cache = ResultCache()
+    assert cache.get("2 + 3", False) is None
+    cache.put("2 + 3", False, "5")
+    assert cache.get("2+3", False) == "5"
+    assert cache.get("2+3", True) is None  # другой режим – другой ключ
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_lru_eviction():
+    cache = ResultCache(max_entries=2)
+    cache.put("1", False, "1")
+    cache.put("2", False, "2")
+    cache.get("1", False)  # "1" становится самым свежим
+    cache.put("3", False, "3")
+    assert cache.get("2", False) is None
+    assert cache.get("1", False) == "1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_byte_limit_and_ttl():
+    cache = ResultCache(max_bytes=6, ttl=0.01)
+    cache.put("1+1", False, "2")
+    cache.put("2+2", False, "4")
+    assert cache.stats()["bytes"] <= 6
+    assert cache.get("1+1", False) is None
+
+    time.sleep(0.02)
+    assert cache.get("2+2", False) is None
@@ -0,0 +1,88 @@
+# tests/integration/test_compiled.py
+
+import pickle
+import random
+
+import pytest
+
+from server import libcalc
+from server.compiled import compile, CompileCache, CONST
+from server.grammar import ExpressionError, DIVISION_BY_ZERO, UNKNOWN_VARIABLE
+
+
+def random_expression(rng: random.Random, depth: int = 0) -> str:
+    if depth > 4 or rng.random() < 0.3:
+        return rng.choice([str(rng.randint(0, 2 ** 33)), str(rng.randint(0, 9)), "0"])
+    operator = rng.choice([" + ", " - ", "*", " / ", "  /"])
+    return f"({random_expression(rng, depth + 1)}{operator}{random_expression(rng, depth + 1)})"
+
+
+def test_matches_c_evaluator():
+    """
+    Результаты, ошибки и их смещения совпадают с libcalc.so, в том числе после свёртки констант
+    и при повторном использовании кэша для другой записи того же выражения.
+    """
+    rng = random.Random(3)
+    cache = CompileCache()
+    for _ in range(500):
+        expression = random_expression(rng)
+        for float_mode in (False, True):
+            try:
+                expected = libcalc.evaluate(expression, float_mode)
+            except libcalc.LibCalcError as e:
+                with pytest.raises(ExpressionError) as info:
+                    compile(expression, float_mode, cache=cache).evaluate()
+                assert (info.value.code, info.value.offset) == (e.code, e.offset), expression
+                continue
+            value = compile(expression, float_mode, cache=cache).evaluate()
+            assert ("%f" % value if float_mode else "%d" % value) == expected, expression
+
+
+def test_constant_folding():
+    assert compile("2 * 3 + 4 * (5 - 1)", cache=None).code == ((CONST, 22),)
+    # Деление на ноль не сворачивается: ошибка – при вычислении, со смещением делителя
+    compiled = compile("x + 1 / (2 - 2)", cache=None)
+    assert [op for op, _ in compiled.code].count("/") == 1
+    with pytest.raises(ExpressionError) as info:
+        compiled.evaluate({"x": 1})
+    assert (info.value.code, info.value.offset) == (DIVISION_BY_ZERO, 8)
+
+
+def test_variables_and_pickle():
+    compiled = compile("(price + tax) * qty - price / 2")
+    restored = pickle.loads(pickle.dumps(compiled))
+    for values in ({"price": 10, "tax": 2, "qty": 3}, {"price": -7, "tax": 0, "qty": 2147483647}):
+        assert restored.evaluate(values) == compiled.evaluate(values)
+    assert compiled.evaluate({"price": 10, "tax": 2, "qty": 3}) == 31
+    assert compile("a / b", float_mode=True).evaluate({"a": 1, "b": 4}) == 0.25
+
+    with pytest.raises(ExpressionError) as info:
+        compiled.evaluate({"price": 1, "qty": 1})
+    assert (info.value.code, info.value.offset) == (UNKNOWN_VARIABLE, 9)
+    with pytest.raises(ValueError):
+        compiled.evaluate({"price": 1.5, "tax": 0, "qty": 1})
+
+
+def test_cache_keyed_by_normalized_source():
+    cache = CompileCache(max_entries=2)
+    first = compile("x / 0", cache=cache)
+    second = compile("  x/ 0", cache=cache)
+    assert second.code is first.code
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+    # Смещение ошибки – в той строке, что передана в compile
+    with pytest.raises(ExpressionError) as info:
+        second.evaluate({"x": 1})
+    assert info.value.offset == 5
+
+    compile("1 + 1", cache=cache)
+    compile("2 + 2", cache=cache)
+    assert cache.stats()["entries"] == 2
+    assert ("x/0", False, 100000) not in cache.entries
+
+
+def test_deep_nesting():
+    depth = 100000
+    compiled = compile("(" * depth + "x" + " * 1 + 1)" * depth, cache=None)
+    assert compiled.evaluate({"x": 1}) == depth + 1
+    compiled = compile("(" * 500 + "x" + " + 1)" * 500, cache=None)
+    assert compiled.evaluate({"x": 2147483647}) == -2147483648 + 499
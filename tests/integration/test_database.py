@@ -0,0 +1,185 @@
+# tests/integration/test_database.py
+
+import sqlite3
+import time
+
+import pytest
+
+from server import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Временная БД history.db для каждого теста."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "history.db"))
+    database.init_db()
+    yield database.DB_PATH
+    database.stop_writer()
+
+
+def count_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+def test_add_record_without_writer(db):
+    database.add_record("1 + 2", "3", False)
+    assert database.get_all_records()[0]["result"] == "3"
+
+
+def test_writer_uses_wal(db):
+    database.start_writer()
+    database.add_record("1 + 2", "3", False)
+    assert database.flush_writes(timeout=5)
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_writer_commits_in_batches(db):
+    writer = database.start_writer(batch_size=100, flush_interval=60)
+    for i in range(250):
+        database.add_record(f"{i} + 0", str(i), False)
+    # Две полные пачки фиксируются сразу, остаток ждёт таймера или flush
+    deadline = time.monotonic() + 5
+    while writer.committed < 200 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.committed == 200
+    assert database.flush_writes(timeout=5)
+    assert count_rows(db) == 250
+
+
+def test_writer_reports_only_committed_records(db):
+    """on_commit получает записи после фиксации; при сбое пачки – только те, что удалось записать по одной."""
+    writer = database.start_writer(batch_size=1000, flush_interval=60)
+    taken = writer.next_id + 1
+    with sqlite3.connect(db) as conn:
+        # Чужая запись с id, который писатель выдаст второй записи пачки
+        database.insert_records(conn, [("0", "0", False, "2024-01-01T00:00:00")], [taken])
+    committed = []
+    ids = database.add_records([("1", "1", False), ("2", "2", False), ("3", "3", False)], committed.extend)
+    assert committed == []  # ещё ничего не зафиксировано
+    assert database.flush_writes(timeout=5)
+    assert [record[0] for record in committed] == [ids[0], ids[2]]
+    assert writer.dropped == 1
+    assert count_rows(db) == 3
+
+
+def test_writer_flushes_on_interval(db):
+    database.start_writer(batch_size=1000, flush_interval=0.01)
+    database.add_records([("1", "1", False), ("2", "2", True)])
+    deadline = time.monotonic() + 5
+    while count_rows(db) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert count_rows(db) == 2
+
+
+def test_writer_flushes_everything_on_stop(db):
+    database.start_writer(batch_size=1000, flush_interval=60)
+    for i in range(10):
+        database.add_record(str(i), str(i), False)
+    database.stop_writer()
+    assert [r["expression"] for r in database.get_all_records()] == [str(i) for i in range(10)]
+
+
+def test_fetch_history_page_keyset(db):
+    database.add_records([(str(i), str(i), i % 2 == 1) for i in range(10)])
+    with sqlite3.connect(db) as conn:
+        first = database.fetch_history_page(conn, limit=4)
+        second = database.fetch_history_page(conn, cursor=first[-1]["id"], limit=4)
+        backward = database.fetch_history_page(conn, cursor=second[0]["id"], limit=10, descending=True)
+        floats = database.fetch_history_page(conn, limit=10, float_mode=True)
+
+    assert [r["expression"] for r in first] == ["0", "1", "2", "3"]
+    assert [r["expression"] for r in second] == ["4", "5", "6", "7"]
+    assert [r["expression"] for r in backward] == ["3", "2", "1", "0"]
+    assert [r["expression"] for r in floats] == ["1", "3", "5", "7", "9"]
+
+
+def test_fetch_history_page_time_range(db):
+    with sqlite3.connect(db) as conn:
+        database.insert_records(conn, [
+            ("1", "1", False, "2024-01-01T10:00:00"),
+            ("2", "2", False, "2024-01-02T10:00:00"),
+            ("3", "3", False, "2024-01-03T10:00:00"),
+        ])
+        page = database.fetch_history_page(conn, since="2024-01-02", until="2024-01-03")
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM history WHERE ts >= ? ORDER BY ts", ("2024",)))
+    assert [r["expression"] for r in page] == ["2"]
+    assert "idx_history_ts" in plan
+
+
+def test_writer_assigns_ids_up_front(db):
+    database.add_record("0", "0", False)  # id=1 без писателя
+    database.start_writer(batch_size=1000, flush_interval=60)
+    first = database.add_record("1", "1", False)
+    ids = database.add_records([("2", "2", False), ("3", "3", True)])
+    assert (first, ids) == (2, [3, 4])
+    database.flush_writes(timeout=5)
+    with sqlite3.connect(db) as conn:
+        assert [row[0] for row in conn.execute("SELECT id FROM history ORDER BY id")] == [1, 2, 3, 4]
+
+
+def test_fetch_history_since(db):
+    database.add_records([(str(i), str(i), False) for i in range(10)])
+    with sqlite3.connect(db) as conn:
+        delta, truncated = database.fetch_history_since(conn, since=7, limit=5)
+        assert ([r["id"] for r in delta], truncated) == ([8, 9, 10], False)
+
+        recent, truncated = database.fetch_history_since(conn, since=2, limit=5)
+        assert ([r["id"] for r in recent], truncated) == ([6, 7, 8, 9, 10], True)
+
+        snapshot, truncated = database.fetch_history_since(conn, limit=20)
+        assert (len(snapshot), truncated) == (10, False)
+
+
+def test_expressions_are_interned(db):
+    """Повторяющееся выражение хранится один раз, ts – целым числом; наружу записи прежнего вида."""
+    database.start_writer(batch_size=1000, flush_interval=60)
+    database.add_records([("1 + 1", "2", False), ("2 * 3", "6", False)])
+    database.add_record("1 + 1", "2", True)
+    database.stop_writer()
+    database.add_record("2 * 3", "6", False)  # без писателя
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT expression FROM expressions ORDER BY id").fetchall() == [("1 + 1",), ("2 * 3",)]
+        assert conn.execute("SELECT typeof(ts) FROM history GROUP BY 1").fetchall() == [("integer",)]
+    records = database.get_all_records()
+    assert [(r["expression"], r["float_mode"]) for r in records] == [
+        ("1 + 1", False), ("2 * 3", False), ("1 + 1", True), ("2 * 3", False)]
+    assert sorted(records[0]) == ["expression", "float_mode", "result", "timestamp"]
+
+
+def test_timestamp_round_trip():
+    for timestamp in ("2024-03-31T02:30:00", "2024-01-01T10:00:00.123456", "1999-12-31T23:59:59.000001"):
+        assert database.from_epoch(database.to_epoch(timestamp)) == timestamp
+    assert database.to_epoch("1970-01-01T00:00:01+00:00") == 1_000_000
+
+
+def test_migrate_old_database(tmp_path, monkeypatch):
+    """
+    История прежней схемы (текст выражения и ISO-строка ts в каждой строке) переносится с теми же id,
+    полями и счётчиком AUTOINCREMENT, а файл БД уменьшается.
+    """
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, expression TEXT NOT NULL, "
+                     "result TEXT NOT NULL, float_mode BOOLEAN NOT NULL, ts TEXT NOT NULL)")
+        conn.executemany("INSERT INTO history (expression, result, float_mode, ts) VALUES (?, ?, ?, ?)", (
+            (f"({i % 50} + 123456789) * 987654321 / 3", str(i % 50), i % 2 == 0, f"2024-01-01T10:{i % 60:02}:00.500000")
+            for i in range(20000)
+        ))
+        conn.execute("DELETE FROM history WHERE id >= 19990")
+        expected = [
+            {"expression": e, "result": r, "float_mode": bool(f), "timestamp": t}
+            for e, r, f, t in conn.execute("SELECT expression, result, float_mode, ts FROM history ORDER BY id")
+        ]
+    size_before = (tmp_path / "old.db").stat().st_size
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    database.init_db()  # Повторный запуск ничего не меняет
+
+    assert database.get_all_records() == expected
+    assert (tmp_path / "old.db").stat().st_size < size_before / 2
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM expressions").fetchone()[0] == 50
+        assert database.next_history_id(conn) == 20001
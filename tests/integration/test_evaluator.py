@@ -0,0 +1,205 @@
+# tests/integration/test_evaluator.py
+
+import asyncio
+
+import pytest
+
+from server.evaluator import APP_PATH, EvaluatorPool, EvaluatorError, EvaluatorWorker, LibraryEvaluator
+
+
+def run_with_pool(coro_factory, size=2, float_mode=False):
+    """
+    Запускает пул вычислителей, выполняет coro_factory(pool) и останавливает пул.
+    """
+    async def runner():
+        pool = EvaluatorPool(size=size, float_mode=float_mode)
+        await pool.start()
+        try:
+            return await coro_factory(pool)
+        finally:
+            await pool.stop()
+
+    return asyncio.run(runner())
+
+
+def test_pool_int():
+    assert run_with_pool(lambda pool: pool.evaluate("2 + 3 * (7 - 1)")) == "20"
+
+
+def test_pool_float():
+    result = run_with_pool(lambda pool: pool.evaluate("3 / 2"), float_mode=True)
+    assert round(float(result), 4) == 1.5
+
+
+def test_pool_error_keeps_worker_alive():
+    async def scenario(pool):
+        with pytest.raises(EvaluatorError):
+            await pool.evaluate("10 / 0")
+        return await pool.evaluate("10 / 3")
+
+    assert run_with_pool(scenario, size=1) == "3"
+
+
+def test_pool_multiline_expression():
+    assert run_with_pool(lambda pool: pool.evaluate("1 +\n2")) == "3"
+
+
+def test_pool_concurrent_requests_keep_order():
+    async def scenario(pool):
+        return await asyncio.gather(*(pool.evaluate(f"{i} * 2") for i in range(200)))
+
+    assert run_with_pool(scenario, size=3) == [str(i * 2) for i in range(200)]
+
+
+def test_pool_restarts_crashed_worker():
+    async def scenario(pool):
+        worker = pool.workers[0]
+        old_pid = worker.process.pid
+        worker.process.kill()
+        await worker.process.wait()
+        # Пока процесс перезапускается, запрос либо дождётся нового процесса, либо получит ошибку
+        try:
+            await pool.evaluate("1 + 1")
+        except EvaluatorError:
+            pass
+        result = await pool.evaluate("4 + 4")
+        return old_pid, worker.process.pid, result
+
+    old_pid, new_pid, result = run_with_pool(scenario, size=1)
+    assert old_pid != new_pid
+    assert result == "8"
+
+
+async def wait_until(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_worker_restart_failure_fails_fast():
+    """Если процесс не перезапускается, запросы сразу получают ошибку, а попытки запуска продолжаются."""
+    async def scenario():
+        worker = EvaluatorWorker([APP_PATH, "--serve"], timeout=5)
+        await worker.start()
+        try:
+            worker.cmd = ["/nonexistent/app.exe", "--serve"]
+            worker.process.kill()
+            await wait_until(lambda: worker.failed is not None)
+            with pytest.raises(EvaluatorError, match="restart failed"):
+                await asyncio.wait_for(worker.evaluate("1 + 1"), 1)
+
+            worker.cmd = [APP_PATH, "--serve"]
+            await wait_until(lambda: worker.failed is None)
+            return await worker.evaluate("2 + 2")
+        finally:
+            await worker.stop()
+
+    assert asyncio.run(scenario()) == "4"
+
+
+def test_worker_timeout_restarts_hung_process():
+    async def scenario():
+        worker = EvaluatorWorker(["sleep", "30"], timeout=0.2)
+        await worker.start()
+        try:
+            pid = worker.process.pid
+            with pytest.raises(EvaluatorError, match="timed out"):
+                await worker.evaluate("1 + 1")
+            await wait_until(lambda: worker.process.pid != pid and worker.ready.is_set())
+            return await worker.evaluate_many(["1", "2"])
+        finally:
+            await worker.stop()
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["Evaluator timed out"] * 2
+
+
+def test_library_backend_matches_subprocess():
+    """
+    libcalc.so и app.exe --serve должны давать одинаковые результаты и ошибки.
+    """
+    expressions = ["1 + 2", "10 / 3", "2 * (3 + 4)", "10 / 0", "abc", "1 ++ 2", "(1", "  7  ", "3 / 2"]
+
+    async def scenario():
+        outcomes = []
+        for float_mode in (False, True):
+            pool = EvaluatorPool(size=1, float_mode=float_mode)
+            library = LibraryEvaluator(float_mode=float_mode)
+            await pool.start()
+            await library.start()
+            try:
+                for expression in expressions:
+                    pair = []
+                    for evaluator in (pool, library):
+                        try:
+                            pair.append(await evaluator.evaluate(expression))
+                        except EvaluatorError as e:
+                            pair.append(f"error: {e}")
+                    outcomes.append(pair)
+            finally:
+                await pool.stop()
+        return outcomes
+
+    for from_pool, from_library in asyncio.run(scenario()):
+        assert from_pool == from_library
+
+
+def test_pool_evaluate_many():
+    results = run_with_pool(lambda pool: pool.evaluate_many(["1 + 1", "1 / 0", "6 * 7"]), size=1)
+    assert results[0] == "2"
+    assert isinstance(results[1], EvaluatorError)
+    assert results[2] == "42"
+
+
+def test_max_depth_both_backends():
+    """
+    Предел вложенности скобок одинаково соблюдается app.exe --max-depth и libcalc.
+    """
+    deep = "(" * 11 + "1" + ")" * 11
+
+    async def scenario():
+        pool = EvaluatorPool(size=1, max_depth=10)
+        library = LibraryEvaluator(max_depth=10)
+        await pool.start()
+        await library.start()
+        try:
+            errors = []
+            for evaluator in (pool, library):
+                with pytest.raises(EvaluatorError) as info:
+                    await evaluator.evaluate(deep)
+                errors.append(str(info.value))
+            return errors, await library.evaluate(deep[1:-1])
+        finally:
+            await pool.stop()
+
+    errors, shallower = asyncio.run(scenario())
+    assert errors == ["Parentheses nested too deeply at position 10"] * 2
+    assert shallower == "1"
+
+
+def test_library_does_not_block_event_loop():
+    """Пакет длинных выражений вычисляется в потоке: цикл событий продолжает обслуживать другие задачи."""
+    expressions = ["1 + " * 20000 + "1"] * 100
+
+    async def scenario():
+        library = LibraryEvaluator()
+        await library.start()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        started = ticks
+        results = await library.evaluate_many(expressions)
+        task.cancel()
+        return results, ticks - started
+
+    results, ticks = asyncio.run(scenario())
+    assert results == ["20001"] * 100
+    assert ticks > 1
@@ -0,0 +1,147 @@
+# tests/integration/test_fanout.py
+
+import json
+import asyncio
+
+from server import wire
+from server.fanout import Broadcaster
+
+
+class FakeWebSocket:
+    """WebSocket-заглушка: записывает отправленное; blocked=True имитирует зависшего клиента."""
+
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.blocked = blocked
+        self.closed_with = None
+        self.release = asyncio.Event()
+
+    async def send_text(self, text):
+        if self.blocked:
+            await self.release.wait()
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(wire.decode_frame(data))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def record(i):
+    return {"id": i, "expression": f"{i} + 0", "result": str(i), "float_mode": False}
+
+
+def test_slow_client_does_not_delay_others():
+    async def scenario():
+        broadcaster = Broadcaster(max_queue=4, policy="drop_oldest")
+        fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+        for ws in (fast, slow):
+            broadcaster.register(ws).start()
+        for i in range(1, 11):
+            broadcaster.publish(record(i))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        stats = broadcaster.stats()
+        return fast, slow, stats
+
+    fast, slow, stats = asyncio.run(scenario())
+    assert [m["id"] for m in fast.sent] == list(range(1, 11))
+    assert stats["max_queue_depth"] <= 4
+    assert stats["dropped"] > 0
+
+
+def test_coalesce_policy_merges_queue():
+    async def scenario():
+        broadcaster = Broadcaster(max_queue=2, policy="coalesce")
+        ws = FakeWebSocket(blocked=True)
+        client = broadcaster.register(ws)
+        client.start()
+        for i in range(1, 6):
+            broadcaster.publish(record(i))
+        ws.blocked = False
+        ws.release.set()
+        await asyncio.sleep(0.01)
+        return ws
+
+    ws = asyncio.run(scenario())
+    delivered = [r["id"] for m in ws.sent for r in (m["records"] if "records" in m else [m])]
+    assert delivered == [1, 2, 3, 4, 5]
+
+
+def test_disconnect_policy_closes_slow_client():
+    async def scenario():
+        broadcaster = Broadcaster(max_queue=2, policy="disconnect")
+        ws = FakeWebSocket(blocked=True)
+        broadcaster.register(ws).start()
+        for i in range(1, 6):
+            broadcaster.publish(record(i))
+        await asyncio.sleep(0.01)
+        return ws, broadcaster.stats()
+
+    ws, stats = asyncio.run(scenario())
+    assert ws.closed_with == 1013
+    assert stats["clients"] == 0
+    assert stats["slow_disconnects"] == 1
+
+
+def test_paused_client_skips_records_already_in_snapshot():
+    async def scenario():
+        broadcaster = Broadcaster()
+        ws = FakeWebSocket()
+        client = broadcaster.register(ws)
+        broadcaster.publish(record(1))
+        broadcaster.publish({"records": [record(2), record(3)]})
+        client.start(last_id=2)
+        await asyncio.sleep(0.01)
+        return ws
+
+    ws = asyncio.run(scenario())
+    assert ws.sent == [{"records": [record(3)]}]
+
+
+def test_replies_bypass_broadcast_queue():
+    """Ответы клиенту уходят раньше накопленной рассылки и не выбрасываются при переполнении."""
+    async def scenario():
+        broadcaster = Broadcaster(max_queue=2, policy="drop_oldest")
+        ws = FakeWebSocket()
+        client = broadcaster.register(ws)
+        for i in range(1, 5):
+            broadcaster.publish(record(i))
+        for i in range(3):
+            client.reply({"type": "calc_result", "id": i})
+        client.start()
+        await asyncio.sleep(0.01)
+        return ws.sent
+
+    sent = asyncio.run(scenario())
+    assert [m.get("type") for m in sent[:3]] == ["calc_result"] * 3
+    assert [m["id"] for m in sent[3:]] == [3, 4]
+
+
+def test_binary_client_gets_batched_frames():
+    """Двоичный клиент: записи, опубликованные в пределах окна, приходят одним кадром wire."""
+    async def scenario():
+        broadcaster = Broadcaster(max_queue=64, policy="drop_oldest")
+        binary, text = FakeWebSocket(), FakeWebSocket()
+        broadcaster.register(binary, binary=True).start()
+        broadcaster.register(text).start()
+        for i in range(1, 4):
+            broadcaster.publish(record(i))
+        broadcaster.publish({"records": [record(4), record(5)]})
+        await asyncio.sleep(0.05)
+        broadcaster.publish(record(6))
+        await asyncio.sleep(0.05)
+        return binary, text, broadcaster.stats()
+
+    binary, text, stats = asyncio.run(scenario())
+    assert binary.sent == [{"records": [record(i) for i in range(1, 6)]}, {"records": [record(6)]}]
+    assert [m.get("id") for m in text.sent] == [1, 2, 3, None, 6]
+    assert stats["binary_clients"] == 1
+
+
+def test_wire_history_round_trip():
+    records = [dict(record(1), timestamp="2024-01-01T00:00:00"), dict(record(2), expression="√ 2", float_mode=True)]
+    assert wire.decode_frame(wire.history_frame(records, since=7, truncated=True)) == {
+        "history": records, "since": 7, "truncated": True}
+    assert wire.decode_frame(wire.history_frame([])) == {"history": [], "since": None, "truncated": False}
@@ -0,0 +1,84 @@
+# tests/integration/test_grammar.py
+
+import io
+import random
+
+import pytest
+
+from server import libcalc
+from server.grammar import parse, ExpressionError, DIVISION_BY_ZERO
+from server.vectorized import evaluate_columns, load_csv, load_npz
+
+
+@pytest.fixture
+def np():
+    return pytest.importorskip("numpy")
+
+
+def literal(value: int) -> str:
+    """Число для подстановки в выражение: унарного минуса в грамматике нет."""
+    return str(value) if value >= 0 else f"(0 - {-value})"
+
+
+def test_parse_errors_match_c_evaluator():
+    """
+    Ошибки разбора и их смещения совпадают с libcalc.so (для выражений без переменных).
+    """
+    for expression in ["1 +", "(1 + 2", "1 2", "-1", "()", "1 $ 2", "3 * (2 + ", "(1) (2)", "2 * )"]:
+        with pytest.raises(libcalc.LibCalcError) as expected:
+            libcalc.evaluate(expression)
+        with pytest.raises(ExpressionError) as actual:
+            parse(expression)
+        assert (actual.value.code, actual.value.offset) == (expected.value.code, expected.value.offset), expression
+
+
+def test_variables_in_order_of_appearance():
+    program = parse("(price + tax) * qty - price / 2")
+    assert program.variables == ("price", "tax", "qty")
+
+
+def test_vector_matches_c_evaluator_per_row(np):
+    """
+    Каждая строка совпадает с вычислением той же формулы с подставленными числами в C,
+    включая деление с отбрасыванием дробной части и деление на ноль.
+    """
+    rng = random.Random(7)
+    template = "(a + b) * 2 - c / d"
+    columns = {name: [rng.randint(-50, 50) for _ in range(200)] for name in "abcd"}
+    for float_mode in (False, True):
+        result = evaluate_columns(template, columns, float_mode)
+        for row in range(200):
+            expression = template
+            for name in "abcd":
+                expression = expression.replace(name, literal(columns[name][row]))
+            try:
+                expected = libcalc.evaluate(expression, float_mode)
+            except libcalc.LibCalcError as e:
+                assert result.error_codes[row] == e.code
+                continue
+            assert result.error_codes[row] == 0
+            assert abs(float(expected) - result.values[row]) < 1e-5
+
+
+def test_vector_int_semantics(np):
+    result = evaluate_columns("a / b", {"a": [7, -7, 7, -2147483648, 1], "b": [2, 2, -2, -1, 0]})
+    assert result.values.tolist()[:3] == [3, -3, -3]
+    assert result.errors() == [(3, "Integer overflow at position 4"), (4, "Division by zero at position 4")]
+    assert result.error_codes[4] == DIVISION_BY_ZERO
+
+
+def test_vector_constant_and_unknown_variable(np):
+    assert evaluate_columns("6 * 7", {}, rows=3).values.tolist() == [42, 42, 42]
+    with pytest.raises(ExpressionError) as info:
+        evaluate_columns("ab + a", {"ab": [1]})
+    assert info.value.offset == 5
+
+
+def test_load_csv_and_npz(np):
+    columns = load_csv(b"a,b\n1,2\n3,4\n")
+    assert evaluate_columns("a * b", columns).values.tolist() == [2, 12]
+
+    buffer = io.BytesIO()
+    np.savez(buffer, a=np.arange(3), b=np.full(3, 2))
+    columns = load_npz(buffer.getvalue())
+    assert evaluate_columns("a / b", columns, float_mode=True).values.tolist() == [0.0, 0.5, 1.0]
@@ -0,0 +1,75 @@
+# tests/integration/test_logging.py
+
+import json
+import sys
+
+import pytest
+
+sys.path.insert(0, "server")  # server.py импортирует logging_conf как модуль верхнего уровня
+
+import logging_conf  # noqa: E402
+from logging_conf import QueueLogSink  # noqa: E402
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_sink_writes_all_events_on_close(tmp_path):
+    sink = QueueLogSink(tmp_path / "server.log", flush_interval=60)
+    for i in range(100):
+        sink.put({"event": "calc_success", "n": i})
+    sink.close()
+    assert [e["n"] for e in read_lines(tmp_path / "server.log")] == list(range(100))
+
+
+def test_sink_rotates_by_size(tmp_path):
+    sink = QueueLogSink(tmp_path / "server.log", max_bytes=200, backups=2)
+    for i in range(50):
+        sink.put({"event": "x" * 20, "n": i})
+    sink.close()
+    assert (tmp_path / "server.log.1").exists()
+    assert not (tmp_path / "server.log.3").exists()
+
+
+def test_sink_drop_new_when_full(tmp_path):
+    sink = QueueLogSink(tmp_path / "server.log", queue_size=3, overflow="drop_new")
+    # Пока мы держим (реентерабельную) блокировку очереди, фоновый поток не может её разгрузить
+    with sink.condition:
+        for i in range(10):
+            sink.put({"event": "burst", "n": i})
+    sink.close()
+    assert sink.dropped == 7
+    assert [e["n"] for e in read_lines(tmp_path / "server.log")] == [0, 1, 2]
+
+
+def test_sink_drop_oldest_when_full(tmp_path):
+    sink = QueueLogSink(tmp_path / "server.log", queue_size=3, overflow="drop_oldest")
+    with sink.condition:
+        for i in range(10):
+            sink.put({"event": "burst", "n": i})
+    sink.close()
+    assert [e["n"] for e in read_lines(tmp_path / "server.log")] == [7, 8, 9]
+
+
+def test_sink_never_blocks_the_caller(tmp_path):
+    with pytest.raises(ValueError, match="Unknown log overflow policy"):
+        QueueLogSink(tmp_path / "server.log", overflow="block")
+    sink = QueueLogSink(tmp_path / "server.log")
+    sink.close()
+    sink.put({"event": "after_close"})
+    assert sink.dropped == 1
+
+
+def test_dropped_count_survives_shutdown(tmp_path, monkeypatch):
+    sink = QueueLogSink(tmp_path / "server.log", queue_size=1)
+    monkeypatch.setattr(logging_conf, "_sink", sink)
+    monkeypatch.setattr(logging_conf, "_closed_sinks", [])
+    with sink.condition:
+        sink.put({"event": "kept"})
+        sink.put({"event": "dropped"})
+    assert logging_conf.dropped_log_events() == 1
+    logging_conf.shutdown_logging()
+    assert logging_conf.dropped_log_events() == 1
+    sink.put({"event": "after_shutdown"})
+    assert logging_conf.dropped_log_events() == 2
@@ -1,3 +1,5 @@
+import os
+import time
 import subprocess
 
 
@@ -197,6 +199,69 @@ def test_case21():
     run_test(["./build/app.exe", "--float"], "(3 * 2) / +4", 1)
 
 
+def test_case22():
+    # 22. Режим сервиса: по одной строке результата на каждое выражение, ошибки не прерывают поток
+    res = subprocess.run(
+        ["./build/app.exe", "--serve"],
+        input="1 + 2\n10 / 0\nabc\n2 * (3 + 4)\n",
+        text=True,
+        capture_output=True,
+    )
+    assert res.returncode == 0
+    assert res.stdout.splitlines() == [
+        "3",
+        "error 5 Division by zero",
+        "error 0 Invalid character",
+        "14",
+    ]
+
+
+def test_case23():
+    # 23. Режим сервиса вместе с --float
+    res = subprocess.run(["./build/app.exe", "--serve", "--float"], input="3 / 2\n", text=True, capture_output=True)
+    assert res.returncode == 0
+    assert round(float(res.stdout.strip()), 4) == 1.5
+
+
+def test_case24():
+    # 24. Выражения длиннее прежнего буфера в 1 КБ, в том числе разбитые на много строк
+    run_test(["./build/app.exe"], "9 / 3 - 2 + " * 100000 + "0", 0, "100000")
+    run_test(["./build/app.exe"], "1 +\n" * 5000 + "1", 0, "5001")
+
+
+def test_case25():
+    # 25. Десятки тысяч вложенных скобок: результат или понятная ошибка вместо переполнения стека
+    depth = 50000
+    run_test(["./build/app.exe"], "(" * depth + "1" + " + 1)" * depth, 0, str(depth + 1))
+    res = subprocess.run(["./build/app.exe", "--serve", "--max-depth", "100"],
+                         input="(" * 101 + "1" + ")" * 101 + "\n", text=True, capture_output=True)
+    assert res.stdout.strip() == "error 100 Parentheses nested too deeply"
+
+
+def test_case26():
+    # 26. Выражение в 64 МБ, поданное потоком: верный результат, разумные время и пиковая память
+    term = "9 / 3 - 2 + "
+    terms = 64 * 1024 * 1024 // len(term)
+    chunk = (term * 10000).encode()
+    start = time.monotonic()
+    proc = subprocess.Popen(["./build/app.exe"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    for _ in range(terms // 10000):
+        proc.stdin.write(chunk)
+    proc.stdin.write((term * (terms % 10000) + "0").encode())
+    proc.stdin.close()
+    output = proc.stdout.read()
+    # wait4 – чтобы получить ru_maxrss именно этого процесса
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.monotonic() - start
+
+    assert proc.returncode == 0
+    assert output.decode().strip() == str(terms)
+    assert elapsed < 60, f"64 MB expression took {elapsed:.1f} s"
+    # ru_maxrss в КБ (Linux): вход хранится целиком, но не должен копироваться многократно
+    assert usage.ru_maxrss < 4 * 64 * 1024, f"Peak RSS {usage.ru_maxrss} KB"
+
+
 def run_all_tests():
     tests = [
         test_case1,
@@ -219,7 +284,12 @@ def run_all_tests():
         test_case18,
         test_case19,
         test_case20,
-        test_case21
+        test_case21,
+        test_case22,
+        test_case23,
+        test_case24,
+        test_case25,
+        test_case26
     ]
     for test in tests:
         test()
@@ -0,0 +1,59 @@
+# tests/integration/test_metrics.py
+
+from server.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_with_labels():
+    registry = Registry()
+    errors = registry.register(Counter("errors_total", "Errors", ["cause"]))
+    errors.labels(cause="db").inc()
+    errors.labels(cause="db").inc(2)
+    errors.labels(cause="validation").inc()
+
+    text = registry.render()
+    assert "# TYPE errors_total counter" in text
+    assert 'errors_total{cause="db"} 3' in text
+    assert 'errors_total{cause="validation"} 1' in text
+
+
+def test_gauge_function():
+    registry = Registry()
+    gauge = registry.register(Gauge("clients", "Clients"))
+    clients = [1, 2, 3]
+    gauge.set_function(lambda: len(clients))
+    assert "clients 3" in registry.render()
+    clients.pop()
+    assert "clients 2" in registry.render()
+
+
+def test_counter_function():
+    registry = Registry()
+    hits = registry.register(Counter("hits_total", "Hits"))
+    stats = {"hits": 5}
+    hits.set_function(lambda: stats["hits"])
+    assert "# TYPE hits_total counter" in registry.render()
+    assert "hits_total 5" in registry.render()
+    stats["hits"] += 1
+    assert "hits_total 6" in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_count 4" in lines
+    assert "latency_seconds_sum 6.05" in lines
+
+
+def test_histogram_timer():
+    registry = Registry()
+    latency = registry.register(Histogram("stage_seconds", "Stage", ["stage"]))
+    with latency.labels(stage="parse").time():
+        pass
+    assert 'stage_seconds_count{stage="parse"} 1' in registry.render()
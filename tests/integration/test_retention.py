@@ -0,0 +1,116 @@
+# tests/integration/test_retention.py
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from server import database, retention
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Временная БД history.db для каждого теста."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "history.db"))
+    database.init_db()
+    yield database.DB_PATH
+    database.stop_writer()
+
+
+def insert(path, count, start=None):
+    start = start or datetime.now()
+    with sqlite3.connect(path) as conn:
+        database.insert_records(conn, (
+            (f"{i} + 0", str(i), i % 2 == 1, (start + timedelta(minutes=i)).isoformat()) for i in range(count)
+        ))
+
+
+def history_ids(path):
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM history ORDER BY id")]
+
+
+def archived(path, archive_dir, since=None, until=None):
+    with sqlite3.connect(path) as conn:
+        segments = retention.fetch_segments(conn, since, until)
+    return [row for rows in retention.iter_archive(segments, since, until, archive_dir) for row in rows]
+
+
+def worker(db, tmp_path, **kwargs):
+    kwargs.setdefault("batch_size", 4)
+    return retention.RetentionWorker(db, str(tmp_path / "archive"), batch_pause=0, vacuum_interval=0, **kwargs)
+
+
+def test_max_rows(db, tmp_path):
+    """
+    Сверх max_rows последних записи переносятся в архив пачками, с исходными id и полями.
+    """
+    insert(db, 25)
+    assert worker(db, tmp_path, max_rows=10).run_once() == 15
+    assert history_ids(db) == list(range(16, 26))
+
+    rows = archived(db, str(tmp_path / "archive"))
+    assert [row[0] for row in rows] == list(range(1, 16))
+    assert rows[1][1:4] == ("1 + 0", "1", True)
+    with sqlite3.connect(db) as conn:
+        assert retention.archive_stats(conn)["records"] == 15
+
+
+def test_max_age_and_archive_query(db, tmp_path):
+    old = datetime.now() - timedelta(days=30)
+    insert(db, 6, start=old)
+    insert(db, 3)
+    retention_worker = worker(db, tmp_path, max_age_days=7)
+    assert retention_worker.run_once() == 6
+    assert retention_worker.run_once() == 0
+    assert history_ids(db) == [7, 8, 9]
+
+    since = (old + timedelta(minutes=2)).isoformat()
+    until = (old + timedelta(minutes=4)).isoformat()
+    assert [row[0] for row in archived(db, str(tmp_path / "archive"), since, until)] == [3, 4]
+    # Второй проход без записей не создаёт пустых сегментов
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM history_archive").fetchone()[0] == 1
+
+
+def test_unconfirmed_tail_is_truncated(db, tmp_path):
+    """
+    Хвост файла сегмента, не подтверждённый транзакцией (сбой между записью файла и удалением), отрезается.
+    """
+    insert(db, 10)
+    retention_worker = worker(db, tmp_path, max_rows=5)
+    retention_worker.run_once()
+    with sqlite3.connect(db) as conn:
+        name, size = conn.execute("SELECT file, bytes FROM history_archive").fetchone()
+    path = tmp_path / "archive" / name
+    with open(path, "ab") as f:
+        f.write(b"\x05\x00\x00\x00garbage")
+
+    assert len(archived(db, str(tmp_path / "archive"))) == 5
+    retention_worker.run_once()
+    assert path.stat().st_size == size
+
+
+def test_compaction(db, tmp_path):
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2  # INCREMENTAL
+    insert(db, 5000)
+    worker(db, tmp_path, max_rows=10, batch_size=1000).run_once()
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_vacuum_converts_old_database(tmp_path, monkeypatch):
+    """Старая БД (без auto_vacuum) переводится в INCREMENTAL плановым VACUUM."""
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, expression TEXT NOT NULL, "
+                     "result TEXT NOT NULL, float_mode BOOLEAN NOT NULL, ts TEXT NOT NULL)")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    retention_worker = retention.RetentionWorker(path, str(tmp_path / "archive"), batch_pause=0,
+                                                 vacuum_interval=1e-9)
+    retention_worker.run_once()
+    assert retention_worker.vacuums == 1
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
@@ -0,0 +1,114 @@
+# tests/integration/test_search.py
+
+import io
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from server import database, retention, search, transfer
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Временная БД history.db для каждого теста."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "history.db"))
+    database.init_db()
+    yield database.DB_PATH
+    database.stop_writer()
+
+
+START = datetime(2024, 1, 1)
+
+
+def write(records):
+    """Записи (expression, result) через фоновый писатель, с ts через минуту друг от друга."""
+    writer = database.start_writer(db_path=database.DB_PATH)
+    for i, (expression, result) in enumerate(records):
+        writer.put([(expression, result, False, (START + timedelta(minutes=i)).isoformat())])
+    assert writer.flush(5)
+
+
+def find(path, **kwargs):
+    with sqlite3.connect(path) as conn:
+        return [record["id"] for record in search.fetch_search_page(conn, **kwargs)]
+
+
+def test_substring_prefix_and_result(db):
+    write([("1 / 0", "error"), ("10 /  0", "error"), ("2 / 0 + 1", "error"), ("1 + 1", "2"), ("12 * 3", "36")])
+    assert find(db, query="/ 0") == [3, 1]
+    assert find(db, query="/") == [3, 2, 1]
+    assert find(db, prefix="1") == [5, 4, 2, 1]
+    assert find(db, prefix="1", query="/ 0") == [1]
+    assert find(db, result="error", since=(START + timedelta(minutes=1)).isoformat()) == [3, 2]
+    # Символы шаблона LIKE ищутся буквально
+    assert find(db, query="%") == []
+
+
+def test_pagination(db):
+    write([(f"{i} / 0", "error") for i in range(10)] + [("1 + 1", "2")])
+    pages = []
+    cursor = None
+    while True:
+        page = find(db, query="/ 0", cursor=cursor, limit=4)
+        pages.append(page)
+        if len(page) < 4:
+            break
+        cursor = page[-1]
+    assert pages == [[10, 9, 8, 7], [6, 5, 4, 3], [2, 1]]
+
+
+def test_index_follows_import_and_retention(db, tmp_path):
+    """Полнотекстовый индекс пополняется при импорте; записи, перенесённые в архив, не находятся."""
+    write([("1 / 0", "error")])
+    line = b'{"expression": "5 / 0", "result": "error", "timestamp": "2024-01-02T00:00:00"}\n'
+    transfer.import_history(io.BytesIO(line), db_path=db)
+    assert find(db, query="/ 0") == [2, 1]
+
+    worker = retention.RetentionWorker(db, str(tmp_path / "archive"), max_rows=1, batch_pause=0, vacuum_interval=0)
+    assert worker.run_once() == 1
+    assert find(db, query="/ 0") == [2]
+    with sqlite3.connect(db) as conn:
+        # Индекс внешнего содержимого совпадает с expressions (иначе – sqlite3.DatabaseError)
+        conn.execute("INSERT INTO expressions_fts(expressions_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_existing_database_is_indexed(tmp_path, monkeypatch):
+    """БД без индекса (созданная до поиска) индексируется при init_db; rebuild пересоздаёт индекс."""
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, expression TEXT NOT NULL, "
+                     "result TEXT NOT NULL, float_mode BOOLEAN NOT NULL, ts TEXT NOT NULL)")
+        conn.executemany("INSERT INTO history (expression, result, float_mode, ts) VALUES (?, ?, ?, ?)",
+                         [("7 / 0", "error", False, START.isoformat()), ("7 + 0", "7", False, START.isoformat())])
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    assert find(path, query="7 / ") == [1]
+
+    search.main(["--db", path, "rebuild"])
+    assert find(path, query="7 / ") == [1]
+    assert find(path, query="+ 0") == [2]
+
+
+def test_rebuild_keeps_index_for_running_writer(db, monkeypatch):
+    """rebuild при открытой сервером БД: индекс не удаляется, писатель продолжает индексировать выражения."""
+    writer = database.start_writer()
+    database.add_record("1 / 0", "error", False)
+    assert database.flush_writes(timeout=5)
+
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sqlite3, "connect", traced_connect)
+        search.main(["--db", db, "rebuild"])
+    assert not [s for s in statements if s.lstrip().upper().startswith("DROP")]
+    database.add_record("2 / 0", "error", False)
+    assert database.flush_writes(timeout=5)
+    assert writer.dropped == 0
+    assert len(find(db, query="/ 0")) == 2
@@ -1,23 +1,55 @@
 # tests/integration/test_server.py
 
 import subprocess
+import sys
 import time
 import requests
 import json
 import pytest
 import os
 
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Сколько ждать, пока сервер начнёт отвечать, секунд
+SERVER_START_TIMEOUT = 30
+
+
 @pytest.fixture(scope="module")
-def server_proc():
+def server_proc(tmp_path_factory):
     """
     Фикстура для запуска и остановки Python-сервера.
-    Запускает сервер в фоновом процессе, даёт ему 1 сек. подняться,
-    затем по окончании тестов завершает процесс.
+    Запускает uvicorn в фоновом процессе из временного каталога (там появятся history.db и build/server.log;
+    build/app.exe и build/libcalc.so – ссылки на собранные в репозитории), ждёт, пока сервер начнёт
+    отвечать, затем по окончании тестов завершает процесс.
     """
-    python_bin = os.path.join("build", "venv", "bin", "python")
-    cmd = [python_bin, "server/server.py"]
-    proc = subprocess.Popen(cmd)
-    time.sleep(1)  # Небольшая пауза для инициализации
+    try:
+        requests.get("http://localhost:8000/metrics", timeout=1)
+    except requests.exceptions.ConnectionError:
+        pass
+    else:
+        pytest.fail("Port 8000 is already in use: stop the running server first")
+
+    workdir = tmp_path_factory.mktemp("server")
+    (workdir / "build").mkdir()
+    for name in ("app.exe", "libcalc.so"):
+        os.symlink(os.path.join(ROOT, "build", name), workdir / "build" / name)
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "server")]))
+    cmd = [sys.executable, "-m", "uvicorn", "server.server:app", "--host", "127.0.0.1", "--port", "8000"]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env)
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        if proc.poll() is not None:
+            pytest.fail(f"Server exited with code {proc.returncode}")
+        try:
+            requests.get("http://localhost:8000/metrics", timeout=1)
+            break
+        except requests.exceptions.ConnectionError:
+            if time.monotonic() > deadline:
+                proc.kill()
+                pytest.fail("Server did not start in time")
+            time.sleep(0.1)
 
     yield proc
 
@@ -182,3 +214,322 @@ def test_calc_weird_chars(server_proc):
     assert status == 500, f"Expected 500, got {status}"
     assert jdata is not None
     assert "error" in jdata, "Expected 'error' field in the response"
+
+def test_calc_cache_hit(server_proc):
+    """
+    Выражения, отличающиеся только пробелами, обслуживаются из кэша.
+    """
+    before = requests.get("http://localhost:8000/cache/stats").json()
+    status, jdata, _ = post_calc("40 + 2")
+    assert status == 200 and jdata == "42"
+    status, jdata, _ = post_calc("40+2")
+    assert status == 200 and jdata == "42"
+    after = requests.get("http://localhost:8000/cache/stats").json()
+    assert after["hits"] >= before["hits"] + 1
+
+def test_calc_cache_bypass(server_proc):
+    """
+    ?cache=false вычисляет выражение заново, не обращаясь к кэшу.
+    """
+    before = requests.get("http://localhost:8000/cache/stats").json()
+    resp = requests.post("http://localhost:8000/calc?cache=false", data=json.dumps("40 + 2"),
+                         headers={"Content-Type": "application/json"})
+    assert resp.status_code == 200 and resp.json() == "42"
+    after = requests.get("http://localhost:8000/cache/stats").json()
+    assert after["hits"] == before["hits"]
+
+def test_calc_batch(server_proc):
+    """
+    POST /calc/batch: результаты и ошибки по элементам в исходном порядке, ошибка не прерывает пакет.
+    """
+    items = ["1 + 2", {"expression": "3 / 2", "float": True}, "10 / 0", 42, "2 * (3 + 4)",
+             {"expression": "3 / 2", "float": "false"}]
+    resp = requests.post("http://localhost:8000/calc/batch", data=json.dumps(items),
+                         headers={"Content-Type": "application/json"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data) == len(items)
+    assert data[0]["result"] == "3"
+    assert abs(float(data[1]["result"]) - 1.5) < 1e-9
+    assert "error" in data[2]
+    assert "error" in data[3]
+    assert data[4]["result"] == "14"
+    assert data[5] == {"expression": "3 / 2", "error": "'float' must be a boolean"}
+
+def test_calc_batch_not_array(server_proc):
+    """
+    Тело пакетного запроса должно быть JSON-массивом.
+    """
+    resp = requests.post("http://localhost:8000/calc/batch", data=json.dumps("1 + 2"),
+                         headers={"Content-Type": "application/json"})
+    assert resp.status_code == 400
+
+def test_calc_stream(server_proc):
+    """
+    POST /calc/stream: NDJSON на входе и на выходе, порядок строк сохраняется.
+    """
+    lines = ['"1 + 2"', '{"expression": "3 / 2", "float": true}', '"10 / 0"', 'not json', '"6 * 7"']
+
+    def body():
+        for line in lines:
+            yield (line + "\n").encode()
+
+    resp = requests.post("http://localhost:8000/calc/stream", data=body(),
+                         headers={"Content-Type": "application/x-ndjson"}, stream=True)
+    assert resp.status_code == 200
+    out = [json.loads(line) for line in resp.iter_lines() if line]
+    assert [item["line"] for item in out] == [1, 2, 3, 4, 5]
+    assert out[0]["result"] == "3"
+    assert abs(float(out[1]["result"]) - 1.5) < 1e-9
+    assert "error" in out[2] and "error" in out[3]
+    assert out[4]["result"] == "42"
+
+def test_history_pagination(server_proc):
+    """
+    GET /history: keyset-пагинация по id в обе стороны.
+    """
+    post_calc("100 + 1")
+    post_calc("100 + 2")
+    time.sleep(0.2)  # История пишется фоновым писателем пачками
+
+    resp = requests.get("http://localhost:8000/history", params={"limit": 1, "direction": "backward"})
+    assert resp.status_code == 200
+    page = resp.json()
+    assert page["records"][0]["expression"] == "100 + 2"
+    assert page["next_cursor"] == page["records"][0]["id"]
+
+    resp = requests.get("http://localhost:8000/history",
+                        params={"limit": 1, "direction": "backward", "cursor": page["next_cursor"]})
+    assert resp.json()["records"][0]["expression"] == "100 + 1"
+
+    resp = requests.get("http://localhost:8000/history", params={"limit": 1000000})
+    assert resp.status_code == 400
+
+def test_ws_resume_since(server_proc):
+    """
+    WebSocket с ?since=<id> получает только пропущенные записи, каждая рассылка несёт id.
+    """
+    from websockets.sync.client import connect
+
+    with connect("ws://localhost:8000/ws") as ws:
+        snapshot = json.loads(ws.recv())
+        assert "history" in snapshot
+        last_id = snapshot["history"][-1]["id"] if snapshot["history"] else 0
+
+        post_calc("500 + 1")
+        pushed = json.loads(ws.recv(timeout=5))
+        assert pushed["expression"] == "500 + 1"
+        assert pushed["id"] > last_id
+
+    post_calc("500 + 2")
+    with connect(f"ws://localhost:8000/ws?since={pushed['id']}") as ws:
+        delta = json.loads(ws.recv(timeout=5))
+        assert delta["since"] == pushed["id"]
+        assert delta["truncated"] is False
+        assert [r["expression"] for r in delta["history"]] == ["500 + 2"]
+
+def test_ws_calc_pipelined(server_proc):
+    """
+    Вычисления по WebSocket: несколько запросов подряд без ожидания, ответы – по id корреляции,
+    ошибка одного не мешает остальным, результат рассылается как после POST /calc.
+    """
+    from websockets.sync.client import connect
+
+    with connect("ws://localhost:8000/ws") as ws:
+        json.loads(ws.recv(timeout=5))  # снимок истории
+        requests_sent = {1: ("600 + 1", False), 2: ("1 / 0", False), 3: ("7 / 2", True)}
+        for correlation_id, (expression, use_float) in requests_sent.items():
+            ws.send(json.dumps({"type": "calc", "id": correlation_id, "expression": expression, "float": use_float}))
+        ws.send("not json")
+
+        replies, pushed = {}, []
+        while len(replies) < 3 or len(pushed) < 2:
+            message = json.loads(ws.recv(timeout=5))
+            if message.get("type") in ("calc_result", "calc_error"):
+                replies[message["id"]] = message
+            elif message.get("type") == "error":
+                assert "Invalid JSON" in message["error"]
+            else:
+                pushed.append(message["expression"])
+
+    assert replies[1]["result"] == "601"
+    assert replies[2]["type"] == "calc_error" and "Division by zero" in replies[2]["error"]
+    assert replies[3]["result"] == "3.500000"
+    assert sorted(pushed) == ["600 + 1", "7 / 2"]
+
+def test_ws_calc_idempotent_with_session(server_proc):
+    """
+    С ?session= повтор calc с тем же id (после переподключения) не создаёт второй записи истории;
+    timestamp из сообщения становится временем записи.
+    """
+    from websockets.sync.client import connect
+
+    def calc(ws, message):
+        ws.send(json.dumps(message))
+        while True:
+            reply = json.loads(ws.recv(timeout=5))
+            if reply.get("type") in ("calc_result", "calc_error"):
+                return reply
+
+    message = {"type": "calc", "id": 1, "expression": "800 + 1", "timestamp": "2020-01-02T03:04:05"}
+    with connect("ws://localhost:8000/ws?session=test-idempotent") as ws:
+        first = calc(ws, message)
+        assert calc(ws, dict(message, id=2, timestamp="yesterday"))["type"] == "calc_error"
+    with connect("ws://localhost:8000/ws?session=test-idempotent") as ws:
+        again = calc(ws, message)
+    with connect("ws://localhost:8000/ws?session=other") as ws:
+        other = calc(ws, dict(message, timestamp=None))
+    assert first["result"] == again["result"] == "801"
+    assert again["record_id"] == first["record_id"]
+    assert other["record_id"] != first["record_id"]
+
+    time.sleep(0.2)
+    resp = requests.get("http://localhost:8000/history/search", params={"q": "800 + 1"})
+    records = resp.json()["records"]
+    assert [r["id"] for r in records] == [other["record_id"], first["record_id"]]
+    assert records[1]["timestamp"] == "2020-01-02T03:04:05"
+
+def test_ws_deflate_only_when_offered(server_proc):
+    """
+    permessage-deflate включается, только если клиент его предлагает; клиент без расширения
+    (как QWebSocket в GUI) получает несжатые кадры.
+    """
+    from websockets.sync.client import connect
+
+    with connect("ws://localhost:8000/ws?encoding=binary") as ws:
+        assert "permessage-deflate" in ws.response.headers.get("Sec-WebSocket-Extensions", "")
+    with connect("ws://localhost:8000/ws?encoding=binary", compression=None) as ws:
+        assert "Sec-WebSocket-Extensions" not in ws.response.headers
+        assert isinstance(ws.recv(timeout=5), bytes)
+
+
+def test_ws_binary_encoding(server_proc):
+    """
+    ?encoding=binary: история и рассылка – двоичные кадры wire, записи склеиваются в кадры,
+    соединение сжимается permessage-deflate; неизвестная кодировка отклоняется.
+    """
+    from websockets.sync.client import connect
+    from server import wire
+
+    with connect("ws://localhost:8000/ws?encoding=binary") as ws:
+        assert "permessage-deflate" in ws.response.headers.get("Sec-WebSocket-Extensions", "")
+        snapshot = wire.decode_frame(ws.recv(timeout=5))
+        assert snapshot["truncated"] in (True, False) and "history" in snapshot
+
+        resp = requests.post("http://localhost:8000/calc/batch", json=["700 + 1", "700 + 2"])
+        assert resp.status_code == 200
+        post_calc("700 + 3")
+        pushed = []
+        while len(pushed) < 3:
+            frame = ws.recv(timeout=5)
+            assert isinstance(frame, bytes)
+            pushed += wire.decode_frame(frame)["records"]
+        assert [r["expression"] for r in pushed] == ["700 + 1", "700 + 2", "700 + 3"]
+        assert pushed[0]["result"] == "701"
+
+        # Ответы на calc остаются JSON
+        ws.send(json.dumps({"type": "calc", "id": 1, "expression": "700 + 4"}))
+        while True:
+            message = ws.recv(timeout=5)
+            if isinstance(message, str):
+                assert json.loads(message)["result"] == "704"
+                break
+
+    with pytest.raises(Exception):
+        with connect("ws://localhost:8000/ws?encoding=xml") as ws:
+            ws.recv(timeout=5)
+
+def test_metrics(server_proc):
+    """
+    GET /metrics: текстовый формат Prometheus со стадиями запроса и ошибками по причинам.
+    """
+    post_calc("7 * 6")
+    post_calc("1 / 0")
+    resp = requests.get("http://localhost:8000/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+    assert "# TYPE calc_stage_seconds histogram" in text
+    assert 'calc_stage_seconds_count{stage="parse"}' in text
+    assert 'calc_stage_seconds_bucket{stage="evaluate",le="+Inf"}' in text
+    assert "# TYPE calc_cache_hits_total counter" in text
+    assert 'calc_errors_total{cause="expression"}' in text
+    assert 'calc_requests_total{endpoint="/calc"}' in text
+    assert "calc_ws_connected_clients" in text
+
+def test_calc_vector(server_proc):
+    """
+    POST /calc/vector: одно выражение над столбцами, ошибки – по строкам.
+    """
+    pytest.importorskip("numpy")
+    payload = {"expression": "(a + b) * 2 - c / d", "columns": {"a": [1, 2], "b": [1, 1], "c": [7, 7], "d": [2, 0]}}
+    resp = requests.post("http://localhost:8000/calc/vector", data=json.dumps(payload),
+                         headers={"Content-Type": "application/json"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["rows"] == 2
+    assert data["results"] == [1, None]
+    assert data["errors"] == [{"row": 1, "error": "Division by zero at position 18"}]
+
+    resp = requests.post("http://localhost:8000/calc/vector", params={"expression": "a * b", "float": "true"},
+                         data="a,b\n1,2\n3,0.5\n", headers={"Content-Type": "text/csv"})
+    assert resp.json()["results"] == [2.0, 1.5]
+
+def test_history_export_import(server_proc):
+    """
+    GET /history/export выгружает историю потоком, POST /history/import загружает её обратно с новыми id.
+    """
+    post_calc("40 + 2")
+    time.sleep(0.2)  # История пишется фоновым писателем пачками
+
+    ndjson = requests.get("http://localhost:8000/history/export", params={"format": "ndjson"}).text
+    last = json.loads(ndjson.splitlines()[-1])
+    assert last["expression"] == "40 + 2" and last["result"] == "42"
+
+    since = "2000-01-01T00:00:00"
+    resp = requests.get("http://localhost:8000/history/export", params={"format": "columnar", "since": since})
+    assert resp.status_code == 200
+    assert resp.content.startswith(b"CALCHIST1\n")
+
+    resp = requests.post("http://localhost:8000/history/import", params={"format": "columnar"},
+                         data=resp.content, headers={"Content-Type": "application/octet-stream"})
+    assert resp.status_code == 200
+    assert resp.json()["imported"] == len(ndjson.splitlines())
+
+    resp = requests.post("http://localhost:8000/history/import", data=b'{"expression": "1"}\n')
+    assert resp.status_code == 400
+    assert resp.json()["imported"] == 0
+
+def test_history_retention(server_proc):
+    """
+    Без политики хранения архив пуст, а /history/archive отдаёт пустую выгрузку.
+    """
+    resp = requests.get("http://localhost:8000/history/retention")
+    assert resp.status_code == 200
+    assert resp.json()["archive"] == {"segments": 0, "records": 0, "bytes": 0}
+
+    resp = requests.get("http://localhost:8000/history/archive", params={"format": "csv"})
+    assert resp.status_code == 200
+    assert resp.text == "id,expression,result,float_mode,timestamp\n"
+
+def test_history_search(server_proc):
+    """Поиск подстроки с пагинацией по next_cursor и поиск по префиксу и результату."""
+    for expression in ("10 / 5", "20 / 5", "3 + 0"):
+        requests.post("http://localhost:8000/calc", json=expression)
+    time.sleep(0.2)
+
+    params = {"q": "0 / 5", "limit": 1}
+    resp = requests.get("http://localhost:8000/history/search", params=params)
+    assert resp.status_code == 200
+    first = resp.json()
+    assert [r["expression"] for r in first["records"]] == ["20 / 5"]
+
+    resp = requests.get("http://localhost:8000/history/search", params={**params, "cursor": first["next_cursor"]})
+    assert [r["expression"] for r in resp.json()["records"]] == ["10 / 5"]
+
+    resp = requests.get("http://localhost:8000/history/search", params={"prefix": "3", "result": "3"})
+    assert [r["expression"] for r in resp.json()["records"]] == ["3 + 0"]
+    assert resp.json()["next_cursor"] is None
+
+    resp = requests.get("http://localhost:8000/history/search", params={"q": "/", "since": "yesterday"})
+    assert resp.status_code == 400
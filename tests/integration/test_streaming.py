@@ -0,0 +1,59 @@
+# tests/integration/test_streaming.py
+
+import asyncio
+
+import pytest
+
+from server.streaming import iter_lines, ordered_window, parse_calc_item, parse_item, LineTooLong
+
+
+async def chunks_of(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(agen):
+    return [item async for item in agen]
+
+
+def test_iter_lines_across_chunks():
+    lines = asyncio.run(collect(iter_lines(chunks_of(b'"1 +', b' 2"\n"3"\n', b'"4"'))))
+    assert lines == [b'"1 + 2"', b'"3"', b'"4"']
+
+
+def test_iter_lines_too_long_line_is_skipped():
+    lines = asyncio.run(collect(iter_lines(chunks_of(b"12345", b"6789\nok\n"), max_line_bytes=4)))
+    assert isinstance(lines[0], LineTooLong)
+    assert lines[1:] == [b"ok"]
+
+
+def test_ordered_window_keeps_order_and_bound():
+    state = {"running": 0, "max_running": 0}
+
+    async def process(i):
+        state["running"] += 1
+        state["max_running"] = max(state["max_running"], state["running"])
+        # Более ранние элементы завершаются позже – порядок ответа всё равно исходный
+        await asyncio.sleep(0.001 * (10 - i % 10))
+        state["running"] -= 1
+        return i
+
+    async def items():
+        for i in range(100):
+            yield i
+
+    results = asyncio.run(collect(ordered_window(items(), process, max_in_flight=8)))
+    assert results == list(range(100))
+    assert state["max_running"] <= 8
+
+
+def test_parse_item_requires_json_bool():
+    assert parse_item(b'"1 + 2"', True) == ("1 + 2", True)
+    assert parse_item(b'{"expression": "1", "float": false}', True) == ("1", False)
+    assert parse_calc_item({"expression": "1"}, True) == ("1", True)
+    for item in ({"expression": "1", "float": "false"}, {"expression": "1", "float": 0},
+                 {"expression": "1", "float": None}):
+        with pytest.raises(ValueError, match="boolean"):
+            parse_calc_item(item, False)
+    with pytest.raises(ValueError, match="string"):
+        parse_calc_item({"expression": 5}, False)
@@ -0,0 +1,142 @@
+# tests/integration/test_transfer.py
+
+import io
+import sqlite3
+
+import pytest
+
+from server import database, transfer
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Временная БД history.db для каждого теста."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "history.db"))
+    database.init_db()
+    yield database.DB_PATH
+    database.stop_writer()
+
+
+RECORDS = [
+    ("1 + 2", "3", False, "2024-01-01T10:00:00"),
+    ('"quoted", with comma', "0", True, "2024-01-02T10:00:00"),
+    ("1 +\n2 \0 юникод", "3.000000", True, "2024-01-03T10:00:00"),
+    ("7 * 6", "42", False, "2024-01-04T10:00:00.123456"),
+]
+
+
+def insert(path, records):
+    with sqlite3.connect(path) as conn:
+        database.insert_records(conn, records)
+
+
+def read_records(path):
+    with sqlite3.connect(path) as conn:
+        return [(e, r, bool(f), t) for _, e, r, f, t in database.fetch_history_rows(conn)]
+
+
+@pytest.mark.parametrize("fmt", transfer.FORMATS)
+def test_round_trip(db, tmp_path, fmt):
+    """
+    Выгрузка и загрузка сохраняют записи и их порядок, в том числе кавычки, переводы строк и "\\0";
+    вход подаётся кусками по одному байту, выгрузка идёт порциями по 3 записи.
+    """
+    insert(db, RECORDS)
+    out = io.BytesIO()
+    assert transfer.export_history(out, fmt, chunk_rows=3) == 4
+
+    target = str(tmp_path / "copy.db")
+    database.DB_PATH = target
+    database.init_db()
+    with transfer.HistoryImporter(fmt, target, transaction_rows=3) as importer:
+        for i in range(len(out.getvalue())):
+            importer.feed(out.getvalue()[i:i + 1])
+        importer.finish()
+    assert importer.imported == 4
+    assert read_records(target) == RECORDS
+
+
+def test_time_range(db):
+    insert(db, RECORDS)
+    out = io.BytesIO()
+    transfer.export_history(out, "csv", since="2024-01-02", until="2024-01-04")
+    lines = out.getvalue().decode().splitlines()
+    assert lines[0] == "id,expression,result,float_mode,timestamp"
+    assert lines[1] == '2,"""quoted"", with comma",0,1,2024-01-02T10:00:00'
+    assert lines[-1].endswith(",2024-01-03T10:00:00")
+
+
+def test_import_appends_and_restores_indexes(db):
+    insert(db, RECORDS[:1])
+    writer = database.start_writer()
+    data = transfer.NdjsonEncoder().encode([(100, *record) for record in RECORDS])
+    assert transfer.import_history(io.BytesIO(data), "ndjson") == 4
+    # id выданы писателем: следующая запись писателя не пересекается с загруженными
+    assert database.add_record("2 + 2", "4", False) == 6
+    assert database.flush_writes(timeout=5)
+    assert writer.dropped == 0
+
+    with sqlite3.connect(db) as conn:
+        assert [row[0] for row in conn.execute("SELECT id FROM history ORDER BY id")] == [1, 2, 3, 4, 5, 6]
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert set(database.HISTORY_INDEXES) <= indexes
+
+
+def test_import_keeps_indexes_of_serving_database(db):
+    database.start_writer()
+    with transfer.HistoryImporter("ndjson") as importer:
+        with sqlite3.connect(db) as conn:
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert set(database.HISTORY_INDEXES) <= indexes
+        importer.add(RECORDS)
+        importer.finish()
+    assert importer.imported == 4
+
+
+def test_import_refuses_database_of_running_server(db):
+    # Писатель другого процесса (здесь – не зарегистрированный через start_writer) держит блокировку БД
+    writer = database.HistoryWriter()
+    writer.start()
+    data = transfer.NdjsonEncoder().encode([(1, *RECORDS[0])])
+    try:
+        with pytest.raises(database.DatabaseBusyError):
+            transfer.import_history(io.BytesIO(data), "ndjson")
+    finally:
+        writer.stop()
+    assert transfer.import_history(io.BytesIO(data), "ndjson") == 1
+
+
+def test_cli_import_leaves_locked_database_untouched(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "history.db"))
+    source = tmp_path / "in.ndjson"
+    source.write_bytes(transfer.NdjsonEncoder().encode([(1, *RECORDS[0])]))
+    lock = database.lock_database()
+    try:
+        with pytest.raises(SystemExit) as exit_info:
+            transfer.main(["import", str(source)])
+    finally:
+        lock.close()
+    assert exit_info.value.code == 1
+    assert "in use by another writer" in capsys.readouterr().err
+    # Ни миграций, ни таблиц: БД даже не создана
+    assert not (tmp_path / "history.db").exists()
+
+
+def test_cli_import_reports_bad_input(db, tmp_path, capsys):
+    source = tmp_path / "in.ndjson"
+    source.write_bytes(b'{"expression": "1", "result": "1", "timestamp": "yesterday"}\n')
+    with pytest.raises(SystemExit) as exit_info:
+        transfer.main(["import", str(source)])
+    assert exit_info.value.code == 1
+    assert "error: Record 1: invalid timestamp" in capsys.readouterr().err
+
+
+def test_import_errors(db):
+    with pytest.raises(ValueError, match="Record 2: invalid timestamp"):
+        transfer.import_history(io.BytesIO(b'{"expression": "1", "result": "1", "timestamp": "2024-01-01"}\n'
+                                           b'{"expression": "1", "result": "1", "timestamp": "yesterday"}\n'))
+    with pytest.raises(ValueError, match="CSV header is missing: result"):
+        transfer.import_history(io.BytesIO(b"expression,float_mode,timestamp\n"), "csv")
+    with pytest.raises(ValueError, match="Truncated"):
+        data = transfer.ColumnarEncoder().header() + transfer.ColumnarEncoder().encode([(1, *RECORDS[0])])
+        transfer.import_history(io.BytesIO(data[:-3]), "columnar")
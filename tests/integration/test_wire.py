@@ -0,0 +1,24 @@
+# tests/integration/test_wire.py
+
+from server import wire
+
+RECORDS = [
+    {"id": 1, "expression": "1 + 2", "result": "3", "float_mode": False, "timestamp": "2024-05-01T10:00:00"},
+    {"id": 2, "expression": "7 / 2 // π", "result": "3.500000", "float_mode": True},
+]
+
+
+def test_records_frame_round_trip():
+    # Тела склеиваются, как при пакетной рассылке; GUI разбирает кадр той же decode_frame
+    bodies = [wire.encode_records(RECORDS[:1]), wire.encode_records(RECORDS[1:])]
+    assert wire.decode_frame(wire.records_frame(2, bodies)) == {"records": RECORDS}
+
+
+def test_history_frame_round_trip():
+    frame = wire.history_frame(RECORDS, since=41, truncated=True)
+    assert wire.decode_frame(frame) == {"history": RECORDS, "since": 41, "truncated": True}
+
+
+def test_history_frame_without_since():
+    frame = wire.history_frame([], since=None)
+    assert wire.decode_frame(frame) == {"history": [], "since": None, "truncated": False}
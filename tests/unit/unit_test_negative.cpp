@@ -68,3 +68,41 @@ TEST(ParseTermFTest, DivisionByZeroF)
     char *expr = input;
     EXPECT_EXIT({ parseTermF(&expr); }, ::testing::ExitedWithCode(1), "");
 }
+
+// evaluateInt: деление на 0 => код ошибки и смещение делителя, процесс продолжает работу
+TEST(EvaluateIntTest, DivisionByZero)
+{
+    int val = 42;
+    size_t offset = 0;
+    EXPECT_EQ(evaluateInt("10 / 0", &val, &offset), CALC_ERR_DIVISION_BY_ZERO);
+    EXPECT_EQ(offset, 5u);
+    EXPECT_EQ(val, 42); // результат не изменяется
+}
+
+// evaluateInt: недопустимый символ => смещение этого символа
+TEST(EvaluateIntTest, InvalidChar)
+{
+    size_t offset = 0;
+    EXPECT_EQ(evaluateInt("1 + a", NULL, &offset), CALC_ERR_INVALID_CHAR);
+    EXPECT_EQ(offset, 4u);
+}
+
+// evaluateFloat: незакрытая скобка и лишний ввод после выражения
+TEST(EvaluateFloatTest, SyntaxErrors)
+{
+    size_t offset = 0;
+    EXPECT_EQ(evaluateFloat("(1 + 2", NULL, &offset), CALC_ERR_MISSING_PAREN);
+    EXPECT_EQ(offset, 6u);
+    EXPECT_EQ(evaluateFloat("1 2", NULL, &offset), CALC_ERR_TRAILING_INPUT);
+    EXPECT_EQ(offset, 2u);
+    EXPECT_EQ(evaluateFloat("-1", NULL, &offset), CALC_ERR_UNARY_OPERATOR);
+}
+
+// Превышение предела вложенности – ошибка на первой лишней скобке, а не падение
+TEST(EvaluateIntTest, TooDeep)
+{
+    size_t offset = 0;
+    EXPECT_EQ(evaluateIntDepth("((((1))))", 3, NULL, &offset), CALC_ERR_TOO_DEEP);
+    EXPECT_EQ(offset, 3u);
+    EXPECT_EQ(evaluateFloatDepth("(((1)))", 3, NULL, &offset), CALC_OK);
+}
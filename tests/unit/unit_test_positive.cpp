@@ -119,3 +119,101 @@ TEST(ParseTermFTest, MultiplicationF)
     double val = parseTermF(&expr);
     EXPECT_DOUBLE_EQ(val, 6.0);
 }
+
+// evaluateInt (реентерабельное ядро): результат без завершения процесса
+TEST(EvaluateIntTest, ComplexExpression)
+{
+    int val = 0;
+    size_t offset = 0;
+    EXPECT_EQ(evaluateInt(" 2 + 3 * (7 - 1) ", &val, &offset), CALC_OK);
+    EXPECT_EQ(val, 20);
+}
+
+// evaluateFloat (реентерабельное ядро)
+TEST(EvaluateFloatTest, Division)
+{
+    double val = 0.0;
+    size_t offset = 0;
+    EXPECT_EQ(evaluateFloat("10/4", &val, &offset), CALC_OK);
+    EXPECT_DOUBLE_EQ(val, 2.5);
+}
+
+// readInput: поток читается целиком, независимо от размера (раньше – не больше 1 КБ)
+TEST(ReadInputTest, LargerThanOldBuffer)
+{
+    FILE *stream = tmpfile();
+    ASSERT_NE(stream, nullptr);
+    const int terms = 100000; // ~1 МБ
+    for (int i = 0; i < terms; i++)
+        fputs("9 / 3 - 2 + ", stream);
+    fputs("0\n", stream);
+    rewind(stream);
+
+    size_t length = 0;
+    char *input = readInput(stream, &length);
+    fclose(stream);
+    ASSERT_NE(input, nullptr);
+    EXPECT_EQ(length, strlen(input));
+    EXPECT_EQ(length, (size_t)terms * 12 + 2);
+
+    int val = 0;
+    size_t offset = 0;
+    EXPECT_EQ(evaluateInt(input, &val, &offset), CALC_OK);
+    EXPECT_EQ(val, terms);
+    free(input);
+}
+
+TEST(ReadInputTest, EmptyStream)
+{
+    FILE *stream = tmpfile();
+    ASSERT_NE(stream, nullptr);
+    size_t length = 1;
+    char *input = readInput(stream, &length);
+    fclose(stream);
+    ASSERT_NE(input, nullptr);
+    EXPECT_EQ(length, 0u);
+    EXPECT_STREQ(input, "");
+    free(input);
+}
+
+// Итеративный разбор даёт те же значения, коды и смещения ошибок, что и рекурсивный
+TEST(ParseExpressionIterTest, MatchesRecursive)
+{
+    const char *cases[] = {
+        "1 + 2",     " 2 + 3 * (7 - 1) ",     "10/4",      "((((5))))", "8 / 2 / 2", "2 * (3 + 4) * 5",
+        "7 - 3 - 2", "100 / (2 * (1 + 4))",   "(1 + 2",    "1 2",       "-1",        "()",
+        "10 / 0",    "1 + (2 * 0) / (3 - 3)", "3 * (2 + ", "(1) (2)"};
+    for (const char *expression : cases)
+    {
+        CalcParser recursive, iterative;
+        calcParserInit(&recursive, expression);
+        calcParserInit(&iterative, expression);
+        int expected = calcParseExpression(&recursive);
+        int actual = calcParseExpressionIter(&iterative);
+        EXPECT_EQ(actual, expected) << expression;
+        EXPECT_EQ(iterative.error, recursive.error) << expression;
+        EXPECT_EQ(iterative.error_offset, recursive.error_offset) << expression;
+        EXPECT_EQ(iterative.pos, recursive.pos) << expression;
+
+        calcParserInit(&recursive, expression);
+        calcParserInit(&iterative, expression);
+        double expected_f = calcParseExpressionF(&recursive);
+        double actual_f = calcParseExpressionIterF(&iterative);
+        EXPECT_DOUBLE_EQ(actual_f, expected_f) << expression;
+        EXPECT_EQ(iterative.error, recursive.error) << expression;
+        EXPECT_EQ(iterative.error_offset, recursive.error_offset) << expression;
+    }
+}
+
+// Глубина скобок не ограничена стеком вызовов C
+TEST(ParseExpressionIterTest, DeepNesting)
+{
+    const int depth = 100000;
+    std::string expression = std::string(depth, '(') + "1";
+    for (int i = 0; i < depth; i++)
+        expression += " + 1)";
+    int val = 0;
+    size_t offset = 0;
+    EXPECT_EQ(evaluateInt(expression.c_str(), &val, &offset), CALC_OK);
+    EXPECT_EQ(val, depth + 1);
+}